@@ -1,10 +1,16 @@
 import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import signal
 import sys
+import threading
+import argparse
 import logging
 import warnings
 import pytz
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 # 在导入caldav相关模块之前设置日志抑制
@@ -13,42 +19,150 @@ logging.getLogger('caldav').setLevel(logging.CRITICAL)
 logging.getLogger('root').setLevel(logging.CRITICAL)
 warnings.filterwarnings("ignore")
 
-# 抑制urllib3的OpenSSL警告
-import urllib3
-urllib3.disable_warnings()
-
-from caldav_client.client import get_upcoming_events
-from ai.analyzer import analyze_event
-from memory.database import init_db, save_event_analysis, get_events_to_remind, mark_reminded, get_stats, cleanup_old_events
-from services.notifier import send_notification, send_test_notification
+# 启动路径只导入轻量模块；CalDAV、AI 分析和 API 服务在首次使用或启用时再导入
+from memory.database import init_db, save_event_analysis, get_events_to_remind, mark_reminded, get_stats, cleanup_old_events, get_cached_analysis, save_cached_analysis, get_analysis_states, get_batched_event_keys
+from services.notifier import send_notification, send_test_notification, reset_session
 from services.heartbeat import HeartbeatSender
-from services.api_server import APIServer
-from config import CONFIG
+from services.jobs import JobManager
+from services.config_watcher import ConfigWatcher
+from config import CONFIG, validate_config
+from metrics import ANALYSIS_CACHE, ANALYSIS_DEFERRED, ANALYSIS_LOOKAHEAD, ANALYSIS_POLICY, REMINDER_LATENESS_SECONDS
+
+_IMPORT_FINISHED = time.perf_counter()
 
 # 配置常量
 INTERVAL = 600  # 每10分钟运行一次
 REMIND_CHECK_INTERVAL = 60  # 每1分钟检查一次是否需要发送提醒
 CLEANUP_INTERVAL = 3600  # 每1小时清理一次过期事件
 
+def import_fetch_pipeline():
+    """导入获取和分析日程所需的模块（caldav、icalendar、requests 等依赖较重，首次获取时才加载）"""
+    # 抑制urllib3的OpenSSL警告
+    import urllib3
+    urllib3.disable_warnings()
+    
+    from caldav_client.client import MultiCalDAVClient
+    from ai.analyzer import analyze_event
+    return MultiCalDAVClient, analyze_event
+
+def analysis_cache_key(event):
+    """重复事件的系列缓存键（非重复事件返回 None）"""
+    from ai.cache import series_cache_key
+    return series_cache_key(event)
+
+def event_content_hash(event):
+    """事件内容哈希（重新分析策略据此判断内容是否变化）"""
+    from ai.cache import content_hash
+    return content_hash(event)
+
+def run_coalesced_analysis(event, analyze):
+    """合并同时进行的同一事件分析
+    
+    Returns:
+        (analyze 的返回值, 是否共享了其他任务的结果)
+    """
+    from ai.cache import analysis_key
+    from ai.inflight import run_analysis
+    return run_analysis(analysis_key(event), analyze)
+
+def describe_llm_config(config):
+    """从配置中读取 LLM 提供商信息（与 LLMClient 的解析规则一致，但不导入客户端）"""
+    llm_config = config.get('llm')
+    if not llm_config:
+        return {'provider': config.get('model', 'gemini'), 'parameters': {}}
+    if llm_config.get('local', {}).get('enabled', False):
+        local_config = llm_config['local']
+        return {
+            'provider': 'local',
+            'model': os.path.basename(local_config.get('model_path') or '') or 'N/A',
+            'parameters': {
+                'temperature': local_config.get('temperature', 0.7),
+                'max_tokens': local_config.get('max_tokens', 1000)
+            }
+        }
+    if llm_config.get('custom', {}).get('enabled', False):
+        return {
+            'provider': 'custom',
+            'model': llm_config['custom'].get('model', 'N/A'),
+            'url': llm_config['custom'].get('url', 'N/A'),
+            'parameters': llm_config.get('parameters', {})
+        }
+    return {
+        'provider': llm_config.get('provider', 'gemini'),
+        'parameters': llm_config.get('parameters', {})
+    }
+
+class StartupProfiler:
+    """记录启动阶段各子系统的导入和初始化耗时"""
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.sections = []
+        if enabled:
+            self.sections.append(('导入: 基础模块', _IMPORT_FINISHED - _IMPORT_STARTED))
+    
+    @contextmanager
+    def section(self, name):
+        """计时一个启动阶段"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.sections.append((name, time.perf_counter() - started))
+    
+    def report(self):
+        """打印启动耗时报告"""
+        if not self.enabled:
+            return
+        total = time.perf_counter() - _IMPORT_STARTED
+        print(f"\n⏱️ 启动耗时分析:")
+        for name, seconds in self.sections:
+            print(f"  {name:<24} {seconds * 1000:>9.1f} ms")
+        print(f"  {'合计（进程启动至今）':<24} {total * 1000:>9.1f} ms")
+
 class CalendarAgent:
-    def __init__(self):
+    def __init__(self, profiler=None):
         # 配置日志级别，抑制不必要的错误信息
         self.configure_logging()
         
+        self.profiler = profiler or StartupProfiler()
+        
         self.running = True
         self.last_fetch_time = None
         self.last_remind_check = None
         self.last_cleanup_time = None  # 新增清理时间跟踪
+        self.last_lookahead_time = None
+        self.last_batch_poll_time = None
+        
+        # 后台任务管理器：API 和主循环共用，保证每种任务同时只有一个在运行
+        self.job_manager = JobManager()
+        
+        # 常驻的 CalDAV 客户端，首次获取时创建，配置热加载时按提供商更新
+        self.caldav_client = None
+        
+        # 配置热加载：文件修改或 SIGHUP 时重新读取配置
+        self.config_watcher = ConfigWatcher(CONFIG, on_reload=self.apply_config_changes)
         
         # 初始化心跳包发送器
-        self.heartbeat_sender = HeartbeatSender(CONFIG)
+        with self.profiler.section('初始化: 心跳包'):
+            self.heartbeat_sender = HeartbeatSender(CONFIG)
         
-        # 初始化API服务器
-        self.api_server = APIServer(CONFIG, calendar_agent=self, heartbeat_sender=self.heartbeat_sender)
+        # 仅在启用时导入并初始化API服务器（FastAPI/uvicorn/pydantic）
+        self.api_server = None
+        if CONFIG.get('api', {}).get('enabled', False):
+            with self.profiler.section('导入: API服务'):
+                from services.api_server import APIServer
+            with self.profiler.section('初始化: API服务'):
+                self.api_server = APIServer(CONFIG, calendar_agent=self, heartbeat_sender=self.heartbeat_sender)
         
         # 注册信号处理器，用于优雅关闭
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
+        
+        # SIGHUP 触发配置重新加载（Windows 无此信号）
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.reload_signal_handler)
     
     def configure_logging(self):
         """配置日志级别，抑制CalDAV兼容性错误"""
@@ -80,65 +194,384 @@ class CalendarAgent:
         if self.api_server:
             self.api_server.stop()
     
-    def fetch_and_analyze_events(self):
+    def reload_signal_handler(self, signum, frame):
+        """处理 SIGHUP，交由配置监视线程重新加载"""
+        print(f"\n收到信号 {signum}，重新加载配置...")
+        self.config_watcher.request_reload()
+    
+    def apply_config_changes(self, changed):
+        """根据变化的配置项只重建受影响的组件，其余组件保持运行
+        
+        Args:
+            changed: 变化的顶层配置字段列表
+        """
+        if 'caldav' in changed and self.caldav_client is not None:
+            try:
+                summary = self.caldav_client.reconfigure(CONFIG['caldav'])
+                print(f"📅 CalDAV 提供商已更新 - 新增: {summary['added']}, 变更: {summary['changed']}, "
+                      f"移除: {summary['removed']}, 保持连接: {summary['unchanged']}")
+            except ValueError as e:
+                print(f"❌ 新的 CalDAV 配置无效，继续使用原有提供商: {e}")
+        
+        if any(key in changed for key in ('llm', 'model', 'api_key')):
+            # 共享的LLM客户端会在下一次分析时按新配置重建，本地模型在后台重新预加载
+            print("🤖 LLM 配置已变化，将在下一次分析时使用新配置")
+            if 'ai.llm_client' in sys.modules:
+                self.start_local_preload()
+        
+        if any(key in changed for key in ('webhook_url', 'webhook_type', 'webhook_custom')):
+            reset_session()
+            print("🔔 通知配置已更新")
+        
+        if 'heartbeat' in changed:
+            self.heartbeat_sender.reconfigure(CONFIG)
+        
+        for key in ('database', 'api'):
+            if key in changed:
+                print(f"⚠️ {key} 配置的变化需要重启后才能生效")
+    
+    def start_local_preload(self):
+        """在后台线程中预加载并预热本地模型（llm.local.preload），与获取日程并行，首个事件无需等待模型加载"""
+        if not CONFIG.get('llm', {}).get('local', {}).get('preload', True):
+            return
+        
+        def preload():
+            from ai.llm_client import preload_local_models
+            for info in preload_local_models(CONFIG):
+                if info and 'error' in info:
+                    print(f"⚠️ {info['error']}")
+        
+        threading.Thread(target=preload, daemon=True, name="local-model-preload").start()
+    
+    def check_local_worker(self):
+        """巡检本地推理工作进程（仅在已加载 AI 模块时），进程意外退出时自动重启"""
+        llm_client_module = sys.modules.get('ai.llm_client')
+        if llm_client_module is not None:
+            llm_client_module.ensure_local_worker()
+    
+    def get_caldav_client(self):
+        """获取常驻的 CalDAV 客户端"""
+        if self.caldav_client is None:
+            MultiCalDAVClient, _ = import_fetch_pipeline()
+            self.caldav_client = MultiCalDAVClient(CONFIG['caldav'])
+        return self.caldav_client
+    
+    def run_job(self, kind, source='scheduler', wait=True):
+        """通过任务管理器运行周期任务，重复触发会合并到正在运行的任务
+        
+        Args:
+            kind: 任务类型，fetch、reminders、lookahead 或 batch
+            source: 触发来源（scheduler/api）
+            wait: 是否同步等待执行完成
+            
+        Returns:
+            (Job, created)
+        """
+        targets = {
+            'fetch': self.fetch_and_analyze_events,
+            'reminders': self.check_and_send_reminders,
+            'lookahead': self.lookahead_analyze_events,
+            'batch': self.poll_analysis_batches
+        }
+        if kind not in targets:
+            raise ValueError(f"未知的任务类型: {kind}")
+        return self.job_manager.submit(kind, targets[kind], source=source, wait=wait)
+    
+    def maybe_start_lookahead(self, current_time):
+        """距下一次常规获取足够远且没有任务在运行时，在后台启动预先分析"""
+        from ai.lookahead import LookaheadPlanner
+        planner = LookaheadPlanner(CONFIG)
+        if not planner.enabled or self.last_fetch_time is None:
+            return
+        if self.job_manager.active_job('fetch') or self.job_manager.active_job('lookahead'):
+            return
+        seconds_to_next_fetch = INTERVAL - (current_time - self.last_fetch_time).total_seconds()
+        if planner.due(self.last_lookahead_time, seconds_to_next_fetch, current_time):
+            self.run_job('lookahead', wait=False)
+    
+    def maybe_poll_batches(self, current_time):
+        """启用批量接口时，按 llm.batch.poll_interval_seconds 在后台轮询批量分析任务"""
+        from ai.batch import BatchAnalyzer
+        batch_analyzer = BatchAnalyzer(CONFIG)
+        if not batch_analyzer.enabled:
+            return
+        if (self.last_batch_poll_time is None or
+                (current_time - self.last_batch_poll_time).total_seconds() >= batch_analyzer.poll_interval_seconds):
+            self.last_batch_poll_time = current_time
+            self.run_job('batch', wait=False)
+    
+    def fetch_and_analyze_events(self, job=None):
         """获取并分析日程事件"""
         print(f"🔄 [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始获取日程...")
         
         try:
+            _, analyze_event = import_fetch_pipeline()
+            
             # 获取接下来24小时的事件
-            events = get_upcoming_events(CONFIG['caldav'])
+            events = self.get_caldav_client().get_upcoming_events()
+            if job:
+                job.update(fetched=len(events), skipped=0, analyzed=0, saved=0, failed=0, deferred=0)
             
             if not events:
                 print("📭 暂无即将到来的日程")
                 return
             
-            print(f"📅 发现 {len(events)} 个即将到来的事件")                # 分析每个事件
-            for i, event in enumerate(events, 1):
+            print(f"📅 发现 {len(events)} 个即将到来的事件")
+            
+            # 只重新分析过期的事件：新事件、内容变化、越过距开始时间的阈值或超过最长有效时间
+            from ai.policy import ReanalysisPolicy
+            selected = ReanalysisPolicy(CONFIG).select(events, get_analysis_states(events))
+            skipped = len(events) - len(selected)
+            if skipped:
+                ANALYSIS_POLICY.inc(skipped, decision='fresh')
+                print(f"🗂️ {skipped} 个事件的分析结果仍有效，本轮跳过")
+                if job:
+                    job.update(skipped=skipped)
+            
+            # 按最晚有效提醒时间排序，临近的事件先分析，超出本轮时间预算的事件推迟到下一轮
+            # 当天的 LLM 用量达到 llm.usage.daily_budget 后暂停分析
+            from ai.priority import AnalysisQueue
+            from ai.usage import UsageBudget
+            analysis_queue = AnalysisQueue(CONFIG, throttle=UsageBudget(CONFIG).exhausted)
+            reasons = {}
+            for event, reason in selected:
+                ANALYSIS_POLICY.inc(decision=reason)
+                reasons[id(event)] = reason
+                analysis_queue.push(event)
+            
+            # 分析每个事件
+            for i, event in enumerate(iter(analysis_queue.pop, None), 1):
                 calendar_info = f" (来自: {event.get('calendar_name', '未知日历')}" if event.get('calendar_name') else ""
-                print(f"  🔍 分析事件 {i}/{len(events)}: {event.get('summary', '无标题')}{calendar_info},{event.get('provider', '未知提供商')})")
+                print(f"  🔍 分析事件 {i}/{len(selected)}: {event.get('summary', '无标题')}{calendar_info},{event.get('provider', '未知提供商')})")
                 print(f"      时间: {event.get('start', '未知')}")
                 if event.get('duration_minutes'):
                     print(f"      时长: {event.get('duration_minutes')}分钟")
                 
-                # 获取当前时间
-                china_tz = pytz.timezone('Asia/Shanghai')
-                current_time = datetime.now(china_tz).strftime('%Y-%m-%d %H:%M:%S')
-                
-                # 调用AI分析，传递时间信息
-                result = analyze_event(
-                    event.get('summary', ''), 
-                    event.get('description', ''), 
-                    CONFIG,
-                    start_time=event.get('start', ''),
-                    end_time=event.get('end', ''),
-                    duration_minutes=event.get('duration_minutes'),
-                    current_time=current_time,
-                    calendar_name=event.get('calendar_name', '')
-                )
-                
-                if 'error' in result:
-                    print(f"    ❌ AI分析失败: {result['error']}")
-                    continue
-                
-                # 保存分析结果
-                if save_event_analysis(event, result):
-                    print(f"    ✅ 分析完成 - 重要: {result.get('important', False)}, 需提醒: {result.get('need_remind', False)}")
-                    print(f"     提前时间: {result.get('minutes_before_remind', False)}分钟")
+                self.analyze_and_save(event, analyze_event, job, reason=reasons.get(id(event)))
+            
+            deferred = analysis_queue.deferred()
+            if deferred:
+                ANALYSIS_DEFERRED.inc(len(deferred))
+                if analysis_queue.stop_reason == 'time':
+                    reason = "本轮分析时间预算已用完"
                 else:
-                    print(f"    ❌ 保存分析结果失败")
-                
-                # 短暂延迟，避免API调用过于频繁
-                time.sleep(1)
+                    reason = f"今日LLM用量预算已用完（{analysis_queue.stop_reason}）"
+                print(f"⏳ {reason}，{len(deferred)} 个较晚的事件推迟到下一轮（最早: {deferred[0].get('summary', '无标题')}）")
+                if job:
+                    job.update(deferred=len(deferred))
             
             self.last_fetch_time = datetime.now()
             
         except Exception as e:
             print(f"❌ 获取和分析事件时出错: {e}")
     
-    def check_and_send_reminders(self):
+    def lookahead_analyze_events(self, job=None):
+        """预先分析：在空闲时段获取更长时间范围内的事件，提前分析 24 小时之后的事件
+        
+        常规获取开始运行或当天 LLM 用量超过 analysis.lookahead.max_budget_fraction 时暂停，剩余事件留到下一次
+        """
+        from ai.lookahead import LookaheadPlanner
+        from ai.policy import ReanalysisPolicy
+        from ai.priority import AnalysisQueue
+        from ai.usage import UsageBudget
+        
+        planner = LookaheadPlanner(CONFIG)
+        self.last_lookahead_time = datetime.now()
+        print(f"🔭 [{self.last_lookahead_time.strftime('%Y-%m-%d %H:%M:%S')}] 开始预先分析未来 {planner.days} 天的日程...")
+        
+        try:
+            _, analyze_event = import_fetch_pipeline()
+            
+            events = planner.beyond_regular_window(self.get_caldav_client().get_upcoming_events(hours=planner.hours))
+            selected = ReanalysisPolicy(CONFIG).select(events, get_analysis_states(events))
+            if job:
+                job.update(fetched=len(events), skipped=len(events) - len(selected), analyzed=0, saved=0, failed=0, deferred=0)
+            if not selected:
+                print(f"📭 {len(events)} 个较远的事件均已分析")
+                return
+            
+            # 启用批量接口时整批提交，不占用实时配额
+            from ai.batch import BatchAnalyzer
+            batch_analyzer = BatchAnalyzer(CONFIG)
+            if batch_analyzer.enabled:
+                self.submit_lookahead_batch(batch_analyzer, selected, job)
+                return
+            
+            # 与常规获取相同的排序；常规任务运行时让出 LLM，留出每日预算的余量
+            busy = lambda: self.job_manager.active_job('fetch') is not None
+            analysis_queue = AnalysisQueue(CONFIG, throttle=planner.throttle(UsageBudget(CONFIG), busy))
+            reasons = {}
+            for event, reason in selected:
+                ANALYSIS_POLICY.inc(decision=reason)
+                reasons[id(event)] = reason
+                analysis_queue.push(event)
+            
+            for i, event in enumerate(iter(analysis_queue.pop, None), 1):
+                print(f"  🔍 预先分析事件 {i}/{len(selected)}: {event.get('summary', '无标题')}（{event.get('start', '未知')}）")
+                if self.analyze_and_save(event, analyze_event, job, reason=reasons.get(id(event))):
+                    ANALYSIS_LOOKAHEAD.inc(result='analyzed')
+                else:
+                    ANALYSIS_LOOKAHEAD.inc(result='failed')
+                if planner.max_events and i >= planner.max_events:
+                    break
+            
+            remaining = analysis_queue.deferred()
+            if remaining:
+                reason = {'busy': '常规获取开始运行', 'budget': '今日LLM用量已达预先分析上限',
+                          'time': '本轮分析时间预算已用完'}.get(analysis_queue.stop_reason, '已达单次分析数量上限')
+                print(f"⏸️ {reason}，{len(remaining)} 个较远的事件留到下一次预先分析")
+                if job:
+                    job.update(deferred=len(remaining))
+        
+        except Exception as e:
+            print(f"❌ 预先分析事件时出错: {e}")
+    
+    def submit_lookahead_batch(self, batch_analyzer, selected, job=None):
+        """将预先分析的事件提交到批量接口
+        
+        Args:
+            selected: 重新分析策略选出的 [(事件, 原因), ...]
+        
+        已在未结束批量任务中的事件不重复提交；只因时间推移（threshold/max_age）被选中的事件也不提交，
+        已合并的批量结果在内容变化前一直有效，不会每隔一段时间重复付费
+        """
+        from ai.policy import TIME_BASED_REASONS
+        batched = get_batched_event_keys()
+        events = []
+        for event, reason in selected:
+            if reason in TIME_BASED_REASONS:
+                continue
+            if (event.get('uid', ''), event.get('recurrence_id', '') or '') in batched:
+                continue
+            ANALYSIS_POLICY.inc(decision=reason)
+            events.append(event)
+        if not events:
+            print(f"📦 较远的事件均已在批量任务中或已有有效结果，无需提交")
+            return
+        
+        batch_id, submitted, ruled = batch_analyzer.submit(events)
+        # 规则直接得出结论的事件无需提交
+        for event, result in ruled:
+            if save_event_analysis(event, result, content_hash=event_content_hash(event)) and job:
+                job.advance('saved')
+        if batch_id:
+            print(f"📦 已提交批量分析任务 {batch_id}（{submitted} 个事件），规则直接分析 {len(ruled)} 个")
+        if job:
+            job.update(batch_id=batch_id, submitted=submitted, ruled=len(ruled))
+    
+    def poll_analysis_batches(self, job=None):
+        """轮询未结束的批量分析任务，将已完成任务的结果合并到 events 表"""
+        from ai.batch import BatchAnalyzer
+        self.last_batch_poll_time = datetime.now()
+        try:
+            counts = BatchAnalyzer(CONFIG).poll()
+            if job:
+                job.update(**counts)
+            if counts['merged'] or counts['stale'] or counts['failed']:
+                print(f"📦 批量分析结果已合并: 成功 {counts['merged']}，已过期 {counts['stale']}，失败 {counts['failed']}，"
+                      f"仍在处理的任务 {counts['pending']} 个")
+        except Exception as e:
+            print(f"❌ 轮询批量分析任务时出错: {e}")
+    
+    def analyze_and_save(self, event, analyze_event, job=None, reason=None):
+        """分析并保存单个事件（常规获取和预先分析共用）
+        
+        Args:
+            reason: 重新分析策略给出的原因（见 ReanalysisPolicy.stale_reason）
+        
+        Returns:
+            是否分析并保存成功
+        """
+        # 同一事件（或同一重复系列）正在由其他任务分析时，等待并共享其结果
+        (result, reused), shared = run_coalesced_analysis(
+            event, lambda: self.analyze_with_cache(event, analyze_event, reason))
+        if shared:
+            print(f"    🔗 共享进行中的同一事件分析结果")
+        
+        if 'error' in result:
+            print(f"    ❌ AI分析失败: {result['error']}")
+            if job:
+                job.advance('failed')
+            return False
+        
+        if job:
+            job.advance('analyzed')
+        
+        # 保存分析结果
+        saved = save_event_analysis(event, result, content_hash=event_content_hash(event))
+        if saved:
+            print(f"    ✅ 分析完成 - 重要: {result.get('important', False)}, 需提醒: {result.get('need_remind', False)}")
+            print(f"     提前时间: {result.get('minutes_before_remind', False)}分钟")
+            if job:
+                job.advance('saved')
+        else:
+            print(f"    ❌ 保存分析结果失败")
+            if job:
+                job.advance('failed')
+        
+        # 短暂延迟，避免API调用过于频繁（复用或共享结果时没有调用API）
+        if not reused and not shared:
+            time.sleep(1)
+        return saved
+    
+    def analyze_with_cache(self, event, analyze_event, reason=None):
+        """分析单个事件，重复事件的各次发生复用系列的分析结果
+        
+        因时间推移（threshold/max_age）重新分析时不读取系列缓存和相似标题缓存，而是重新调用 LLM 并刷新缓存，
+        否则缓存键不含时间，总是返回旧结果
+        
+        Returns:
+            (result, reused): 分析结果，以及是否复用了缓存
+        """
+        from ai.policy import TIME_BASED_REASONS
+        refresh = reason in TIME_BASED_REASONS
+        # 获取当前时间
+        china_tz = pytz.timezone('Asia/Shanghai')
+        current_time = datetime.now(china_tz).strftime('%Y-%m-%d %H:%M:%S')
+        
+        # 单独修改过的发生内容不同，会重新分析
+        cache_key = analysis_cache_key(event)
+        result = get_cached_analysis(cache_key) if cache_key and not refresh else None
+        if result is not None:
+            ANALYSIS_CACHE.inc(result='hit')
+            print(f"    ♻️ 复用重复事件系列的分析结果")
+            return result, True
+        
+        if not refresh:
+            ANALYSIS_CACHE.inc(result='miss')
+        
+        # 标题只有日期、编号或人名不同的事件复用相似事件的结果
+        from ai.similarity_cache import get_similarity_cache
+        similarity_cache = get_similarity_cache(CONFIG)
+        result = similarity_cache.lookup(event) if not refresh else None
+        if result is not None:
+            similar = result['_similar']
+            print(f"    ♻️ 复用标题相似事件的分析结果（来源: {similar['source_summary']}，相似度 {similar['similarity']:.2f}）")
+            return result, True
+        
+        # 调用AI分析，传递时间信息
+        result = analyze_event(
+            event.get('summary', ''), 
+            event.get('description', ''), 
+            CONFIG,
+            start_time=event.get('start', ''),
+            end_time=event.get('end', ''),
+            duration_minutes=event.get('duration_minutes'),
+            current_time=current_time,
+            calendar_name=event.get('calendar_name', '')
+        )
+        
+        if cache_key and 'error' not in result:
+            save_cached_analysis(cache_key, result)
+        similarity_cache.store(event, result)
+        return result, False
+    
+    def check_and_send_reminders(self, job=None):
         """检查并发送提醒"""
         try:
             events_to_remind = get_events_to_remind()
+            if job:
+                job.update(checked=len(events_to_remind), sent=0, failed=0)
             
             if not events_to_remind:
                 return
@@ -193,9 +626,14 @@ class CalendarAgent:
                         
                         webhook_type = CONFIG.get('webhook_type', 'generic')
                         if send_notification(event, event['result'], CONFIG['webhook_url'], webhook_type, CONFIG):
+                            REMINDER_LATENESS_SECONDS.observe((datetime.now(pytz.UTC) - remind_time_utc).total_seconds())
                             mark_reminded(event['id'], "sent")
+                            if job:
+                                job.advance('sent')
                         else:
                             mark_reminded(event['id'], "failed")
+                            if job:
+                                job.advance('failed')
                 
                 except Exception as e:
                     print(f"❌ 处理提醒事件时出错: {e}")
@@ -219,10 +657,8 @@ class CalendarAgent:
         print("🚀 Chrona v3.0 启动")
         print(f"📊 配置信息:")
         
-        # 显示 LLM 配置信息
-        from ai.llm_client import LLMClient
-        llm_client = LLMClient(CONFIG)
-        llm_info = llm_client.get_provider_info()
+        # 显示 LLM 配置信息（直接读取配置，不为此初始化LLM客户端）
+        llm_info = describe_llm_config(CONFIG)
         
         print(f"  🤖 LLM提供商: {llm_info['provider']}")
         if llm_info['provider'] != 'custom':
@@ -298,44 +734,64 @@ class CalendarAgent:
         
         # 初始化数据库
         try:
-            init_db(CONFIG['database'])
+            with self.profiler.section('初始化: 数据库'):
+                init_db(CONFIG['database'])
         except Exception as e:
             print(f"❌ 数据库初始化失败: {e}")
             return
         
+        # 先清理过期事件，再立即检查一次提醒：
+        # 重启期间到期的提醒只依赖数据库和通知模块，不必等待较慢的日程获取
+        print("🗑️ 启动时清理过期数据...")
+        with self.profiler.section('启动清理'):
+            cleanup_old_events(days=7)
+        self.last_cleanup_time = datetime.now()  # 记录清理时间
+        
+        with self.profiler.section('首次提醒检查'):
+            self.run_job('reminders')
+        
         # 启动心跳包发送器
-        if self.heartbeat_sender.start():
-            print("✅ 心跳包服务启动成功")
+        with self.profiler.section('启动: 心跳包'):
+            if self.heartbeat_sender.start():
+                print("✅ 心跳包服务启动成功")
         
         # 启动API服务器
-        if self.api_server.start():
-            print("✅ API服务启动成功")
+        if self.api_server:
+            with self.profiler.section('启动: API服务'):
+                if self.api_server.start():
+                    print("✅ API服务启动成功")
+        
+        # 启动配置监视
+        self.config_watcher.start()
         
         # 发送启动状态的心跳包
         self.heartbeat_sender.send_status_update("up", "Schedule Manager started successfully")
         
         # 等待一下确保服务完全启动
-        import time
-        time.sleep(1)
+        if self.api_server:
+            time.sleep(1)
         
         # 发送测试通知（可选）
         if CONFIG.get('webhook_url') and CONFIG['webhook_url'] != "https://your.gitify.endpoint/webhook":
             print(f"\n🧪 发送测试通知...")
             webhook_type = CONFIG.get('webhook_type', 'generic')
-            if send_test_notification(CONFIG['webhook_url'], webhook_type, CONFIG):
+            with self.profiler.section('测试通知'):
+                notified = send_test_notification(CONFIG['webhook_url'], webhook_type, CONFIG)
+            if notified:
                 print("✅ 测试通知发送成功")
             else:
                 print("❌ 测试通知发送失败，请检查webhook配置")
         
         print(f"\n⏰ 开始监控日程...")
         
-        # 立即执行一次，先清理过期事件，再检查提醒
-        print("🗑️ 启动时清理过期数据...")
-        cleanup_old_events(days=7)  # 首先清理过期事件
-        self.last_cleanup_time = datetime.now()  # 记录清理时间
-        
-        self.fetch_and_analyze_events()
-        self.check_and_send_reminders()
+        with self.profiler.section('导入: CalDAV/AI分析'):
+            import_fetch_pipeline()
+        self.start_local_preload()
+        with self.profiler.section('首次获取和分析'):
+            self.run_job('fetch')
+        # 获取后再检查一次，覆盖新发现的临近事件
+        self.run_job('reminders')
+        self.profiler.report()
         self.print_stats()
         
         # 主循环
@@ -348,12 +804,12 @@ class CalendarAgent:
                     (current_time - self.last_fetch_time).total_seconds() >= INTERVAL):
                     # 每次获取新事件前先清理过期事件
                     cleanup_old_events(days=7)
-                    self.fetch_and_analyze_events()
+                    self.run_job('fetch')
                 
                 # 检查是否需要发送提醒
                 if (not self.last_remind_check or 
                     (current_time - self.last_remind_check).total_seconds() >= REMIND_CHECK_INTERVAL):
-                    self.check_and_send_reminders()
+                    self.run_job('reminders')
                 
                 # 定期清理过期事件
                 if (not self.last_cleanup_time or 
@@ -362,6 +818,13 @@ class CalendarAgent:
                     cleanup_old_events(days=7)
                     self.last_cleanup_time = current_time
                 
+                # 空闲时在后台预先分析 24 小时之后的事件，并轮询批量分析任务
+                self.maybe_start_lookahead(current_time)
+                self.maybe_poll_batches(current_time)
+                
+                # 本地推理工作进程意外退出时自动重启
+                self.check_local_worker()
+                
                 # 每小时打印一次统计信息
                 if current_time.minute == 0 and current_time.second < 30:
                     self.print_stats()
@@ -381,60 +844,35 @@ class CalendarAgent:
         self.heartbeat_sender.send_status_update("down", "Schedule Manager stopped")
         
         # 停止服务
+        self.config_watcher.stop()
         self.heartbeat_sender.stop()
-        self.api_server.stop()
+        if self.api_server:
+            self.api_server.stop()
+        if 'ai.llm_client' in sys.modules:
+            sys.modules['ai.llm_client'].close_shared_client()
         
         print("\n👋 Chrona 已停止")
 
 def main():
     """入口函数"""
+    parser = argparse.ArgumentParser(description="Chrona 智能日程代理")
+    parser.add_argument('--profile-startup', action='store_true', help="输出各子系统的导入和初始化耗时")
+    args = parser.parse_args()
+    
     # 检查配置文件
     if not os.path.exists('config.yaml'):
         print("❌ 配置文件 config.yaml 不存在")
         sys.exit(1)
     
-    # 检查必要的配置
-    required_fields = ['caldav', 'database', 'webhook_url']
-    for field in required_fields:
-        if field not in CONFIG or not CONFIG[field]:
-            print(f"❌ 配置文件中缺少必要字段: {field}")
-            sys.exit(1)
-    
-    # 检查 LLM 配置（支持新的 V3 格式）
-    llm_config = CONFIG.get('llm', {})
-    if llm_config:
-        # 新格式：检查是否有有效的 LLM 配置
-        if llm_config.get('local', {}).get('enabled', False):
-            # 本地模型配置
-            local_config = llm_config['local']
-            if not local_config.get('model_path'):
-                print("❌ 本地 LLM 配置缺少 model_path")
-                sys.exit(1)
-        elif llm_config.get('custom', {}).get('enabled', False):
-            # 自定义配置
-            custom_config = llm_config['custom']
-            if not custom_config.get('url') or not custom_config.get('model'):
-                print("❌ 自定义 LLM 配置缺少 url 或 model")
-                sys.exit(1)
-        else:
-            # 预设提供商配置
-            if not llm_config.get('api_key'):
-                print("❌ LLM 配置缺少 api_key")
-                sys.exit(1)
-            if llm_config.get('api_key') in ['your-api-key-here', '']:
-                print("❌ 请在config.yaml中设置正确的 LLM API密钥")
-                sys.exit(1)
-    else:
-        # 兼容旧格式
-        if 'api_key' not in CONFIG or not CONFIG['api_key']:
-            print("❌ 配置文件中缺少必要字段: api_key 或 llm 配置")
-            sys.exit(1)
-        if CONFIG['api_key'] == 'your-api-key-here':
-            print("❌ 请在config.yaml中设置正确的API密钥")
-            sys.exit(1)
+    # 检查必要的配置和 LLM 配置（与热加载使用同一套校验）
+    errors = validate_config(CONFIG)
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        sys.exit(1)
     
     # 启动代理
-    agent = CalendarAgent()
+    agent = CalendarAgent(profiler=StartupProfiler(enabled=args.profile_startup))
     agent.run()
 
 if __name__ == '__main__':
@@ -1,7 +1,12 @@
 import requests
 import json
 import time
-from .llm_client import LLMClient
+from .llm_client import LLMClient, get_cascade_client, get_shared_client
+from .json_scan import extract_json_object
+from .schema import ANALYSIS_FIELDS, validate_analysis
+from .prompts import build_analysis_prompt
+from .rules import get_rule_engine
+from metrics import ANALYSIS_CASCADE, ANALYSIS_PARSE
 
 def analyze_event(summary, description, config, start_time=None, end_time=None, duration_minutes=None, current_time=None, calendar_name=None):
     """使用AI分析日程事件的重要性和提醒需求 - V3版本"""
@@ -13,153 +18,144 @@ def analyze_event(summary, description, config, start_time=None, end_time=None,
         china_tz = pytz.timezone('Asia/Shanghai')
         current_time = datetime.now(china_tz).strftime('%Y-%m-%d %H:%M:%S')
     
-    # 构建时间信息文本
-    time_info = ""
-    if start_time:
-        time_info += f"开始时间: {start_time}\n"
-    if end_time:
-        time_info += f"结束时间: {end_time}\n"
-    if duration_minutes:
-        hours = duration_minutes // 60
-        minutes = duration_minutes % 60
-        if hours > 0:
-            time_info += f"持续时间: {hours}小时{minutes}分钟 (共{duration_minutes}分钟)\n"
-        else:
-            time_info += f"持续时间: {minutes}分钟\n"
+    # 常规事件由规则直接给出结论，无需调用LLM
+    rule_result = get_rule_engine(config).classify(summary, description, calendar_name, duration_minutes)
+    if rule_result is not None:
+        ANALYSIS_PARSE.inc(provider='rules', method='rules')
+        return rule_result
     
-    # 构建日历信息文本
-    calendar_info = ""
-    if calendar_name:
-        calendar_info = f"日历来源: {calendar_name}\n"
+    # 静态规则作为系统提示词，事件信息作为简短的用户消息，便于提供商复用前缀缓存
+    prompt = build_analysis_prompt(
+        summary, description, current_time,
+        start_time=start_time, end_time=end_time,
+        duration_minutes=duration_minutes, calendar_name=calendar_name
+    )
 
-    prompt = f"""
-你是一个智能日程助手。请分析如下日程并输出以下字段：
-- task: 事件任务（简化后的任务描述）
-- important: 是否重要 (true/false)
-- need_remind: 是否需要提醒 (true/false)
-- minutes_before_remind: 建议提前几分钟提醒（数字）
-- reason: 判断理由
-
-分析规则：
-1. 会议、面试、重要约会等需要提醒
-2. 普通的个人时间、休息时间通常不需要提醒
-3. 重要事件建议提前15-30分钟提醒
-4. 普通事件提前5-10分钟提醒
-5. 考虑事件时长：长时间事件（>=2小时）可能需要更早提醒
-6. 考虑当前时间与事件开始时间的距离来调整提醒策略
-
-基于日历名称的智能判断：
-- "工作"、"办公"、"会议"等相关日历：通常为工作事务，重要性较高，建议提醒
-- "个人"、"私人"、"生活"等相关日历：根据具体内容判断重要性
-- "生日"、"纪念日"等相关日历：重要的个人事件，建议提醒
-- "假期"、"休息"、"娱乐"等相关日历：通常不需要紧急提醒
-- "健康"、"医疗"、"体检"等相关日历：健康相关事务，重要性高
-- "学习"、"课程"、"培训"等相关日历：教育相关，建议提醒
-- 如果日历名称包含具体项目名、客户名：通常为重要工作事务
-
-当前时间: {current_time}
-{time_info}{calendar_info}
-标题: {summary}
-描述: {description}
+    # 级联模式：先由低成本模型分析，结果不可靠时再交给主提供商
+    cascade_client = get_cascade_client(config)
+    escalation = None
+    if cascade_client is not None:
+        min_confidence = config.get('llm', {}).get('cascade', {}).get('min_confidence', 0.7)
+        cheap_result = _generate_analysis(cascade_client, prompt, summary, description)
+        escalation = _escalation_reason(cheap_result, min_confidence)
+        ANALYSIS_CASCADE.inc(outcome=escalation or 'accepted')
+        if escalation is None:
+            cheap_result['_cascade'] = 'accepted'
+            return cheap_result
+    
+    # 使用共享的LLM客户端（配置变化时自动重建）
+    result = _generate_analysis(get_shared_client(config), prompt, summary, description)
+    if escalation is not None and 'error' not in result:
+        result['_cascade'] = f"escalated:{escalation}"
+    return result
 
-重要：请严格按照以下JSON格式输出，不要添加任何额外文字或解释：
-{{"task":"简化任务描述","important":true,"need_remind":true,"minutes_before_remind":15,"reason":"判断理由"}}
-"""
+def _escalation_reason(result, min_confidence):
+    """判断低成本模型的结果是否需要升级到主提供商，返回原因（无需升级时返回 None）"""
+    if 'error' in result:
+        return 'error'
+    if result.get('_parsing_method') == 'fallback':
+        return 'fallback'
+    if validate_analysis(result):
+        return 'invalid'
+    if result['confidence'] < min_confidence:
+        return 'low_confidence'
+    return None
 
-    # 使用新的LLM客户端
-    llm_client = LLMClient(config)
+def _generate_analysis(llm_client, prompt, summary, description):
+    """调用LLM并解析分析结果"""
+    provider = llm_client.llm_config['provider']
     
     try:
-        # 调用LLM生成回复
-        result = llm_client.generate(prompt)
+        # 调用LLM生成回复（支持时启用结构化输出）
+        result = llm_client.generate(prompt['user'], structured=True, system=prompt['system'])
         
         if not result.get('success'):
             return {"error": result.get('error', '未知LLM错误')}
         
-        text = result['text']
-        
-        # 尝试解析JSON - 增强容错版本
-        try:
-            # 清理可能的markdown标记和额外内容
-            text = text.strip()
-            
-            # 移除markdown代码块标记
-            if text.startswith('```json'):
-                text = text[7:]
-            elif text.startswith('```'):
-                text = text[3:]
-            if text.endswith('```'):
-                text = text[:-3]
-            text = text.strip()
-            
-            # 尝试提取JSON对象
-            json_text = _extract_json_object(text)
-            if not json_text:
-                json_text = text
-            
-            parsed_result = json.loads(json_text)
-            
-            # 验证必需字段
-            required_fields = ['task', 'important', 'need_remind', 'minutes_before_remind']
-            for field in required_fields:
-                if field not in parsed_result:
-                    parsed_result[field] = False if field in ['important', 'need_remind'] else 15
-            
-            # 添加LLM提供商信息用于调试
-            parsed_result['_llm_info'] = llm_client.get_provider_info()
-                    
-            return parsed_result
-            
-        except json.JSONDecodeError as e:
-            # JSON解析失败时，尝试容错处理
-            print(f"⚠️ JSON解析失败，尝试容错处理: {e}")
-            print(f"原始响应: {text[:200]}...")
-            
-            # 尝试更激进的JSON提取
-            fallback_result = _fallback_json_parse(text, summary, description)
-            if fallback_result:
-                fallback_result['_llm_info'] = llm_client.get_provider_info()
-                fallback_result['_parsing_method'] = 'fallback'
-                return fallback_result
-            
-            return {"error": f"JSON解析失败: {e}", "raw": text}
+        # 启用故障转移时，实际返回结果的可能是备用提供商（结果中附带该提供商的信息）
+        provider = result.get('provider', provider)
+        return parse_analysis_output(
+            result['text'], result.get('structured', False), provider,
+            result.get('provider_info') or llm_client.get_provider_info(provider), summary, description
+        )
             
     except Exception as e:
         return {"error": f"分析失败: {e}"}
 
-def _extract_json_object(text):
-    """从响应文本中提取JSON对象"""
-    import re
-    
-    # 尝试找到JSON对象的边界
-    patterns = [
-        r'\{[^}]*"task"[^}]*\}',  # 寻找包含task字段的JSON对象
-        r'\{.*?\}',  # 寻找任何JSON对象
-        r'\[.*?\]'   # 寻找JSON数组
-    ]
+def parse_analysis_output(text, structured, provider, provider_info, summary, description):
+    """解析LLM输出的分析结果（实时调用和批量接口的结果共用）
     
-    for pattern in patterns:
-        matches = re.findall(pattern, text, re.DOTALL)
-        for match in matches:
-            try:
-                # 测试是否是有效的JSON
-                json.loads(match)
-                return match
-            except:
-                continue
-    
-    # 尝试从第一个{到最后一个}
-    start = text.find('{')
-    end = text.rfind('}')
-    if start != -1 and end != -1 and end > start:
-        candidate = text[start:end+1]
+    Args:
+        text: 模型输出的文本
+        structured: 是否为结构化输出（约束解码/JSON 模式）
+        provider: 提供商名称（用于指标）
+        provider_info: 附加到结果中的提供商信息
+        summary: 事件标题（容错解析时使用）
+        description: 事件描述（容错解析时使用）
+    """
+    # 约束解码/结构化输出本身就是合法JSON，直接解析，跳过提取和容错流程
+    if structured:
         try:
-            json.loads(candidate)
-            return candidate
-        except:
+            parsed_result = json.loads(text)
+            # JSON 模式（如 DeepSeek）只保证语法合法，缺字段时交给下面的补全流程
+            if isinstance(parsed_result, dict) and all(field in parsed_result for field in ANALYSIS_FIELDS):
+                parsed_result['_llm_info'] = provider_info
+                parsed_result['_parsing_method'] = 'structured'
+                ANALYSIS_PARSE.inc(provider=provider, method='structured')
+                return parsed_result
+        except json.JSONDecodeError:
+            # 输出被截断（如达到 max_tokens）时按普通文本处理
             pass
     
-    return None
+    # 尝试解析JSON - 增强容错版本
+    try:
+        # 清理可能的markdown标记和额外内容
+        text = text.strip()
+        
+        # 移除markdown代码块标记
+        if text.startswith('```json'):
+            text = text[7:]
+        elif text.startswith('```'):
+            text = text[3:]
+        if text.endswith('```'):
+            text = text[:-3]
+        text = text.strip()
+        
+        # 单次扫描提取JSON对象（优先包含task字段的对象），找不到时按整段文本解析
+        parsed_result = extract_json_object(text, prefer_key='task')
+        if parsed_result is None:
+            parsed_result = json.loads(text)
+        if not isinstance(parsed_result, dict):
+            # 合法 JSON 但不是对象（数组、字符串等），按解析失败处理
+            raise json.JSONDecodeError("分析结果不是 JSON 对象", text, 0)
+        
+        # 验证必需字段
+        required_fields = ['task', 'important', 'need_remind', 'minutes_before_remind']
+        for field in required_fields:
+            if field not in parsed_result:
+                parsed_result[field] = False if field in ['important', 'need_remind'] else 15
+        
+        # 添加LLM提供商信息用于调试
+        parsed_result['_llm_info'] = provider_info
+        ANALYSIS_PARSE.inc(provider=provider, method='json')
+                
+        return parsed_result
+        
+    except json.JSONDecodeError as e:
+        # JSON解析失败时，尝试容错处理
+        print(f"⚠️ JSON解析失败，尝试容错处理: {e}")
+        print(f"原始响应: {text[:200]}...")
+        
+        # 尝试更激进的JSON提取
+        fallback_result = _fallback_json_parse(text, summary, description)
+        if fallback_result:
+            fallback_result['_llm_info'] = provider_info
+            fallback_result['_parsing_method'] = 'fallback'
+            ANALYSIS_PARSE.inc(provider=provider, method='fallback')
+            return fallback_result
+        
+        ANALYSIS_PARSE.inc(provider=provider, method='failed')
+        return {"error": f"JSON解析失败: {e}", "raw": text}
 
 def _fallback_json_parse(text, summary, description):
     """当JSON解析失败时的容错处理"""
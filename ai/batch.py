@@ -0,0 +1,386 @@
+"""
+批量分析
+较远的事件不在意延迟，只在意费用和速率限制。启用 llm.batch 后，预先分析改为通过提供商的批量接口
+（OpenAI 兼容的 /v1/files + /v1/batches）提交，不占用实时接口的配额；批量任务记录在数据库中，
+定期轮询，完成后将结果合并到 events 表
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+import requests
+
+from memory.database import (create_llm_batch, get_analysis_states, get_llm_batch_items, get_pending_llm_batches,
+                             record_llm_usage, save_cached_analysis, save_event_analysis, update_llm_batch)
+from metrics import ANALYSIS_BATCH, ANALYSIS_PARSE, LLM_COST
+from .analyzer import parse_analysis_output
+from .cache import content_hash, series_cache_key
+from .llm_client import LLMClient, get_shared_client
+from .prompts import build_analysis_prompt
+from .rules import get_rule_engine
+from .schema import ANALYSIS_MAX_TOKENS
+from .usage import UsageBudget, estimate_cost
+
+# 批量请求调用的接口
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+# 批量接口的终止状态（expired/cancelled 时已完成的部分仍有输出）
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+# 用量核算和指标中使用的提供商名称（单价配置在 llm.usage.pricing.batch）
+BATCH_PROVIDER = 'batch'
+
+def _parse_output_line(line: Dict[str, Any]) -> Dict[str, Any]:
+    """解析批量接口输出文件中的一行
+
+    Returns:
+        {'text', 'usage'}，请求失败时为 {'error'}
+    """
+    response = line.get('response') or {}
+    if line.get('error') or response.get('status_code') != 200:
+        error = line.get('error') or response.get('body', {}).get('error') or response.get('status_code')
+        return {'error': f"批量请求失败: {error}"}
+    body = response.get('body') or {}
+    try:
+        text = body['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        return {'error': "无法解析批量请求的响应"}
+    return {'text': text, 'usage': LLMClient._openai_usage(body)}
+
+def _parse_output_file(content: str) -> Dict[str, Dict[str, Any]]:
+    """解析 JSONL 输出文件 -> {custom_id: 输出}"""
+    outputs = {}
+    for raw in content.splitlines():
+        if raw.strip():
+            line = json.loads(raw)
+            outputs[line.get('custom_id')] = _parse_output_line(line)
+    return outputs
+
+class OpenAIBatchBackend:
+    """OpenAI 兼容的批量接口：上传 JSONL 请求文件，创建批量任务，完成后下载输出文件"""
+
+    name = 'openai'
+    # 批量请求的用量需要在合并结果时记账
+    accounted = False
+
+    def __init__(self, batch_config: Dict[str, Any], api_key: Optional[str]):
+        self.base_url = batch_config.get('url', 'https://api.openai.com/v1').rstrip('/')
+        self.completion_window = batch_config.get('completion_window', '24h')
+        self.timeout = batch_config.get('timeout', 60)
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.headers.update(batch_config.get('headers', {}))
+
+    def submit(self, lines: List[Dict[str, Any]]) -> str:
+        """提交批量请求，返回批量任务ID"""
+        content = '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines)
+        response = requests.post(
+            f"{self.base_url}/files",
+            headers=self.headers,
+            data={'purpose': 'batch'},
+            files={'file': ('chrona-batch.jsonl', content.encode('utf-8'), 'application/jsonl')},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"上传批量请求文件失败: {response.status_code} {response.text[:200]}")
+        input_file_id = response.json()['id']
+
+        response = requests.post(
+            f"{self.base_url}/batches",
+            headers=self.headers,
+            json={
+                "input_file_id": input_file_id,
+                "endpoint": BATCH_ENDPOINT,
+                "completion_window": self.completion_window,
+                "metadata": {"source": "chrona"}
+            },
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"创建批量任务失败: {response.status_code} {response.text[:200]}")
+        return response.json()['id']
+
+    def poll(self, batch_id: str) -> Tuple[str, Optional[Dict[str, Dict[str, Any]]]]:
+        """查询批量任务
+
+        Returns:
+            (接口报告的状态, 各请求的输出)；任务未结束时输出为 None
+        """
+        response = requests.get(f"{self.base_url}/batches/{batch_id}", headers=self.headers, timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"查询批量任务失败: {response.status_code} {response.text[:200]}")
+        data = response.json()
+        status = data.get('status', 'unknown')
+        if status not in TERMINAL_STATUSES:
+            return status, None
+
+        outputs = {}
+        # 失败的请求写在 error_file_id 中，成功的在 output_file_id 中
+        for file_id in (data.get('error_file_id'), data.get('output_file_id')):
+            if file_id:
+                outputs.update(_parse_output_file(self._download(file_id)))
+        return status, outputs
+
+    def _download(self, file_id: str) -> str:
+        response = requests.get(f"{self.base_url}/files/{file_id}/content", headers=self.headers, timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"下载批量输出文件失败: {response.status_code}")
+        return response.content.decode('utf-8')
+
+class LocalBatchBackend:
+    """本地替身：提交时把请求文件写入目录，轮询时用实时客户端逐条执行并写出同格式的输出文件
+
+    用于在没有批量接口的环境（本地模型、自建服务）中测试完整流程，不节省实时配额。
+    每次轮询最多执行 local_requests_per_poll 条请求，当天 LLM 预算用完时暂停（与实时分析相同），
+    全部执行完才写出输出文件
+    """
+
+    name = 'local'
+    # 由实时客户端执行，用量已由 LLMClient.generate 记账
+    accounted = True
+
+    def __init__(self, batch_config: Dict[str, Any], config: Dict[str, Any]):
+        self.directory = batch_config.get('local_dir', './data/batches')
+        # 每次轮询最多执行的请求数，0 表示不限制
+        self.requests_per_poll = batch_config.get('local_requests_per_poll', 20)
+        self.config = config
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, lines: List[Dict[str, Any]]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        with open(self._path(batch_id, 'input'), 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+        return batch_id
+
+    def poll(self, batch_id: str) -> Tuple[str, Optional[Dict[str, Dict[str, Any]]]]:
+        output_path = self._path(batch_id, 'output')
+        if not os.path.exists(output_path) and not self._execute_pending(batch_id):
+            return 'in_progress', None
+        with open(output_path, 'r', encoding='utf-8') as f:
+            return 'completed', _parse_output_file(f.read())
+
+    def _execute_pending(self, batch_id: str) -> bool:
+        """执行尚未执行的请求（结果追加到 partial 文件）
+
+        Returns:
+            是否已全部执行完（此时 partial 文件改名为输出文件）
+        """
+        with open(self._path(batch_id, 'input'), 'r', encoding='utf-8') as f:
+            lines = [json.loads(raw) for raw in f if raw.strip()]
+        partial_path = self._path(batch_id, 'partial')
+        done = set()
+        if os.path.exists(partial_path):
+            with open(partial_path, 'r', encoding='utf-8') as f:
+                done = {json.loads(raw).get('custom_id') for raw in f if raw.strip()}
+        pending = [line for line in lines if line['custom_id'] not in done]
+
+        budget = UsageBudget(self.config)
+        client = get_shared_client(self.config) if pending else None
+        executed = 0
+        with open(partial_path, 'a', encoding='utf-8') as f:
+            for line in pending:
+                if self.requests_per_poll and executed >= self.requests_per_poll:
+                    break
+                exhausted = budget.exhausted()
+                if exhausted:
+                    print(f"⏸️ 今日LLM用量预算已用完（{exhausted}），本地批量任务 {batch_id} 暂停")
+                    break
+                f.write(json.dumps(self._execute(client, line), ensure_ascii=False) + '\n')
+                f.flush()
+                executed += 1
+
+        if executed < len(pending):
+            return False
+        os.replace(partial_path, self._path(batch_id, 'output'))
+        return True
+
+    @staticmethod
+    def _execute(client, line: Dict[str, Any]) -> Dict[str, Any]:
+        """用实时客户端执行一条请求，返回批量接口格式的输出行"""
+        messages = line['body']['messages']
+        system = next((message['content'] for message in messages if message['role'] == 'system'), None)
+        prompt = next(message['content'] for message in messages if message['role'] == 'user')
+        result = client.generate(prompt, structured=True, system=system)
+        if not result.get('success'):
+            return {'custom_id': line['custom_id'], 'response': None, 'error': result.get('error', '未知LLM错误')}
+        body = {'choices': [{'message': {'content': result['text']}}]}
+        return {'custom_id': line['custom_id'], 'response': {'status_code': 200, 'body': body}, 'error': None}
+
+class BatchAnalyzer:
+    """通过批量接口分析较远的事件"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化
+
+        Args:
+            config: 全局配置（读取 llm.batch 段）
+        """
+        self.config = config
+        llm_config = config.get('llm', {})
+        self.batch_config = llm_config.get('batch', {})
+        self.enabled = self.batch_config.get('enabled', False)
+        self.backend_name = self.batch_config.get('backend', 'openai')
+        self.model = self.batch_config.get('model', 'gpt-4o-mini')
+        # json_schema、json_object 或 none，与自定义端点的 structured_output 相同
+        self.structured_output = self.batch_config.get('structured_output', 'json_schema')
+        self.max_requests = self.batch_config.get('max_requests_per_batch', 200)
+        self.poll_interval_seconds = self.batch_config.get('poll_interval_seconds', 600)
+        self.parameters = llm_config.get('parameters', {})
+        self.api_key = self.batch_config.get('api_key') or llm_config.get('api_key')
+
+    def backend(self, name: Optional[str] = None):
+        """按名称创建批量接口（轮询时使用任务提交时记录的名称）"""
+        name = name or self.backend_name
+        if name == 'local':
+            return LocalBatchBackend(self.batch_config, self.config)
+        if name == 'openai':
+            return OpenAIBatchBackend(self.batch_config, self.api_key)
+        raise ValueError(f"不支持的批量接口: {name}")
+
+    def provider_info(self) -> Dict[str, Any]:
+        """附加到分析结果中的提供商信息（与 LLMClient.get_provider_info 格式相同）"""
+        return {
+            "provider": BATCH_PROVIDER,
+            "model": self.model,
+            "url": self.batch_config.get('url', 'https://api.openai.com/v1'),
+            "parameters": self.parameters
+        }
+
+    def build_request(self, custom_id: str, event: Dict[str, Any], current_time: str) -> Dict[str, Any]:
+        """构建一条批量请求（请求体与实时的 OpenAI 兼容调用相同）"""
+        prompt = build_analysis_prompt(
+            event.get('summary', ''), event.get('description', ''), current_time,
+            start_time=event.get('start', ''), end_time=event.get('end', ''),
+            duration_minutes=event.get('duration_minutes'), calendar_name=event.get('calendar_name', '')
+        )
+        body = {
+            "model": self.model,
+            "messages": LLMClient._openai_messages(prompt['user'], prompt['system']),
+            "temperature": self.parameters.get('temperature', 0.7),
+            "max_tokens": min(self.parameters.get('max_tokens', 1000),
+                              self.parameters.get('structured_max_tokens', ANALYSIS_MAX_TOKENS)),
+            "top_p": self.parameters.get('top_p', 0.9)
+        }
+        if self.structured_output in ('json_schema', 'json_object'):
+            body["response_format"] = LLMClient._openai_response_format(self.structured_output)
+        return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+    def submit(self, events: List[Dict[str, Any]]) -> Tuple[Optional[str], int, List[Tuple[Dict[str, Any], Dict[str, Any]]]]:
+        """提交事件的批量分析
+
+        规则能直接得出结论的事件不提交，结果随返回值交给调用者保存；超过 max_requests_per_batch 的事件留到下一次
+
+        Returns:
+            (批量任务ID（没有需要提交的事件时为 None）, 提交的事件数, [(事件, 规则分析结果), ...])
+        """
+        china_tz = pytz.timezone('Asia/Shanghai')
+        current_time = datetime.now(china_tz).strftime('%Y-%m-%d %H:%M:%S')
+        rule_engine = get_rule_engine(self.config)
+
+        ruled, items, lines = [], [], []
+        for event in events:
+            rule_result = rule_engine.classify(event.get('summary', ''), event.get('description', ''),
+                                               event.get('calendar_name'), event.get('duration_minutes'))
+            if rule_result is not None:
+                ANALYSIS_PARSE.inc(provider='rules', method='rules')
+                ruled.append((event, rule_result))
+                continue
+            if self.max_requests and len(lines) >= self.max_requests:
+                continue
+            custom_id = f"event-{len(lines)}"
+            lines.append(self.build_request(custom_id, event, current_time))
+            items.append({'custom_id': custom_id, 'event': event, 'content_hash': content_hash(event)})
+
+        if not lines:
+            return None, 0, ruled
+        batch_id = self.backend().submit(lines)
+        create_llm_batch(batch_id, self.backend_name, items)
+        ANALYSIS_BATCH.inc(len(items), result='submitted')
+        return batch_id, len(items), ruled
+
+    def poll(self) -> Dict[str, int]:
+        """轮询未结束的批量任务，合并已完成任务的结果
+
+        Returns:
+            各结果的事件数 {'merged', 'stale', 'failed'}，以及仍在处理的任务数 'pending'
+        """
+        counts = {'merged': 0, 'stale': 0, 'failed': 0, 'pending': 0}
+        for batch in get_pending_llm_batches():
+            try:
+                backend = self.backend(batch['backend'])
+                remote_status, outputs = backend.poll(batch['id'])
+            except Exception as e:
+                print(f"⚠️ 查询批量任务 {batch['id']} 失败: {e}")
+                counts['pending'] += 1
+                continue
+
+            if outputs is None:
+                update_llm_batch(batch['id'], remote_status)
+                counts['pending'] += 1
+                continue
+
+            item_statuses = self.merge(batch, outputs, accounted=backend.accounted)
+            for item_status in item_statuses.values():
+                counts[item_status] += 1
+                ANALYSIS_BATCH.inc(result=item_status)
+            status = 'completed' if remote_status == 'completed' else 'failed'
+            error = None if status == 'completed' else f"批量任务结束状态: {remote_status}"
+            update_llm_batch(batch['id'], remote_status, status=status, item_statuses=item_statuses, error=error)
+        return counts
+
+    def merge(self, batch: Dict[str, Any], outputs: Dict[str, Dict[str, Any]], accounted: bool = False) -> Dict[str, str]:
+        """将批量任务的输出合并到 events 表
+
+        提交后事件已由实时分析得到更新的结果时，丢弃批量结果（stale）
+
+        Returns:
+            {custom_id: merged/stale/failed}
+        """
+        items = get_llm_batch_items(batch['id'])
+        states = get_analysis_states([item['event'] for item in items])
+        statuses = {}
+        for item in items:
+            event = item['event']
+            output = outputs.get(item['custom_id'])
+            if output is None or 'error' in output:
+                statuses[item['custom_id']] = 'failed'
+                continue
+
+            if not accounted:
+                usage = output.get('usage') or {}
+                cost = estimate_cost(self.config, BATCH_PROVIDER, usage)
+                if cost:
+                    LLM_COST.inc(cost, provider=BATCH_PROVIDER)
+                record_llm_usage(BATCH_PROVIDER, 'ok', True, usage=usage, cost=cost)
+
+            # 提交后内容变化的事件保存的仍是提交时的内容哈希，重新分析策略会在下一轮发现变化
+            state = states.get((event.get('uid', ''), event.get('recurrence_id', '') or ''))
+            if state is not None and (state.get('analyzed_at') or '') > (batch['submitted_at'] or ''):
+                statuses[item['custom_id']] = 'stale'
+                continue
+
+            # 单个输出无法解析时只影响该事件，不中断整个任务的合并（否则任务一直停留在 pending）
+            try:
+                result = parse_analysis_output(
+                    output['text'], self.structured_output in ('json_schema', 'json_object'), BATCH_PROVIDER,
+                    self.provider_info(), event.get('summary', ''), event.get('description', '')
+                )
+            except Exception as e:
+                print(f"⚠️ 批量任务 {batch['id']} 中事件 {event.get('summary', '无标题')} 的输出无法解析: {e}")
+                statuses[item['custom_id']] = 'failed'
+                continue
+            if 'error' in result or not save_event_analysis(event, result, content_hash=item['content_hash']):
+                statuses[item['custom_id']] = 'failed'
+                continue
+            cache_key = series_cache_key(event)
+            if cache_key:
+                save_cached_analysis(cache_key, result)
+            statuses[item['custom_id']] = 'merged'
+        return statuses
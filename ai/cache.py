@@ -0,0 +1,40 @@
+"""
+分析结果缓存键
+重复事件的各次发生共享 UID，只要内容未被单独修改，就复用同一份分析结果；
+单个事件（某一次发生）的键用于合并同时进行的重复分析
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from .prompts import ANALYSIS_TEMPLATE_ID
+
+# 参与缓存键计算的事件字段：任一字段变化（如单独修改某次发生的标题或时长）都会重新分析
+SERIES_KEY_FIELDS = ['provider', 'calendar_name', 'uid', 'summary', 'description', 'duration_minutes']
+
+# 单个事件的键额外包含发生标识和起止时间
+EVENT_KEY_FIELDS = SERIES_KEY_FIELDS + ['recurrence_id', 'start', 'end']
+
+def _hash_key(prefix: str, event: Dict[str, Any], fields) -> str:
+    payload = [ANALYSIS_TEMPLATE_ID] + [event.get(field) for field in fields]
+    raw = json.dumps(payload, ensure_ascii=False, default=str)
+    return prefix + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def series_cache_key(event: Dict[str, Any]) -> Optional[str]:
+    """计算重复事件的系列缓存键
+
+    Returns:
+        缓存键；非重复事件或缺少 UID 时返回 None
+    """
+    if not event.get('is_recurring') or not event.get('uid'):
+        return None
+    return _hash_key("series:", event, SERIES_KEY_FIELDS)
+
+def content_hash(event: Dict[str, Any]) -> str:
+    """单个事件的内容哈希（含模板版本），内容或提示词模板变化时改变"""
+    return _hash_key("", event, EVENT_KEY_FIELDS)
+
+def analysis_key(event: Dict[str, Any]) -> str:
+    """分析请求的键：重复事件使用系列缓存键（各次发生共享一次分析），其余事件按自身内容计算"""
+    return series_cache_key(event) or "event:" + content_hash(event)
@@ -0,0 +1,204 @@
+"""
+多提供商故障转移与对冲请求
+按配置顺序依次尝试多个 LLM 提供商，跟踪各提供商的健康状态；
+可选对冲：主提供商超过其 p95 延迟仍未返回时，同时请求下一个提供商，取先成功的结果
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from metrics import LLM_FAILOVER, LLM_HEDGED_REQUESTS, LLM_PROVIDER_HEALTHY
+from .llm_client import LLMClient, build_provider_config
+
+class ProviderHealth:
+    """单个提供商的健康状态：连续失败达到阈值后冷却一段时间，并记录最近的成功延迟"""
+
+    def __init__(self, failure_threshold: int = 2, cooldown_seconds: float = 60, window: int = 100):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, success: bool, elapsed: float):
+        """记录一次请求结果"""
+        with self.lock:
+            if success:
+                self.consecutive_failures = 0
+                self.cooldown_until = 0.0
+                self.latencies.append(elapsed)
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.failure_threshold:
+                    self.cooldown_until = time.monotonic() + self.cooldown_seconds
+
+    def is_healthy(self) -> bool:
+        """是否可用（不在冷却期内）"""
+        with self.lock:
+            return time.monotonic() >= self.cooldown_until
+
+    def p95(self, min_samples: int) -> Optional[float]:
+        """最近成功请求延迟的 p95，样本不足时返回 None"""
+        with self.lock:
+            if len(self.latencies) < min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def to_dict(self, min_samples: int) -> Dict[str, Any]:
+        return {
+            'healthy': self.is_healthy(),
+            'consecutive_failures': self.consecutive_failures,
+            'samples': len(self.latencies),
+            'p95_seconds': self.p95(min_samples)
+        }
+
+class FailoverLLMClient:
+    """按顺序故障转移的 LLM 客户端，接口与 LLMClient 相同"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化故障转移客户端
+
+        主提供商为 llm 段的常规配置，llm.failover.providers 为按顺序尝试的备用提供商
+        """
+        self.config = config
+        failover_config = config.get('llm', {}).get('failover', {})
+        self.hedge = failover_config.get('hedge', False)
+        self.hedge_min_samples = failover_config.get('hedge_min_samples', 20)
+        self.hedge_min_delay = failover_config.get('hedge_min_delay', 1.0)
+        failure_threshold = failover_config.get('failure_threshold', 2)
+        cooldown_seconds = failover_config.get('cooldown_seconds', 60)
+
+        self.clients: List[LLMClient] = [LLMClient(config)]
+        for entry in failover_config.get('providers', []):
+            self.clients.append(LLMClient(build_provider_config(config, entry)))
+
+        self.health = [ProviderHealth(failure_threshold, cooldown_seconds) for _ in self.clients]
+        self.llm_config = self.clients[0].llm_config
+        self.executor = ThreadPoolExecutor(max_workers=max(2, len(self.clients)), thread_name_prefix="llm-failover")
+
+    def _name(self, index: int) -> str:
+        return self.clients[index].llm_config['provider']
+
+    def _ordered(self) -> List[int]:
+        """尝试顺序：健康的提供商按配置顺序在前，冷却中的排在最后（全部冷却时仍会尝试）"""
+        indexes = range(len(self.clients))
+        healthy = [i for i in indexes if self.health[i].is_healthy()]
+        cooling = [i for i in indexes if not self.health[i].is_healthy()]
+        return healthy + cooling
+
+    def _call(self, index: int, prompt: str, structured: bool, system: Optional[str]) -> Dict[str, Any]:
+        """调用单个提供商并更新健康状态"""
+        started = time.perf_counter()
+        result = self.clients[index].generate(prompt, structured=structured, system=system)
+        # 多个备用提供商可能同名（如两个 custom 端点），按序号附带实际提供商的信息
+        result['provider_info'] = self.clients[index].get_provider_info()
+        success = bool(result.get('success'))
+        self.health[index].record(success, time.perf_counter() - started)
+        LLM_PROVIDER_HEALTHY.set(1 if self.health[index].is_healthy() else 0, provider=self._name(index))
+        return result
+
+    def generate(self, prompt: str, structured: bool = False, system: Optional[str] = None) -> Dict[str, Any]:
+        """依次尝试各提供商，返回第一个成功的结果；全部失败时返回最后一个错误"""
+        order = self._ordered()
+        errors = []
+
+        position = 0
+        while position < len(order):
+            index = order[position]
+            next_index = order[position + 1] if position + 1 < len(order) else None
+            delay = self._hedge_delay(index, next_index) if next_index is not None else None
+
+            if delay is None:
+                result = self._call(index, prompt, structured, system)
+                position += 1
+            else:
+                result, used_next = self._hedged_call(index, next_index, delay, prompt, structured, system)
+                position += 2 if used_next else 1
+
+            if result.get('success'):
+                if index != order[0] or errors:
+                    LLM_FAILOVER.inc(provider=result.get('provider', self._name(index)))
+                return result
+            errors.append(f"{self._name(index)}: {result.get('error', '未知错误')}")
+
+        return {"error": "所有LLM提供商均失败 - " + "; ".join(errors)}
+
+    def _hedge_delay(self, index: int, next_index: int) -> Optional[float]:
+        """对冲等待时间：该提供商的 p95 延迟（样本不足、未启用对冲或涉及本地模型时返回 None）"""
+        if not self.hedge:
+            return None
+        # 本地模型的推理占满 CPU 且只能串行，较慢的请求在后台继续运行会阻塞下一个事件，不做对冲
+        if 'local' in (self._name(index), self._name(next_index)):
+            return None
+        p95 = self.health[index].p95(self.hedge_min_samples)
+        if p95 is None:
+            return None
+        return max(p95, self.hedge_min_delay)
+
+    def _hedged_call(self, index: int, next_index: int, delay: float, prompt: str,
+                     structured: bool, system: Optional[str]):
+        """对冲请求：主请求超过 delay 仍未返回时并发请求下一个提供商
+
+        Returns:
+            (result, used_next): 先成功的结果，以及是否已经使用了下一个提供商
+        """
+        primary = self.executor.submit(self._call, index, prompt, structured, system)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result(), False
+
+        LLM_HEDGED_REQUESTS.inc(result='fired')
+        secondary = self.executor.submit(self._call, next_index, prompt, structured, system)
+        pending = {primary, secondary}
+        last_result = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                last_result = future.result()
+                if last_result.get('success'):
+                    LLM_HEDGED_REQUESTS.inc(result='primary' if future is primary else 'secondary')
+                    # 较慢的请求在后台完成，只用于更新健康状态
+                    return last_result, True
+        return last_result, True
+
+    def get_health(self) -> List[Dict[str, Any]]:
+        """各提供商的健康状态"""
+        return [
+            dict(provider=self._name(i), **self.health[i].to_dict(self.hedge_min_samples))
+            for i in range(len(self.clients))
+        ]
+
+    @property
+    def local_worker(self):
+        """本地推理工作进程（任一提供商为本地模型且启用工作进程时）"""
+        for client in self.clients:
+            if client.local_worker is not None:
+                return client.local_worker
+        return None
+
+    def close(self):
+        """释放所有提供商的资源"""
+        for client in self.clients:
+            client.close()
+        self.executor.shutdown(wait=False)
+
+    def get_provider_info(self, provider: Optional[str] = None, index: Optional[int] = None) -> Dict[str, Any]:
+        """获取提供商信息
+
+        Args:
+            provider: 提供商名称，返回第一个同名的提供商（同名时无法区分，应优先使用 index 或结果中的 provider_info）
+            index: 提供商序号（0 为主提供商）
+
+        默认返回主提供商
+        """
+        if index is not None and 0 <= index < len(self.clients):
+            return self.clients[index].get_provider_info()
+        for client in self.clients:
+            if provider is None or client.llm_config['provider'] == provider:
+                return client.get_provider_info()
+        return self.clients[0].get_provider_info()
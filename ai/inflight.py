@@ -0,0 +1,74 @@
+"""
+进行中的分析登记
+同一事件（按 ai.cache.analysis_key）同时被多处请求分析时（如预先分析与常规获取同时分析同一重复系列），
+只有第一个调用者实际执行分析，其余调用者等待并共享同一结果
+"""
+
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import ANALYSIS_COALESCED
+
+class InflightRegistry:
+    """按键合并同时进行的调用"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.futures: Dict[str, Future] = {}
+
+    def run(self, key: Optional[str], func: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """执行 func；同一键已有调用在进行时等待其结果
+
+        Args:
+            key: 合并键，为 None 时直接执行
+            func: 实际执行的调用
+            timeout: 等待进行中调用的超时（秒），超时抛出 concurrent.futures.TimeoutError
+
+        Returns:
+            (结果, 是否共享了其他调用者的结果)；共享的结果是副本，各调用者可以独立修改；
+            进行中的调用抛出异常时，等待者收到同一异常
+        """
+        if key is None:
+            return func(), False
+
+        with self.lock:
+            future = self.futures.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.futures[key] = future
+
+        if not leader:
+            ANALYSIS_COALESCED.inc()
+            return copy.deepcopy(future.result(timeout)), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            # 保存快照，第一个调用者之后修改自己的结果不影响等待者
+            future.set_result(copy.deepcopy(result))
+        finally:
+            # 结束后立即移除，之后的请求重新执行（结果复用由分析缓存负责）
+            with self.lock:
+                self.futures.pop(key, None)
+        return result, False
+
+    def __len__(self):
+        with self.lock:
+            return len(self.futures)
+
+# 进程内共享的分析登记
+_analysis_inflight = InflightRegistry()
+
+def run_analysis(key: Optional[str], func: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+    """在进程共享的登记中执行分析，见 InflightRegistry.run"""
+    return _analysis_inflight.run(key, func, timeout)
+
+def inflight_count() -> int:
+    """当前进行中的分析数"""
+    return len(_analysis_inflight)
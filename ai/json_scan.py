@@ -0,0 +1,171 @@
+"""
+JSON 对象扫描
+跟踪字符串、转义和花括号深度，从模型输出中找出 JSON 对象：
+JsonObjectScanner 用于流式响应（对象闭合后即可提前结束读取），
+iter_json_objects / extract_json_object 用于完整文本（分析结果解析、批量结果解析）
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, Optional
+
+# 只有这些字符会改变扫描状态，其余字符由正则在 C 层直接跳过
+_STRUCTURAL = re.compile(r'[{}"\\]')
+# JSON 对象只能以 {" 或 {} 开头（允许空白），说明文字中的 {会议} 之类不作为候选
+_OBJECT_START = re.compile(r'\{\s*["}]')
+_DECODER = json.JSONDecoder()
+
+class JsonObjectScanner:
+    """增量扫描文本片段，找出第一个可解析为对象的顶层 {...}"""
+
+    def __init__(self):
+        self.text = ''  # 已接收的全部文本（完成时截止到对象闭合处）
+        self.depth = 0
+        self.in_string = False
+        self.escape_end = -1  # 被转义字符之后的位置
+        self.start = None  # 当前候选对象在 text 中的起始位置
+        self.result: Optional[Dict[str, Any]] = None
+        self.object_text: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        """是否已得到完整的对象"""
+        return self.result is not None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """输入一段文本
+
+        Returns:
+            对象刚好在本段内闭合时返回对象文本，否则返回 None
+        """
+        if self.complete or not chunk:
+            return None
+
+        offset = len(self.text)
+        self.text += chunk
+
+        for match in _STRUCTURAL.finditer(self.text, offset):
+            i = match.start()
+            char = self.text[i]
+            if self.depth == 0:
+                # 对象外的文本（说明文字、代码块标记等）直接跳过
+                if char == '{':
+                    self.depth = 1
+                    self.start = i
+                continue
+
+            if self.in_string:
+                if i < self.escape_end:
+                    continue
+                if char == '\\':
+                    self.escape_end = i + 2
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    candidate = self.text[self.start:i + 1]
+                    try:
+                        parsed = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        parsed = None
+                    if isinstance(parsed, dict):
+                        self.result = parsed
+                        self.object_text = candidate
+                        self.text = self.text[:i + 1]
+                        return candidate
+                    # 不是合法对象（如说明文字中的花括号），从下一个字符继续寻找
+                    self.start = None
+        return None
+
+def _match_braces(text: str, start: int):
+    """从 start 处的 { 开始按字符串和花括号配对扫描
+
+    Returns:
+        (end, spans): 配对的 } 之后的位置（未闭合时为 None），
+        以及其中已闭合的最外层子对象 [(start, end), ...]
+    """
+    starts = [start]
+    spans = []
+    in_string = False
+    escape_end = -1  # 被转义字符之后的位置
+
+    for match in _STRUCTURAL.finditer(text, start + 1):
+        i = match.start()
+        char = text[i]
+        if in_string:
+            if i < escape_end:
+                continue
+            if char == '\\':
+                escape_end = i + 2
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            starts.append(i)
+        elif char == '}':
+            opened = starts.pop()
+            if not starts:
+                return i + 1, spans
+            # 新闭合的对象包含之前记录的、起点在它之后的子对象
+            while spans and spans[-1][0] > opened:
+                spans.pop()
+            spans.append((opened, i + 1))
+    return None, spans
+
+def iter_json_objects(text: str) -> Iterator[Dict[str, Any]]:
+    """单次扫描文本，按出现顺序生成其中可解析的 JSON 对象
+
+    每个可能是对象开头的 {（后面紧跟引号或 }）先交给 json 的 raw_decode 直接解析
+    （C 实现，合法对象无需逐字符扫描）；解析失败时按字符串和花括号配对跳过这个候选
+    （字符串中的花括号不影响配对），并尝试其中已闭合的最外层子对象，
+    例如多了结尾逗号的外层对象、被截断的外层对象。
+    解析失败总是发生在候选范围之内，每个字符最多被扫描常数次，整体为 O(n)。
+    """
+    pos = 0
+    while True:
+        match = _OBJECT_START.search(text, pos)
+        if match is None:
+            return
+        start = match.start()
+        try:
+            parsed, end = _DECODER.raw_decode(text, start)
+        except json.JSONDecodeError:
+            parsed = None
+        if parsed is not None:
+            yield parsed
+            pos = end
+            continue
+
+        end, spans = _match_braces(text, start)
+        for span_start, span_end in spans:
+            try:
+                yield json.loads(text[span_start:span_end])
+            except json.JSONDecodeError:
+                continue
+        if end is None:
+            return
+        pos = end
+
+def extract_json_object(text: str, prefer_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """从模型输出中提取第一个可解析的 JSON 对象
+
+    Args:
+        text: 模型输出文本（可包含说明文字、代码块标记等）
+        prefer_key: 优先返回包含该字段的对象（如分析结果的 task）
+
+    Returns:
+        解析后的字典，找不到时返回 None
+    """
+    first = None
+    for parsed in iter_json_objects(text):
+        if prefer_key is None or prefer_key in parsed:
+            return parsed
+        if first is None:
+            first = parsed
+    return first
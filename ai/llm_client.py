@@ -3,11 +3,58 @@ LLM 客户端模块 - V3 版本
 支持多种 LLM 提供商、自定义配置和本地模型
 """
 
+import copy
 import requests
 import json
 import os
+import sys
+import time
+import threading
+from datetime import datetime
 from typing import Dict, Any, Optional
 
+from memory.database import record_llm_usage
+from metrics import (LLM_COST, LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_STREAMS, LLM_TOKENS, LLM_USAGE_ESTIMATED,
+                     LOCAL_MODEL_LOAD_SECONDS, LOCAL_MODEL_RSS_BYTES)
+from .json_scan import JsonObjectScanner
+from .local_cache import PrefixStateCache
+from .prompts import ANALYSIS_SYSTEM_PROMPT
+from .schema import ANALYSIS_GBNF, ANALYSIS_GEMINI_SCHEMA, ANALYSIS_MAX_TOKENS, ANALYSIS_RESPONSE_FORMAT
+from .usage import estimate_cost
+
+# 结构化输出被拒绝时的降级顺序，None 表示普通输出
+STRUCTURED_FALLBACK = {'json_schema': 'json_object', 'json_object': None, 'gemini': None}
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的令牌数：ASCII 约 4 个字符一个令牌，中文等其他字符约一个字符一个令牌"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def _payload_text(payload: Dict[str, Any]) -> str:
+    """请求体中发送给模型的全部文本（OpenAI 兼容的 messages，或 Gemini 的 contents 和 systemInstruction）"""
+    texts = [message.get('content') or '' for message in payload.get('messages') or []]
+    for content in (payload.get('systemInstruction'), *(payload.get('contents') or [])):
+        texts.extend(part.get('text', '') for part in (content or {}).get('parts') or [])
+    return '\n'.join(texts)
+
+def resident_memory_bytes() -> Optional[int]:
+    """当前进程的常驻内存（字节）
+
+    Linux 读取 /proc/self/statm；其他平台退回到 resource 报告的峰值，都不可用时返回 None
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss 在 macOS 上为字节，其他平台为 KB
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
 class LLMClient:
     """统一的LLM客户端，支持多种提供商"""
     
@@ -15,6 +62,12 @@ class LLMClient:
         self.config = config
         self.llm_config = self._parse_config()
         self.local_model = None  # 用于缓存本地模型实例
+        self.local_grammar = None  # 用于缓存分析结果的约束解码语法
+        self.local_prefix_cache = None  # 用于缓存系统提示词的 KV 状态
+        self.local_worker = None  # 独立的本地推理工作进程（启用时）
+        self.local_lock = threading.Lock()  # 本地模型的加载和推理串行进行（预加载在后台线程中）
+        self.local_load_info = None  # 本地模型的加载耗时和常驻内存
+        self.structured_rejected = set()  # 服务端拒绝过的结构化输出方式，之后直接使用降级后的方式
         
     def _parse_config(self) -> Dict[str, Any]:
         """解析配置，支持新旧格式"""
@@ -35,6 +88,17 @@ class LLMClient:
                     'gpu_layers': local_config.get('gpu_layers', 0),
                     'n_threads': local_config.get('n_threads', None),
                     'verbose': local_config.get('verbose', False),
+                    'use_mmap': local_config.get('use_mmap', True),
+                    'use_mlock': local_config.get('use_mlock', False),
+                    'n_batch': local_config.get('n_batch', 512),
+                    'n_threads_batch': local_config.get('n_threads_batch', None),
+                    'flash_attn': local_config.get('flash_attn', False),
+                    'preload': local_config.get('preload', True),
+                    'warmup': local_config.get('warmup', True),
+                    'grammar': local_config.get('grammar', True),
+                    'prefix_cache': local_config.get('prefix_cache', True),
+                    'prefix_cache_persist': local_config.get('prefix_cache_persist', True),
+                    'worker': local_config.get('worker', {}),
                     'parameters': {
                         'temperature': local_config.get('temperature', 0.7),
                         'max_tokens': local_config.get('max_tokens', 1000),
@@ -52,6 +116,8 @@ class LLMClient:
                     'headers': llm_config['custom'].get('headers', {}),
                     'payload_format': llm_config['custom'].get('payload_format', 'openai'),
                     'response_format': llm_config['custom'].get('response_format', 'openai'),
+                    'structured_output': llm_config['custom'].get('structured_output', 'none'),
+                    'stream': llm_config['custom'].get('stream', False),
                     'timeout': llm_config['custom'].get('timeout', 30),
                     'parameters': llm_config.get('parameters', {})
                 }
@@ -68,6 +134,8 @@ class LLMClient:
                     'provider': provider,
                     'api_key': api_key,
                     'parameters': llm_config.get('parameters', {}),
+                    'structured_output': llm_config.get('structured_output', True),
+                    'stream': llm_config.get('stream', True),
                     'timeout': 30
                 }
         else:
@@ -81,30 +149,282 @@ class LLMClient:
             
             return {
                 'provider': provider,
-                'api_key': api_key,                'parameters': {},
+                'api_key': api_key,
+                'parameters': {},
+                'structured_output': True,
                 'timeout': 30
             }
     
-    def generate(self, prompt: str) -> Dict[str, Any]:
-        """生成回复"""
+    def generate(self, prompt: str, structured: bool = False, system: Optional[str] = None) -> Dict[str, Any]:
+        """生成回复
+        
+        Args:
+            prompt: 提示词（有系统提示词时为用户消息）
+            structured: 是否要求输出符合分析结果结构的 JSON（提供商支持时启用约束解码）
+            system: 静态系统提示词，单独发送以便提供商复用前缀缓存
+        """
+        provider = self.llm_config['provider']
+        started = time.perf_counter()
+        result = self._dispatch(prompt, structured, system)
+        elapsed = time.perf_counter() - started
+        
+        # 记录调用指标
+        LLM_REQUEST_SECONDS.observe(elapsed, provider=provider)
+        LLM_REQUESTS.inc(provider=provider, status='success' if result.get('success') else 'error')
+        usage = result.get('usage') or {}
+        if usage.get('estimated'):
+            LLM_USAGE_ESTIMATED.inc(provider=provider)
+        if usage.get('prompt_tokens'):
+            LLM_TOKENS.inc(usage['prompt_tokens'], provider=provider, type='prompt')
+        if usage.get('completion_tokens'):
+            LLM_TOKENS.inc(usage['completion_tokens'], provider=provider, type='completion')
+        if usage.get('cached_tokens'):
+            LLM_TOKENS.inc(usage['cached_tokens'], provider=provider, type='cached')
+        
+        # 累加到数据库中的每日用量汇总
+        cost = estimate_cost(self.config, provider, usage)
+        if cost:
+            LLM_COST.inc(cost, provider=provider)
+        record_llm_usage(
+            provider,
+            result.get('status', 'ok' if result.get('success') else 'error'),
+            bool(result.get('success')),
+            usage=usage,
+            latency=elapsed,
+            retries=result.get('retries', 0),
+            cost=cost
+        )
+        
+        result['provider'] = provider
+        result['latency'] = elapsed
+        result['cost'] = cost
+        return result
+    
+    def _dispatch(self, prompt: str, structured: bool = False, system: Optional[str] = None) -> Dict[str, Any]:
+        """按提供商分发请求"""
         try:
             if self.llm_config['provider'] == 'local':
-                return self._call_local(prompt)
-            elif self.llm_config['provider'] == 'gemini':
-                return self._call_gemini(prompt)
-            elif self.llm_config['provider'] == 'deepseek':
-                return self._call_deepseek(prompt)
-            elif self.llm_config['provider'] == 'openai':
-                return self._call_openai(prompt)
-            elif self.llm_config['provider'] == 'custom':
-                return self._call_custom(prompt)
-            else:
-                return {"error": f"不支持的提供商: {self.llm_config['provider']}"}
+                return self._call_local(prompt, structured, system)
+            
+            mode = self._structured_mode() if structured else None
+            result = self._call_cloud(prompt, mode, system)
+            
+            # 部分模型不支持结构化输出参数，逐级降级（json_schema → json_object → 普通输出）并记住
+            # 只有错误信息指向 response_format 等参数时才降级，密钥错误等其他 400 不影响之后的请求
+            retries = 0
+            while mode is not None and self._rejects_structured_output(result):
+                self.structured_rejected.add(mode)
+                mode = self._structured_mode()
+                print(f"⚠️ {self.llm_config['provider']} 不支持当前的结构化输出方式，已降级为 {mode or '普通输出'}")
+                result = self._call_cloud(prompt, mode, system)
+                retries += 1
+            if retries:
+                result['retries'] = retries
+            return result
                 
         except Exception as e:
             return {"error": f"LLM调用失败: {str(e)}"}
     
-    def _call_gemini(self, prompt: str) -> Dict[str, Any]:
+    def _call_cloud(self, prompt: str, mode: Optional[str] = None, system: Optional[str] = None) -> Dict[str, Any]:
+        """调用在线提供商"""
+        if self.llm_config['provider'] == 'gemini':
+            return self._call_gemini(prompt, mode, system)
+        elif self.llm_config['provider'] == 'deepseek':
+            return self._call_deepseek(prompt, mode, system)
+        elif self.llm_config['provider'] == 'openai':
+            return self._call_openai(prompt, mode, system)
+        elif self.llm_config['provider'] == 'custom':
+            return self._call_custom(prompt, mode, system)
+        else:
+            return {"error": f"不支持的提供商: {self.llm_config['provider']}"}
+    
+    @staticmethod
+    def _rejects_structured_output(result: Dict[str, Any]) -> bool:
+        """请求是否因结构化输出参数被拒绝（400 且错误信息提到 response_format 或 schema）"""
+        if result.get('status') != 400:
+            return False
+        raw = str(result.get('raw', '')).lower()
+        return any(word in raw for word in ('response_format', 'schema', 'json_object', 'responsemimetype'))
+    
+    def _structured_mode(self) -> Optional[str]:
+        """当前提供商可用的结构化输出方式（跳过服务端拒绝过的方式）
+        
+        Returns:
+            'gemini'（responseSchema）、'json_schema'、'json_object'，不支持或已禁用时为 None
+        """
+        mode = self._configured_structured_mode()
+        while mode is not None and mode in self.structured_rejected:
+            mode = STRUCTURED_FALLBACK.get(mode)
+        return mode
+    
+    def _configured_structured_mode(self) -> Optional[str]:
+        """配置和提供商决定的结构化输出方式"""
+        provider = self.llm_config['provider']
+        if provider == 'custom':
+            # 自定义端点需在配置中声明能力，且只支持 OpenAI 格式的请求体
+            mode = self.llm_config.get('structured_output') or 'none'
+            if mode not in ('json_schema', 'json_object') or self.llm_config.get('payload_format', 'openai') != 'openai':
+                return None
+            return mode
+        
+        if not self.llm_config.get('structured_output', True):
+            return None
+        if provider == 'gemini':
+            return 'gemini'
+        elif provider == 'openai':
+            return 'json_schema'
+        elif provider == 'deepseek':
+            # DeepSeek 仅支持 JSON 模式，字段由提示词约束
+            return 'json_object'
+        return None
+    
+    def _max_tokens(self, mode: Optional[str] = None) -> int:
+        """生成令牌上限，结构化输出时收紧以减少生成耗时"""
+        params = self.llm_config['parameters']
+        max_tokens = params.get('max_tokens', 1000)
+        if mode is not None:
+            max_tokens = min(max_tokens, params.get('structured_max_tokens', ANALYSIS_MAX_TOKENS))
+        return max_tokens
+    
+    @staticmethod
+    def _openai_response_format(mode: str) -> Dict[str, Any]:
+        """OpenAI 兼容接口的 response_format 参数"""
+        if mode == 'json_schema':
+            return ANALYSIS_RESPONSE_FORMAT
+        return {"type": "json_object"}
+    
+    @staticmethod
+    def _openai_messages(prompt: str, system: Optional[str] = None) -> list:
+        """构建 OpenAI 兼容格式的消息列表，系统提示词放在最前面作为可缓存的前缀"""
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    @staticmethod
+    def _openai_stream_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+        """OpenAI 兼容接口的流式请求体，要求在最后一个片段中附带用量统计"""
+        return dict(payload, stream=True, stream_options={"include_usage": True})
+    
+    @staticmethod
+    def _join_prompt(prompt: str, system: Optional[str] = None) -> str:
+        """不支持消息角色时，将系统提示词拼接在提示词之前"""
+        if system:
+            return f"{system}\n{prompt}"
+        return prompt
+    
+    @staticmethod
+    def _openai_usage(data: Dict[str, Any]) -> Dict[str, int]:
+        """提取 OpenAI 兼容格式的令牌用量"""
+        usage = data.get('usage') or {}
+        # OpenAI 在 prompt_tokens_details 中报告缓存命中，DeepSeek 使用 prompt_cache_hit_tokens
+        details = usage.get('prompt_tokens_details') or {}
+        cached_tokens = details.get('cached_tokens') or usage.get('prompt_cache_hit_tokens') or 0
+        return {
+            'prompt_tokens': usage.get('prompt_tokens', 0) or 0,
+            'completion_tokens': usage.get('completion_tokens', 0) or 0,
+            'cached_tokens': cached_tokens
+        }
+    
+    @staticmethod
+    def _gemini_usage(data: Dict[str, Any]) -> Dict[str, int]:
+        """提取 Gemini 格式的令牌用量"""
+        usage_metadata = data.get("usageMetadata") or {}
+        return {
+            'prompt_tokens': usage_metadata.get('promptTokenCount', 0) or 0,
+            'completion_tokens': usage_metadata.get('candidatesTokenCount', 0) or 0,
+            'cached_tokens': usage_metadata.get('cachedContentTokenCount', 0) or 0
+        }
+    
+    @staticmethod
+    def _openai_stream_chunk(data: Dict[str, Any]):
+        """解析 OpenAI 兼容格式的流式片段，返回 (文本增量, 用量)"""
+        text = ''.join((choice.get('delta') or {}).get('content') or '' for choice in data.get('choices') or [])
+        usage = LLMClient._openai_usage(data) if data.get('usage') else None
+        return text, usage
+    
+    @staticmethod
+    def _gemini_stream_chunk(data: Dict[str, Any]):
+        """解析 Gemini 流式片段，返回 (文本增量, 用量)"""
+        text = ''
+        for candidate in data.get('candidates') or []:
+            text += ''.join(part.get('text', '') for part in (candidate.get('content') or {}).get('parts') or [])
+        usage = LLMClient._gemini_usage(data) if data.get('usageMetadata') else None
+        return text, usage
+    
+    def _needs_exact_usage(self) -> bool:
+        """是否需要准确的用量：为该提供商配置了单价，或每日预算限制了令牌数或费用"""
+        usage_config = self.config.get('llm', {}).get('usage', {})
+        if (usage_config.get('pricing') or {}).get(self.llm_config['provider']):
+            return True
+        budget = usage_config.get('daily_budget') or {}
+        return bool(budget.get('tokens') or budget.get('cost'))
+    
+    def _post_stream(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], label: str,
+                     parse_chunk, mode: Optional[str] = None) -> Dict[str, Any]:
+        """发送流式请求（SSE），分析结果 JSON 对象一闭合就关闭连接，不再接收后续内容
+        
+        最终的用量统计在最后的片段中。需要准确用量（配置了单价或令牌/费用预算）时，
+        对象闭合后继续读完响应；否则提前关闭，收不到用量时按请求和输出文本估算并标记为 estimated
+        """
+        exact_usage = self._needs_exact_usage()
+        response = requests.post(
+            url,
+            headers=headers,
+            json=payload,
+            timeout=self.llm_config['timeout'],
+            stream=True
+        )
+        
+        try:
+            if response.status_code != 200:
+                return {"error": f"{label} API请求失败: {response.status_code}", "raw": response.text, "status": response.status_code}
+            
+            scanner = JsonObjectScanner()
+            usage = None
+            finished = False
+            for line in response.iter_lines():
+                # SSE 每个事件为 "data: {...}"，其余行（注释、空行、event 字段）忽略
+                if not line or not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    finished = True
+                    break
+                text, chunk_usage = parse_chunk(json.loads(data.decode('utf-8')))
+                if chunk_usage:
+                    usage = chunk_usage
+                if text and not scanner.complete:
+                    scanner.feed(text)
+                if scanner.complete and not exact_usage:
+                    break
+            else:
+                finished = True
+        finally:
+            response.close()
+        
+        if scanner.complete and not finished:
+            LLM_STREAMS.inc(provider=self.llm_config['provider'], result='early_close')
+        else:
+            LLM_STREAMS.inc(provider=self.llm_config['provider'], result='completed')
+        
+        if not scanner.complete and not scanner.text:
+            return {"error": f"{label} 流式响应为空"}
+        text = scanner.object_text if scanner.complete else scanner.text
+        if usage is None:
+            # 提前关闭时收不到最后的用量统计，按请求和输出文本估算（无法得知缓存命中）
+            usage = {
+                'prompt_tokens': estimate_tokens(_payload_text(payload)),
+                'completion_tokens': estimate_tokens(text),
+                'cached_tokens': 0,
+                'estimated': True
+            }
+        
+        return {"success": True, "text": text, "usage": usage, "structured": mode is not None, "streamed": True,
+                "status": response.status_code}
+    
+    def _call_gemini(self, prompt: str, mode: Optional[str] = None, system: Optional[str] = None) -> Dict[str, Any]:
         """调用 Gemini API"""
         api_key = self.llm_config.get('api_key')
         if not api_key:
@@ -116,13 +436,22 @@ class LLMClient:
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {
                 "temperature": self.llm_config['parameters'].get('temperature', 0.7),
-                "maxOutputTokens": self.llm_config['parameters'].get('max_tokens', 1000),
+                "maxOutputTokens": self._max_tokens(mode),
                 "topP": self.llm_config['parameters'].get('top_p', 0.9)
             }
         }
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+        if mode is not None:
+            payload["generationConfig"]["responseMimeType"] = "application/json"
+            payload["generationConfig"]["responseSchema"] = ANALYSIS_GEMINI_SCHEMA
         
         headers = {"Content-Type": "application/json"}
         
+        if self.llm_config.get('stream', False):
+            stream_url = url.replace(":generateContent?", ":streamGenerateContent?alt=sse&")
+            return self._post_stream(stream_url, headers, payload, "Gemini", self._gemini_stream_chunk, mode)
+        
         response = requests.post(
             url, 
             headers=headers, 
@@ -133,11 +462,11 @@ class LLMClient:
         if response.status_code == 200:
             data = response.json()
             text = data["candidates"][0]["content"]["parts"][0]["text"]
-            return {"success": True, "text": text}
+            return {"success": True, "text": text, "usage": self._gemini_usage(data), "structured": mode is not None, "status": response.status_code}
         else:
-            return {"error": f"Gemini API请求失败: {response.status_code}", "raw": response.text}
+            return {"error": f"Gemini API请求失败: {response.status_code}", "raw": response.text, "status": response.status_code}
     
-    def _call_deepseek(self, prompt: str) -> Dict[str, Any]:
+    def _call_deepseek(self, prompt: str, mode: Optional[str] = None, system: Optional[str] = None) -> Dict[str, Any]:
         """调用 DeepSeek API"""
         api_key = self.llm_config.get('api_key')
         if not api_key:
@@ -147,17 +476,22 @@ class LLMClient:
         
         payload = {
             "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._openai_messages(prompt, system),
             "temperature": self.llm_config['parameters'].get('temperature', 0.7),
-            "max_tokens": self.llm_config['parameters'].get('max_tokens', 1000),
+            "max_tokens": self._max_tokens(mode),
             "top_p": self.llm_config['parameters'].get('top_p', 0.9)
         }
+        if mode is not None:
+            payload["response_format"] = self._openai_response_format(mode)
         
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {api_key}"
         }
         
+        if self.llm_config.get('stream', False):
+            return self._post_stream(url, headers, self._openai_stream_payload(payload), "DeepSeek", self._openai_stream_chunk, mode)
+        
         response = requests.post(
             url, 
             headers=headers, 
@@ -168,11 +502,11 @@ class LLMClient:
         if response.status_code == 200:
             data = response.json()
             text = data['choices'][0]['message']['content']
-            return {"success": True, "text": text}
+            return {"success": True, "text": text, "usage": self._openai_usage(data), "structured": mode is not None, "status": response.status_code}
         else:
-            return {"error": f"DeepSeek API请求失败: {response.status_code}", "raw": response.text}
+            return {"error": f"DeepSeek API请求失败: {response.status_code}", "raw": response.text, "status": response.status_code}
     
-    def _call_openai(self, prompt: str) -> Dict[str, Any]:
+    def _call_openai(self, prompt: str, mode: Optional[str] = None, system: Optional[str] = None) -> Dict[str, Any]:
         """调用 OpenAI API"""
         api_key = self.llm_config.get('api_key')
         if not api_key:
@@ -181,18 +515,24 @@ class LLMClient:
         url = "https://api.openai.com/v1/chat/completions"
         
         payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": [{"role": "user", "content": prompt}],
+            # 默认的 json_schema 结构化输出需要 gpt-4o-mini 及之后的模型
+            "model": "gpt-4o-mini",
+            "messages": self._openai_messages(prompt, system),
             "temperature": self.llm_config['parameters'].get('temperature', 0.7),
-            "max_tokens": self.llm_config['parameters'].get('max_tokens', 1000),
+            "max_tokens": self._max_tokens(mode),
             "top_p": self.llm_config['parameters'].get('top_p', 0.9)
         }
+        if mode is not None:
+            payload["response_format"] = self._openai_response_format(mode)
         
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {api_key}"
         }
         
+        if self.llm_config.get('stream', False):
+            return self._post_stream(url, headers, self._openai_stream_payload(payload), "OpenAI", self._openai_stream_chunk, mode)
+        
         response = requests.post(
             url, 
             headers=headers, 
@@ -203,11 +543,11 @@ class LLMClient:
         if response.status_code == 200:
             data = response.json()
             text = data['choices'][0]['message']['content']
-            return {"success": True, "text": text}
+            return {"success": True, "text": text, "usage": self._openai_usage(data), "structured": mode is not None, "status": response.status_code}
         else:
-            return {"error": f"OpenAI API请求失败: {response.status_code}", "raw": response.text}
+            return {"error": f"OpenAI API请求失败: {response.status_code}", "raw": response.text, "status": response.status_code}
     
-    def _call_custom(self, prompt: str) -> Dict[str, Any]:
+    def _call_custom(self, prompt: str, mode: Optional[str] = None, system: Optional[str] = None) -> Dict[str, Any]:
         """调用自定义 API"""
         url = self.llm_config.get('url')
         if not url:
@@ -224,19 +564,26 @@ class LLMClient:
         if payload_format == 'openai':
             payload = {
                 "model": self.llm_config.get('model', 'gpt-3.5-turbo'),
-                "messages": [{"role": "user", "content": prompt}],
+                "messages": self._openai_messages(prompt, system),
                 "temperature": self.llm_config['parameters'].get('temperature', 0.7),
-                "max_tokens": self.llm_config['parameters'].get('max_tokens', 1000),
+                "max_tokens": self._max_tokens(mode),
                 "top_p": self.llm_config['parameters'].get('top_p', 0.9)
             }
+            if mode is not None:
+                payload["response_format"] = self._openai_response_format(mode)
         else:
             # 自定义格式，用户需要在配置中定义
             payload = {
-                "prompt": prompt,
+                "prompt": self._join_prompt(prompt, system),
                 "model": self.llm_config.get('model'),
-                **self.llm_config['parameters']
+                **{key: value for key, value in self.llm_config['parameters'].items() if key != 'structured_max_tokens'}
             }
         
+        # 流式读取只支持 OpenAI 格式的请求和响应
+        if (self.llm_config.get('stream', False) and payload_format == 'openai'
+                and self.llm_config.get('response_format', 'openai') == 'openai'):
+            return self._post_stream(url, headers, self._openai_stream_payload(payload), "自定义", self._openai_stream_chunk, mode)
+        
         response = requests.post(
             url, 
             headers=headers, 
@@ -257,15 +604,36 @@ class LLMClient:
                 text = data.get('text') or data.get('content') or data.get('response')
                 if not text:
                     return {"error": "无法解析自定义API响应", "raw": data}            
-            return {"success": True, "text": text}
+            return {"success": True, "text": text, "usage": self._openai_usage(data), "structured": mode is not None, "status": response.status_code}
         else:
-            return {"error": f"自定义API请求失败: {response.status_code}", "raw": response.text}
+            return {"error": f"自定义API请求失败: {response.status_code}", "raw": response.text, "status": response.status_code}
+    
+    def _call_local(self, prompt: str, structured: bool = False, system: Optional[str] = None) -> Dict[str, Any]:
+        """调用本地 GGUF 模型（启用工作进程时转发到工作进程）"""
+        worker_config = self.llm_config.get('worker') or {}
+        if not worker_config.get('enabled', False):
+            return self._run_local(prompt, structured, system)
+        
+        self._ensure_local_worker()
+        return self.local_worker.generate(prompt, structured, system)
     
-    def _call_local(self, prompt: str) -> Dict[str, Any]:
-        """调用本地 GGUF 模型"""
+    def _ensure_local_worker(self):
+        """创建本地推理工作进程的管理器（首次使用时）"""
+        if self.local_worker is None:
+            from .local_worker import LocalInferenceWorker
+            worker_config = self.llm_config.get('worker') or {}
+            self.local_worker = LocalInferenceWorker(
+                self.config,
+                queue_size=worker_config.get('queue_size', 4),
+                timeout=worker_config.get('timeout', 120),
+                load_timeout=worker_config.get('load_timeout', 900)
+            )
+    
+    def _run_local(self, prompt: str, structured: bool = False, system: Optional[str] = None) -> Dict[str, Any]:
+        """在当前进程中运行本地 GGUF 模型"""
         try:
             # 延迟导入 llama-cpp-python，避免在不使用本地模型时的依赖问题
-            from llama_cpp import Llama
+            from llama_cpp import Llama, LlamaGrammar
         except ImportError:
             return {
                 "error": "llama-cpp-python 未安装",
@@ -285,45 +653,326 @@ class LLMClient:
             return {"error": f"本地模型文件不存在: {model_path}"}
         
         try:
-            # 如果模型还未加载，则加载模型
-            if self.local_model is None:
-                print(f"🤖 正在加载本地模型: {os.path.basename(model_path)}")
-                self.local_model = Llama(
-                    model_path=model_path,
-                    n_ctx=self.llm_config.get('context_length', 2048),
-                    n_gpu_layers=self.llm_config.get('gpu_layers', 0),
-                    n_threads=self.llm_config.get('n_threads', None),
-                    verbose=self.llm_config.get('verbose', False)
-                )
-                print(f"✅ 本地模型加载成功")
-              # 生成回复
-            params = self.llm_config.get('parameters', {})
-            response = self.local_model(
-                prompt,
-                max_tokens=params.get('max_tokens', 1000),
-                temperature=params.get('temperature', 0.7),
-                top_p=params.get('top_p', 0.9),
-                top_k=params.get('top_k', 40),
-                repeat_penalty=params.get('repeat_penalty', 1.1),
-                stop=["</s>", "<|im_end|>", "<|endoftext|>", "\n\n", "```", "---"]  # 扩展停止标记，避免过度生成
-            )
-            
-            # 提取生成的文本
-            if isinstance(response, dict) and 'choices' in response:
-                text = response['choices'][0]['text'].strip()
-            else:
-                text = str(response).strip()
-            
-            return {"success": True, "text": text}
-            
+            with self.local_lock:
+                return self._generate_local(Llama, LlamaGrammar, prompt, structured, system)
         except Exception as e:
             return {"error": f"本地模型调用失败: {str(e)}"}
     
-    def get_provider_info(self) -> Dict[str, Any]:
-        """获取当前提供商信息"""
+    def _llama_options(self) -> Dict[str, Any]:
+        """创建 Llama 实例的参数（未配置的可选项不传，兼容较旧的 llama-cpp-python）"""
+        options = {
+            'model_path': self.llm_config.get('model_path'),
+            'n_ctx': self.llm_config.get('context_length', 2048),
+            'n_gpu_layers': self.llm_config.get('gpu_layers', 0),
+            'n_threads': self.llm_config.get('n_threads', None),
+            'n_batch': self.llm_config.get('n_batch', 512),
+            # mmap 按需读取模型文件，启动快、可与其他进程共享页缓存；mlock 锁定内存，避免被换出
+            'use_mmap': self.llm_config.get('use_mmap', True),
+            'use_mlock': self.llm_config.get('use_mlock', False),
+            'verbose': self.llm_config.get('verbose', False)
+        }
+        # 预填充（提示词处理）使用的线程数，默认与 n_threads 相同
+        if self.llm_config.get('n_threads_batch'):
+            options['n_threads_batch'] = self.llm_config['n_threads_batch']
+        if self.llm_config.get('flash_attn'):
+            options['flash_attn'] = True
+        return options
+    
+    def _load_local_model(self, Llama):
+        """加载本地模型并记录加载耗时和常驻内存（调用方需持有 self.local_lock）"""
+        model_path = self.llm_config.get('model_path')
+        print(f"🤖 正在加载本地模型: {os.path.basename(model_path)}")
+        started = time.perf_counter()
+        self.local_model = Llama(**self._llama_options())
+        load_seconds = time.perf_counter() - started
+        
+        self.local_load_info = {
+            'model': os.path.basename(model_path),
+            'load_seconds': round(load_seconds, 3),
+            'warmup_seconds': None,
+            'rss_bytes': resident_memory_bytes(),
+            'loaded_at': datetime.now().isoformat(),
+            'options': {key: value for key, value in self._llama_options().items() if key != 'model_path'}
+        }
+        LOCAL_MODEL_LOAD_SECONDS.set(load_seconds)
+        self._report_local_memory()
+        print(f"✅ 本地模型加载成功（耗时 {load_seconds:.2f} 秒{self._format_rss()}）")
+    
+    def _report_local_memory(self):
+        """更新常驻内存记录和指标"""
+        rss = resident_memory_bytes()
+        if rss is not None:
+            self.local_load_info['rss_bytes'] = rss
+            LOCAL_MODEL_RSS_BYTES.set(rss)
+    
+    def _format_rss(self) -> str:
+        rss = self.local_load_info.get('rss_bytes') if self.local_load_info else None
+        return f"，常驻内存 {rss / 1024 / 1024:.0f} MB" if rss else ""
+    
+    def _restore_local_prefix(self, system: str):
+        """恢复系统提示词的 KV 状态，只需预填充事件相关的后缀"""
+        if self.local_prefix_cache is None:
+            self.local_prefix_cache = PrefixStateCache(
+                self.llm_config.get('model_path'),
+                self.llm_config.get('context_length', 2048),
+                persist=self.llm_config.get('prefix_cache_persist', True)
+            )
+        try:
+            self.local_prefix_cache.restore(self.local_model, system)
+        except Exception as e:
+            # 前缀缓存只是加速手段，失败时按完整提示词生成
+            print(f"⚠️ 前缀状态缓存不可用: {e}")
+            self.local_model.reset()
+    
+    def preload_local(self) -> Optional[Dict[str, Any]]:
+        """预加载并预热本地模型（启用工作进程时在工作进程中进行）
+        
+        预热会预填充系统提示词（启用前缀缓存时同时生成前缀状态）并生成一个令牌，
+        使模型权重读入内存、计算缓冲区分配完毕，首个事件无需等待
+        
+        Returns:
+            加载信息（耗时、常驻内存等），失败时为 {'error': ...}
+        """
+        if self.llm_config['provider'] != 'local':
+            return None
+        worker_config = self.llm_config.get('worker') or {}
+        if worker_config.get('enabled', False):
+            self._ensure_local_worker()
+            return self.local_worker.preload()
+        return self._preload_in_process()
+    
+    def _preload_in_process(self) -> Dict[str, Any]:
+        """在当前进程中预加载并预热本地模型"""
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            return {"error": "llama-cpp-python 未安装"}
+        model_path = self.llm_config.get('model_path')
+        if not model_path or not os.path.exists(model_path):
+            return {"error": f"本地模型文件不存在: {model_path}"}
+        
+        try:
+            with self.local_lock:
+                if self.local_model is None:
+                    self._load_local_model(Llama)
+                if self.llm_config.get('warmup', True) and self.local_load_info.get('warmup_seconds') is None:
+                    started = time.perf_counter()
+                    system = ANALYSIS_SYSTEM_PROMPT
+                    if self.llm_config.get('prefix_cache', True):
+                        self._restore_local_prefix(system)
+                    self.local_model(self._join_prompt("标题: 预热", system), max_tokens=1)
+                    warmup_seconds = time.perf_counter() - started
+                    self.local_load_info['warmup_seconds'] = round(warmup_seconds, 3)
+                    self._report_local_memory()
+                    print(f"🔥 本地模型预热完成（耗时 {warmup_seconds:.2f} 秒{self._format_rss()}）")
+                return dict(self.local_load_info)
+        except Exception as e:
+            return {"error": f"本地模型预加载失败: {str(e)}"}
+    
+    def _generate_local(self, Llama, LlamaGrammar, prompt: str, structured: bool, system: Optional[str]) -> Dict[str, Any]:
+        """加载（首次）并运行本地模型生成回复（调用方需持有 self.local_lock）"""
+        # 如果模型还未加载，则加载模型（通常已在启动时预加载）
+        if self.local_model is None:
+            self._load_local_model(Llama)
+        
+        if system and self.llm_config.get('prefix_cache', True):
+            self._restore_local_prefix(system)
+        
+        # 约束解码：输出必然是合法的分析结果 JSON，对象闭合后立即停止
+        grammar = None
+        if structured and self.llm_config.get('grammar', True):
+            if self.local_grammar is None:
+                self.local_grammar = LlamaGrammar.from_string(ANALYSIS_GBNF, verbose=self.llm_config.get('verbose', False))
+            grammar = self.local_grammar
+        
+        if grammar is not None:
+            # 语法保证字符串内没有未转义的换行，只保留模型的结束标记
+            stop = ["</s>", "<|im_end|>", "<|endoftext|>"]
+        else:
+            stop = ["</s>", "<|im_end|>", "<|endoftext|>", "\n\n", "```", "---"]  # 扩展停止标记，避免过度生成
+        
+        # 生成回复（系统提示词在前，相同的前缀可复用 KV 缓存）
+        params = self.llm_config.get('parameters', {})
+        response = self.local_model(
+            self._join_prompt(prompt, system),
+            max_tokens=params.get('max_tokens', 1000),
+            temperature=params.get('temperature', 0.7),
+            top_p=params.get('top_p', 0.9),
+            top_k=params.get('top_k', 40),
+            repeat_penalty=params.get('repeat_penalty', 1.1),
+            stop=stop,
+            grammar=grammar
+        )
+        
+        # 提取生成的文本
+        usage = {}
+        if isinstance(response, dict) and 'choices' in response:
+            text = response['choices'][0]['text'].strip()
+            usage = self._openai_usage(response)
+        else:
+            text = str(response).strip()
+        
+        return {"success": True, "text": text, "usage": usage, "structured": grammar is not None}
+    
+    def close(self):
+        """释放客户端持有的资源（停止本地推理工作进程）"""
+        if self.local_worker is not None:
+            self.local_worker.stop()
+            self.local_worker = None
+    
+    def get_provider_info(self, provider: Optional[str] = None) -> Dict[str, Any]:
+        """获取当前提供商信息（provider 参数用于兼容故障转移客户端的接口）"""
         return {
             "provider": self.llm_config['provider'],
             "model": self.llm_config.get('model', 'N/A'),
             "url": self.llm_config.get('url', 'N/A'),
             "parameters": self.llm_config.get('parameters', {})
         }
+
+
+def build_provider_config(config: Dict[str, Any], entry) -> Dict[str, Any]:
+    """根据故障转移列表中的一项生成单个提供商的配置
+
+    Args:
+        config: 全局配置
+        entry: 提供商名称（如 "deepseek"、"local"、"custom"），
+            或包含 provider 以及可选 api_key/parameters/custom 的字典（custom 覆盖 llm.custom 中的字段）
+    """
+    if isinstance(entry, str):
+        entry = {'provider': entry}
+
+    provider_config = copy.deepcopy(config)
+    llm_config = provider_config.setdefault('llm', {})
+    llm_config.pop('failover', None)
+    local_config = llm_config.setdefault('local', {})
+    custom_config = llm_config.setdefault('custom', {})
+
+    provider = entry.get('provider')
+    local_config['enabled'] = provider == 'local'
+    custom_config['enabled'] = provider == 'custom'
+    if provider == 'custom' and entry.get('custom'):
+        custom_config.update(entry['custom'])
+    if provider not in ('local', 'custom'):
+        llm_config['provider'] = provider
+        if entry.get('api_key'):
+            llm_config['api_key'] = entry['api_key']
+    if entry.get('parameters'):
+        llm_config['parameters'] = entry['parameters']
+    return provider_config
+
+# 进程内共享的客户端，避免每个事件都重新创建（本地模型会被重复加载）
+_shared_client = None
+_shared_fingerprint = None
+_shared_lock = threading.Lock()
+
+# 级联模式的低成本客户端
+_cascade_client = None
+_cascade_fingerprint = None
+
+def _llm_fingerprint(config: Dict[str, Any]) -> str:
+    """LLM 相关配置的指纹，用于判断是否需要重建客户端"""
+    relevant = {key: config.get(key) for key in ('llm', 'model', 'api_key')}
+    return json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+
+def create_client(config: Dict[str, Any]):
+    """按配置创建 LLM 客户端：启用故障转移时返回 FailoverLLMClient"""
+    if config.get('llm', {}).get('failover', {}).get('enabled', False):
+        from .failover import FailoverLLMClient
+        return FailoverLLMClient(config)
+    return LLMClient(config)
+
+def get_shared_client(config: Dict[str, Any]) -> LLMClient:
+    """获取共享的 LLM 客户端，LLM 相关配置变化（如热加载）时自动重建"""
+    global _shared_client, _shared_fingerprint
+    fingerprint = _llm_fingerprint(config)
+    with _shared_lock:
+        if _shared_client is None or fingerprint != _shared_fingerprint:
+            if _shared_client is not None:
+                print("🔄 LLM 配置已变化，重建LLM客户端")
+                _shared_client.close()
+            _shared_client = create_client(config)
+            _shared_fingerprint = fingerprint
+        return _shared_client
+
+def get_cascade_client(config: Dict[str, Any]) -> Optional[LLMClient]:
+    """获取级联模式的低成本客户端（llm.cascade.tier），未启用级联时返回 None"""
+    global _cascade_client, _cascade_fingerprint
+    cascade_config = config.get('llm', {}).get('cascade', {})
+    fingerprint = _llm_fingerprint(config)
+    with _shared_lock:
+        if not cascade_config.get('enabled', False):
+            if _cascade_client is not None:
+                _cascade_client.close()
+                _cascade_client = None
+            return None
+        if _cascade_client is None or fingerprint != _cascade_fingerprint:
+            if _cascade_client is not None:
+                _cascade_client.close()
+            _cascade_client = LLMClient(build_provider_config(config, cascade_config.get('tier', 'local')))
+            _cascade_fingerprint = fingerprint
+        return _cascade_client
+
+def _local_workers() -> list:
+    """共享客户端和级联客户端中已启动的本地推理工作进程"""
+    clients = [client for client in (_shared_client, _cascade_client) if client is not None]
+    return [client.local_worker for client in clients if client.local_worker is not None]
+
+def get_local_worker_status() -> Optional[Dict[str, Any]]:
+    """获取本地推理工作进程状态，未启用时返回 None"""
+    workers = _local_workers()
+    if not workers:
+        return None
+    return workers[0].get_status()
+
+def get_llm_health() -> Optional[list]:
+    """获取共享客户端各提供商的健康状态，未启用故障转移时返回 None"""
+    client = _shared_client
+    if client is None or not hasattr(client, 'get_health'):
+        return None
+    return client.get_health()
+
+def preload_local_models(config: Dict[str, Any]) -> list:
+    """预加载并预热共享客户端和级联客户端中的本地模型（llm.local.preload）
+
+    Returns:
+        各本地模型的加载信息
+    """
+    clients = [get_shared_client(config), get_cascade_client(config)]
+    results = []
+    for client in clients:
+        if client is None:
+            continue
+        # 故障转移客户端中可能包含本地模型
+        for member in getattr(client, 'clients', [client]):
+            if member.llm_config['provider'] == 'local' and member.llm_config.get('preload', True):
+                results.append(member.preload_local())
+    return results
+
+def get_local_model_status() -> Optional[Dict[str, Any]]:
+    """获取本地模型的加载信息（加载耗时、预热耗时、常驻内存），尚未加载时返回 None"""
+    for client in (_shared_client, _cascade_client):
+        if client is None:
+            continue
+        for member in getattr(client, 'clients', [client]):
+            if member.local_worker is not None and member.local_worker.model_info is not None:
+                return member.local_worker.model_info
+            if member.local_load_info is not None:
+                return member.local_load_info
+    return None
+
+def ensure_local_worker():
+    """巡检本地推理工作进程，意外退出时自动重启"""
+    for worker in _local_workers():
+        worker.ensure_running()
+
+def close_shared_client():
+    """关闭共享客户端和级联客户端（程序退出时调用）"""
+    global _shared_client, _shared_fingerprint, _cascade_client, _cascade_fingerprint
+    with _shared_lock:
+        for client in (_shared_client, _cascade_client):
+            if client is not None:
+                client.close()
+        _shared_client = None
+        _shared_fingerprint = None
+        _cascade_client = None
+        _cascade_fingerprint = None
@@ -0,0 +1,187 @@
+"""
+本地模型前缀 KV 状态缓存
+静态的系统提示词只需预填充一次，保存其 KV 状态（内存中，可选持久化到模型目录），
+之后每个事件恢复该状态，只需预填充很短的事件相关后缀
+"""
+
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+from typing import Any, Dict, List, Optional
+
+from metrics import LOCAL_PREFIX_CACHE
+
+# 状态文件格式：魔数、JSON 头长度（4 字节）、JSON 头、input_ids 和 scores（.npy，不允许 pickle）、llama_state 原始字节
+# 不使用 pickle，模型目录中被替换的状态文件最多导致恢复失败，不会执行任意代码
+STATE_FILE_MAGIC = b'CHRONA-PREFIX-STATE/1\n'
+
+def dump_state(state, f):
+    """将 llama_cpp.LlamaState 写入文件对象"""
+    import numpy as np
+
+    arrays = []
+    for array in (state.input_ids, state.scores):
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+        arrays.append(buffer.getvalue())
+    header = {
+        'n_tokens': int(state.n_tokens),
+        'llama_state_size': int(state.llama_state_size),
+        'seed': getattr(state, 'seed', None),
+        'sizes': [len(data) for data in arrays] + [len(state.llama_state)]
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    f.write(STATE_FILE_MAGIC)
+    f.write(struct.pack('<I', len(header_bytes)))
+    f.write(header_bytes)
+    for data in arrays:
+        f.write(data)
+    f.write(bytes(state.llama_state))
+
+def load_state(f):
+    """从文件对象读取 dump_state 写入的状态，格式不符时抛出 ValueError"""
+    import numpy as np
+    from llama_cpp import LlamaState
+
+    if f.read(len(STATE_FILE_MAGIC)) != STATE_FILE_MAGIC:
+        raise ValueError('不是前缀状态文件')
+    (header_size,) = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(header_size).decode('utf-8'))
+    input_size, scores_size, state_size = header['sizes']
+    input_ids = np.load(io.BytesIO(f.read(input_size)), allow_pickle=False)
+    scores = np.load(io.BytesIO(f.read(scores_size)), allow_pickle=False)
+    llama_state = f.read(state_size)
+    if len(llama_state) != state_size:
+        raise ValueError('前缀状态文件不完整')
+    fields = {
+        'input_ids': input_ids,
+        'scores': scores,
+        'n_tokens': header['n_tokens'],
+        'llama_state': llama_state,
+        'llama_state_size': header['llama_state_size']
+    }
+    if header.get('seed') is not None:
+        fields['seed'] = header['seed']
+    return LlamaState(**fields)
+
+class PrefixStateCache:
+    """llama.cpp 前缀 KV 状态缓存"""
+
+    def __init__(self, model_path: str, n_ctx: int, persist: bool = True, cache_dir: Optional[str] = None):
+        """初始化前缀状态缓存
+
+        Args:
+            model_path: 模型文件路径（参与缓存键计算）
+            n_ctx: 上下文长度（不同上下文长度的状态不能互相恢复）
+            persist: 是否将状态保存到磁盘，重启后无需重新预填充
+            cache_dir: 状态文件目录，默认与模型文件放在一起
+        """
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.persist = persist
+        self.cache_dir = cache_dir or os.path.dirname(os.path.abspath(model_path))
+        self.states: Dict[str, Any] = {}
+        self.prefix_tokens: Dict[str, List[int]] = {}
+        self.lock = threading.Lock()
+
+    def _cache_key(self, prefix: str) -> str:
+        """缓存键：模型文件、上下文长度、llama-cpp-python 版本和前缀文本任一变化都会失效"""
+        try:
+            import llama_cpp
+            version = getattr(llama_cpp, '__version__', '')
+        except ImportError:
+            version = ''
+        try:
+            stat = os.stat(self.model_path)
+            model_id = f"{os.path.basename(self.model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+        except OSError:
+            model_id = os.path.basename(self.model_path)
+        raw = f"{model_id}\n{self.n_ctx}\n{version}\n{prefix}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+    def _state_path(self, key: str) -> str:
+        """状态文件路径"""
+        stem = os.path.splitext(os.path.basename(self.model_path))[0]
+        return os.path.join(self.cache_dir, f"{stem}.prefix-{key}.state")
+
+    def _load_from_disk(self, key: str):
+        """从磁盘读取状态，文件不存在或损坏时返回 None"""
+        path = self._state_path(key)
+        if not self.persist or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return load_state(f)
+        except Exception as e:
+            print(f"⚠️ 读取前缀状态文件失败，将重新预填充: {e}")
+            return None
+
+    def _save_to_disk(self, key: str, state):
+        """将状态写入磁盘（先写临时文件再替换，避免留下不完整的文件）"""
+        if not self.persist:
+            return
+        path = self._state_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                dump_state(state, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 保存前缀状态文件失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _tokenize_prefix(self, model, prefix: str) -> List[int]:
+        """与 create_completion 相同的方式分词，去掉最后一个令牌，避免与后缀拼接时边界令牌合并"""
+        tokens = model.tokenize(prefix.encode('utf-8'), special=True)
+        return list(tokens[:-1])
+
+    def restore(self, model, prefix: str) -> str:
+        """确保模型上下文以前缀的 KV 状态开头
+
+        之后调用 model(prefix + suffix) 时，llama-cpp-python 会匹配已有的最长前缀，只预填充后缀。
+
+        Returns:
+            前缀来源: 'reused'（上下文中已有）、'memory'、'disk' 或 'computed'
+        """
+        with self.lock:
+            key = self._cache_key(prefix)
+            tokens = self.prefix_tokens.get(key)
+            if tokens is None:
+                tokens = self._tokenize_prefix(model, prefix)
+                self.prefix_tokens[key] = tokens
+
+            # 上一次生成后上下文仍以该前缀开头时无需恢复
+            if tokens and model.n_tokens >= len(tokens) and list(model.input_ids[:len(tokens)]) == tokens:
+                source = 'reused'
+            elif key in self.states:
+                model.load_state(self.states[key])
+                source = 'memory'
+            else:
+                state = self._load_from_disk(key)
+                source = 'disk'
+                if state is not None:
+                    try:
+                        model.load_state(state)
+                    except Exception as e:
+                        print(f"⚠️ 恢复前缀状态失败，将重新预填充: {e}")
+                        state = None
+                if state is None:
+                    model.reset()
+                    model.eval(tokens)
+                    state = model.save_state()
+                    self._save_to_disk(key, state)
+                    source = 'computed'
+                self.states[key] = state
+
+            LOCAL_PREFIX_CACHE.inc(result=source)
+            return source
+
+    def clear(self):
+        """清空内存中的状态（磁盘文件保留）"""
+        with self.lock:
+            self.states.clear()
+            self.prefix_tokens.clear()
@@ -0,0 +1,241 @@
+"""
+本地推理工作进程
+在独立进程中加载 GGUF 模型并串行处理生成请求，通过管道与主进程通信。
+推理不再与提醒发送、API 服务争用主进程，llama.cpp 崩溃或内存不足也只影响工作进程，
+主进程会在下一次请求或定期巡检时自动重启它。
+"""
+
+import itertools
+import multiprocessing
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from metrics import LOCAL_WORKER_RESTARTS
+
+def _worker_main(conn, config: Dict[str, Any]):
+    """工作进程入口：加载客户端后循环处理请求，收到 None 时退出
+
+    请求为 (请求ID, 提示词, 是否结构化, 系统提示词)，提示词为 None 时预加载并预热模型；
+    每个结果都附带模型的加载信息（local_load_info），供主进程展示
+    """
+    # Ctrl+C 由主进程处理，工作进程随主进程一起停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from .llm_client import LLMClient
+    client = LLMClient(config)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        request_id, prompt, structured, system = message
+        try:
+            if prompt is None:
+                result = client._preload_in_process()
+            else:
+                result = client._run_local(prompt, structured, system)
+        except Exception as e:
+            result = {"error": f"本地模型调用失败: {str(e)}"}
+        result['local_load_info'] = client.local_load_info
+        try:
+            conn.send((request_id, result))
+        except (EOFError, OSError):
+            break
+
+class LocalInferenceWorker:
+    """本地推理工作进程的管理器（主进程侧）"""
+
+    def __init__(self, config: Dict[str, Any], queue_size: int = 4, timeout: float = 120, load_timeout: float = 900):
+        """初始化工作进程管理器
+
+        Args:
+            config: 全局配置（传给工作进程创建本地客户端）
+            queue_size: 同时等待和执行的请求上限，超出时直接返回错误
+            timeout: 单个请求（含排队）的超时时间（秒），超时后重启工作进程
+            load_timeout: 模型尚未加载时（预加载、或工作进程重启后的第一个请求）额外允许的加载时间（秒），
+                0 表示不限制；冷启动时加载大模型常常超过单个请求的超时
+        """
+        self.config = config
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+
+        # 使用 spawn 启动，避免复制主进程中的线程状态
+        self.context = multiprocessing.get_context('spawn')
+        self.process = None
+        self.conn = None
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.lock = threading.Lock()
+        self.request_ids = itertools.count(1)
+
+        self.pending = 0
+        self.restart_count = 0
+        self.started_at = None
+        self.last_error = None
+        self.model_info = None  # 工作进程中模型的加载信息
+
+    def _start(self):
+        """启动工作进程（调用方需持有 self.lock）"""
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.config),
+            daemon=True,
+            name="chrona-local-llm"
+        )
+        process.start()
+        child_conn.close()
+
+        self.process = process
+        self.conn = parent_conn
+        self.started_at = datetime.now()
+        self.model_info = None
+        print(f"🧵 本地推理工作进程已启动 (PID: {process.pid})")
+
+    def _kill(self):
+        """终止工作进程（调用方需持有 self.lock）"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=5)
+                if self.process.is_alive():
+                    self.process.kill()
+                    self.process.join(timeout=5)
+            self.process = None
+
+    def _restart(self, reason: str):
+        """记录原因并重启工作进程（调用方需持有 self.lock）"""
+        print(f"⚠️ 本地推理工作进程异常，正在重启: {reason}")
+        self.last_error = reason
+        self.restart_count += 1
+        LOCAL_WORKER_RESTARTS.inc(reason=reason.split(':')[0])
+        self._kill()
+        self._start()
+
+    def start(self):
+        """启动工作进程（已在运行时不重复启动）"""
+        with self.lock:
+            if self.process is None:
+                self._start()
+            elif not self.process.is_alive():
+                self._restart(f"进程已退出: 退出码 {self.process.exitcode}")
+
+    def ensure_running(self) -> bool:
+        """巡检：工作进程意外退出时重启（有请求正在执行时视为正常，不等待）
+
+        Returns:
+            是否执行了重启
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.process is not None and not self.process.is_alive():
+                self._restart(f"进程已退出: 退出码 {self.process.exitcode}")
+                return True
+            return False
+        finally:
+            self.lock.release()
+
+    def stop(self):
+        """通知工作进程退出"""
+        with self.lock:
+            if self.conn is not None:
+                try:
+                    self.conn.send(None)
+                except (EOFError, OSError):
+                    pass
+            if self.process is not None:
+                self.process.join(timeout=5)
+            self._kill()
+
+    def generate(self, prompt: Optional[str], structured: bool = False, system: Optional[str] = None) -> Dict[str, Any]:
+        """在工作进程中生成回复，返回与 LLMClient._run_local 相同格式的结果（提示词为 None 时预加载模型）"""
+        if not self.slots.acquire(blocking=False):
+            return {"error": f"本地推理队列已满（上限 {self.queue_size}）"}
+
+        timeout = self._request_timeout(prompt)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self.pending += 1
+        try:
+            # 工作进程串行处理请求，等待锁即为排队
+            if not self.lock.acquire(timeout=-1 if timeout is None else timeout):
+                return {"error": f"本地推理排队超时（{timeout}秒）"}
+            try:
+                return self._request(prompt, structured, system, deadline, timeout)
+            finally:
+                self.lock.release()
+        finally:
+            self.pending -= 1
+            self.slots.release()
+
+    def _request_timeout(self, prompt: Optional[str]) -> Optional[float]:
+        """请求（含排队）的超时时间（秒），None 表示不限制
+
+        预加载，以及模型尚未在工作进程中加载完成时（需要先加载或排在加载之后），额外加上 load_timeout
+        """
+        if prompt is not None and self.model_info is not None:
+            return self.timeout
+        if not self.load_timeout:
+            return None
+        return self.timeout + self.load_timeout
+
+    def preload(self) -> Dict[str, Any]:
+        """启动工作进程并在其中预加载、预热模型
+
+        Returns:
+            加载信息，失败时为 {'error': ...}
+        """
+        result = self.generate(None)
+        return result if 'error' in result else dict(self.model_info or {})
+
+    def _request(self, prompt: Optional[str], structured: bool, system: Optional[str], deadline: Optional[float],
+                 timeout: Optional[float]) -> Dict[str, Any]:
+        """发送请求并等待结果（调用方需持有 self.lock）"""
+        if self.process is None:
+            self._start()
+        elif not self.process.is_alive():
+            self._restart(f"进程已退出: 退出码 {self.process.exitcode}")
+
+        request_id = next(self.request_ids)
+        try:
+            self.conn.send((request_id, prompt, structured, system))
+            while True:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and (remaining <= 0 or not self.conn.poll(remaining)):
+                    # 生成卡住时只能终止进程，下次请求前重启
+                    self._restart(f"请求超时: {timeout}秒")
+                    return {"error": f"本地推理超时（{timeout}秒）"}
+                response_id, result = self.conn.recv()
+                if response_id == request_id:
+                    self.model_info = result.pop('local_load_info', None) or self.model_info
+                    return result
+        except (EOFError, OSError, BrokenPipeError) as e:
+            exitcode = self.process.exitcode if self.process is not None else None
+            self._restart(f"进程崩溃: 退出码 {exitcode} {e}")
+            return {"error": f"本地推理工作进程崩溃（退出码 {exitcode}），已重启"}
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取工作进程状态"""
+        process = self.process
+        return {
+            'running': bool(process is not None and process.is_alive()),
+            'pid': process.pid if process is not None else None,
+            'pending': self.pending,
+            'queue_size': self.queue_size,
+            'timeout': self.timeout,
+            'load_timeout': self.load_timeout,
+            'restart_count': self.restart_count,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'last_error': self.last_error,
+            'model': self.model_info
+        }
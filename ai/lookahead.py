@@ -0,0 +1,84 @@
+"""
+预先分析
+在空闲时段以低优先级获取更长时间范围（默认 7 天）内的事件，提前分析并保存结果。
+事件进入常规的 24 小时获取窗口时，重新分析策略判断结果仍有效，常规获取基本只命中已保存的结果
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import pytz
+
+from .priority import parse_event_start
+
+# 常规获取的时间范围（小时），预先分析只处理此范围之外的事件
+REGULAR_WINDOW_HOURS = 24
+
+class LookaheadPlanner:
+    """预先分析的调度条件"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化
+
+        Args:
+            config: 全局配置（读取 analysis.lookahead 段）
+        """
+        lookahead_config = config.get('analysis', {}).get('lookahead', {})
+        self.enabled = lookahead_config.get('enabled', False)
+        # 获取的时间范围（天）
+        self.days = lookahead_config.get('days', 7)
+        # 两次预先分析的最短间隔（秒）
+        self.interval_seconds = lookahead_config.get('interval_seconds', 3600)
+        # 单次最多分析的事件数，0 表示不限制
+        self.max_events = lookahead_config.get('max_events_per_run', 20)
+        # 距下一次常规获取至少还有这么久（秒）时才开始，避免与常规获取争抢 LLM
+        self.min_idle_seconds = lookahead_config.get('min_idle_seconds', 120)
+        # 当天 LLM 用量超过每日预算的这一比例后停止预先分析，为常规获取保留余量
+        self.max_budget_fraction = lookahead_config.get('max_budget_fraction', 0.5)
+
+    @property
+    def hours(self) -> int:
+        return int(self.days * 24)
+
+    def due(self, last_run: Optional[datetime], seconds_to_next_fetch: float, now: Optional[datetime] = None) -> bool:
+        """是否应开始一次预先分析
+
+        Args:
+            last_run: 上次预先分析的时间，从未运行为 None
+            seconds_to_next_fetch: 距下一次常规获取的秒数
+            now: 当前时间（本地时间），默认为现在
+        """
+        if not self.enabled or self.days * 24 <= REGULAR_WINDOW_HOURS:
+            return False
+        if seconds_to_next_fetch < self.min_idle_seconds:
+            return False
+        now = now or datetime.now()
+        return last_run is None or (now - last_run).total_seconds() >= self.interval_seconds
+
+    def beyond_regular_window(self, events: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """只保留常规获取范围之外的事件（范围内的事件由常规获取负责）"""
+        boundary = (now or datetime.now(pytz.UTC)) + timedelta(hours=REGULAR_WINDOW_HOURS)
+        selected = []
+        for event in events:
+            start = parse_event_start(event.get('start', ''))
+            if start is not None and start > boundary:
+                selected.append(event)
+        return selected
+
+    def throttle(self, budget, busy: Callable[[], bool]) -> Callable[[], Optional[str]]:
+        """预先分析队列的暂停条件，用于 AnalysisQueue 的 throttle
+
+        Args:
+            budget: UsageBudget
+            busy: 常规任务正在运行时返回 True
+
+        Returns:
+            暂停原因（busy/budget），可继续时返回 None
+        """
+        def check() -> Optional[str]:
+            if busy():
+                return 'busy'
+            if budget.enabled and budget.fraction_used() >= self.max_budget_fraction:
+                return 'budget'
+            return None
+        return check
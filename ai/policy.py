@@ -0,0 +1,106 @@
+"""
+重新分析策略
+判断已保存的分析结果是否过期，只有过期的事件才重新交给 LLM：
+- 新事件，或标题、描述、时间等内容发生变化；
+- 上次只得到容错解析（关键词推断）的结果；
+- 距开始时间越过配置的阈值（如 2 小时、30 分钟），紧迫程度已变化；
+- 分析结果超过最长有效时间（只在常规获取窗口内计算，窗口之外预先分析的结果从进入窗口时起算）
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+
+from .cache import content_hash
+from .lookahead import REGULAR_WINDOW_HOURS
+from .priority import parse_event_start
+
+# 只因时间推移（紧迫程度可能变化）而重新分析的原因，此时不能复用缓存的结果
+TIME_BASED_REASONS = ('threshold', 'max_age')
+
+class ReanalysisPolicy:
+    """重新分析策略"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化策略
+
+        Args:
+            config: 全局配置（读取 analysis.policy 段）
+        """
+        policy_config = config.get('analysis', {}).get('policy', {})
+        # 关闭时每轮重新分析所有事件（旧行为）
+        self.enabled = policy_config.get('enabled', True)
+        # 距开始时间的阈值（分钟），越过任一阈值时重新分析
+        # 不包含 24 小时：常规获取的范围就是 24 小时，该阈值只会让预先分析过的事件在进入范围时全部重新分析
+        self.thresholds = sorted(policy_config.get('thresholds_minutes', [120, 30]), reverse=True)
+        # 分析结果的最长有效时间（分钟），0 表示不限制；只对常规获取窗口（24 小时）内的事件计算
+        self.max_age_minutes = policy_config.get('max_age_minutes', 360)
+
+    def stale_reason(self, event: Dict[str, Any], state: Optional[Dict[str, Any]],
+                     now: Optional[datetime] = None) -> Optional[str]:
+        """判断事件是否需要重新分析
+
+        Args:
+            event: 本轮获取到的事件
+            state: 已保存的分析状态（见 memory.database.get_analysis_states），未保存过为 None
+            now: 当前时间（UTC），默认为现在
+
+        Returns:
+            需要重新分析的原因（new/content/fallback/threshold/max_age，策略关闭时为 disabled），无需重新分析时返回 None
+        """
+        if not self.enabled:
+            return 'disabled'
+        if state is None:
+            return 'new'
+        if state.get('content_hash') != content_hash(event):
+            return 'content'
+
+        analyzed_at = parse_event_start(state.get('analyzed_at'))
+        if analyzed_at is None:
+            return 'max_age'
+        now = now or datetime.now(pytz.UTC)
+
+        # 已提醒的事件内容未变化时无需再分析
+        if state.get('reminded'):
+            return None
+
+        # 容错解析的结果只是关键词推断，下一轮重新分析
+        if state.get('parsing_method') == 'fallback':
+            return 'fallback'
+
+        start = parse_event_start(event.get('start', ''))
+        if start is not None:
+            lead_then = (start - analyzed_at).total_seconds() / 60
+            lead_now = (start - now).total_seconds() / 60
+            if any(lead_now <= threshold < lead_then for threshold in self.thresholds):
+                return 'threshold'
+
+        if not self.max_age_minutes:
+            return None
+        age_from = analyzed_at
+        if start is not None:
+            window_start = start - timedelta(hours=REGULAR_WINDOW_HOURS)
+            # 常规窗口之外的事件不按时间过期，否则预先分析会每隔 max_age 重复分析同一个较远的事件
+            if now < window_start:
+                return None
+            # 进入窗口前预先分析的结果从进入窗口时起算，进入窗口时仍然有效
+            age_from = max(analyzed_at, window_start)
+        if (now - age_from).total_seconds() / 60 >= self.max_age_minutes:
+            return 'max_age'
+        return None
+
+    def select(self, events: List[Dict[str, Any]], states: Dict[Tuple[str, str], Dict[str, Any]],
+               now: Optional[datetime] = None) -> List[Tuple[Dict[str, Any], str]]:
+        """挑选需要重新分析的事件
+
+        Returns:
+            [(事件, 原因), ...]
+        """
+        selected = []
+        for event in events:
+            state = states.get((event.get('uid', ''), event.get('recurrence_id', '') or ''))
+            reason = self.stale_reason(event, state, now)
+            if reason is not None:
+                selected.append((event, reason))
+        return selected
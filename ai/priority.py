@@ -0,0 +1,89 @@
+"""
+分析任务优先队列
+按“最晚有效提醒时间”（开始时间减去提醒提前量）排序，临近的事件先分析；
+单轮分析超出时间预算（或被限流，如每日 LLM 预算用完）时，剩余事件推迟到下一轮
+"""
+
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pytz
+
+def parse_event_start(value: str) -> Optional[datetime]:
+    """解析事件开始时间为 UTC 时间（无时区信息时按 UTC 处理，与提醒检查一致）"""
+    if not value:
+        return None
+    try:
+        start = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if start.tzinfo:
+        return start.astimezone(pytz.UTC)
+    return start.replace(tzinfo=pytz.UTC)
+
+class AnalysisQueue:
+    """事件分析优先队列"""
+
+    def __init__(self, config: Dict[str, Any], clock=time.monotonic, throttle=None):
+        """初始化分析队列
+
+        Args:
+            config: 全局配置（读取 analysis.queue 段）
+            clock: 计时函数（用于时间预算）
+            throttle: 每次取出前调用，返回非空原因时停止本轮分析（如每日 LLM 预算已用完）
+        """
+        queue_config = config.get('analysis', {}).get('queue', {})
+        # 尚未分析时不知道建议的提前量，按可能的最大提前量估算最晚有效提醒时间
+        self.reminder_lead = timedelta(minutes=queue_config.get('reminder_lead_minutes', 30))
+        # 单轮分析的时间预算（秒），0 表示不限制
+        self.budget_seconds = queue_config.get('cycle_budget_seconds', 300)
+        self.clock = clock
+        self.throttle = throttle
+        self.stop_reason = None  # 提前停止的原因：time（时间预算）或 throttle 返回的原因
+
+        self.heap = []
+        self.counter = itertools.count()
+        self.started_at = None
+
+    def deadline(self, event: Dict[str, Any]) -> Optional[datetime]:
+        """事件的最晚有效提醒时间，无法解析开始时间时返回 None"""
+        start = parse_event_start(event.get('start', ''))
+        return start - self.reminder_lead if start else None
+
+    def push(self, event: Dict[str, Any]):
+        """加入待分析事件（无法解析开始时间的事件排在最后）"""
+        deadline = self.deadline(event)
+        key = deadline.timestamp() if deadline else float('inf')
+        heapq.heappush(self.heap, (key, next(self.counter), event))
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """取出最紧急的事件；队列为空或时间预算用完时返回 None"""
+        if self.started_at is None:
+            self.started_at = self.clock()
+        if not self.heap:
+            return None
+        if self.budget_exhausted():
+            self.stop_reason = 'time'
+            return None
+        if self.throttle is not None:
+            reason = self.throttle()
+            if reason:
+                self.stop_reason = reason
+                return None
+        return heapq.heappop(self.heap)[2]
+
+    def budget_exhausted(self) -> bool:
+        """本轮时间预算是否已用完"""
+        if not self.budget_seconds or self.started_at is None:
+            return False
+        return self.clock() - self.started_at >= self.budget_seconds
+
+    def deferred(self) -> List[Dict[str, Any]]:
+        """未来得及分析、推迟到下一轮的事件（按紧急程度排序）"""
+        return [entry[2] for entry in sorted(self.heap)]
+
+    def __len__(self):
+        return len(self.heap)
@@ -0,0 +1,75 @@
+"""
+提示词模板
+静态的规则说明作为系统提示词（前缀），每个事件只生成很短的用户消息（后缀），
+使提供商的前缀缓存和本地模型的 KV 缓存可以复用相同的前缀
+"""
+
+from typing import Dict, Optional
+
+# 模板版本号：修改系统提示词或用户消息格式时递增，便于区分不同版本模板的分析结果
+ANALYSIS_TEMPLATE_ID = "event-analysis/v2"
+
+# 系统提示词：不包含任何随事件变化的内容，保证逐字节稳定
+ANALYSIS_SYSTEM_PROMPT = """你是一个智能日程助手。请分析用户给出的日程并输出以下字段：
+- task: 事件任务（简化后的任务描述）
+- important: 是否重要 (true/false)
+- need_remind: 是否需要提醒 (true/false)
+- minutes_before_remind: 建议提前几分钟提醒（数字）
+- reason: 判断理由
+- confidence: 对判断的把握程度（0-1 之间的小数，信息不足或难以判断时给出较低的值）
+
+分析规则：
+1. 会议、面试、重要约会等需要提醒
+2. 普通的个人时间、休息时间通常不需要提醒
+3. 重要事件建议提前15-30分钟提醒
+4. 普通事件提前5-10分钟提醒
+5. 考虑事件时长：长时间事件（>=2小时）可能需要更早提醒
+6. 考虑当前时间与事件开始时间的距离来调整提醒策略
+
+基于日历名称的智能判断：
+- "工作"、"办公"、"会议"等相关日历：通常为工作事务，重要性较高，建议提醒
+- "个人"、"私人"、"生活"等相关日历：根据具体内容判断重要性
+- "生日"、"纪念日"等相关日历：重要的个人事件，建议提醒
+- "假期"、"休息"、"娱乐"等相关日历：通常不需要紧急提醒
+- "健康"、"医疗"、"体检"等相关日历：健康相关事务，重要性高
+- "学习"、"课程"、"培训"等相关日历：教育相关，建议提醒
+- 如果日历名称包含具体项目名、客户名：通常为重要工作事务
+
+重要：请严格按照以下JSON格式输出，不要添加任何额外文字或解释：
+{"task":"简化任务描述","important":true,"need_remind":true,"minutes_before_remind":15,"reason":"判断理由","confidence":0.9}
+"""
+
+def _format_duration(duration_minutes: int) -> str:
+    """格式化持续时间"""
+    hours = duration_minutes // 60
+    minutes = duration_minutes % 60
+    if hours > 0:
+        return f"{hours}小时{minutes}分钟 (共{duration_minutes}分钟)"
+    return f"{minutes}分钟"
+
+def build_analysis_prompt(summary: str, description: str, current_time: str,
+                          start_time: Optional[str] = None, end_time: Optional[str] = None,
+                          duration_minutes: Optional[int] = None,
+                          calendar_name: Optional[str] = None) -> Dict[str, str]:
+    """构建事件分析提示词
+
+    Returns:
+        {'template_id': 模板版本, 'system': 静态系统提示词, 'user': 事件相关的用户消息}
+    """
+    lines = [f"当前时间: {current_time}"]
+    if start_time:
+        lines.append(f"开始时间: {start_time}")
+    if end_time:
+        lines.append(f"结束时间: {end_time}")
+    if duration_minutes:
+        lines.append(f"持续时间: {_format_duration(duration_minutes)}")
+    if calendar_name:
+        lines.append(f"日历来源: {calendar_name}")
+    lines.append(f"标题: {summary}")
+    lines.append(f"描述: {description}")
+
+    return {
+        'template_id': ANALYSIS_TEMPLATE_ID,
+        'system': ANALYSIS_SYSTEM_PROMPT,
+        'user': "\n".join(lines)
+    }
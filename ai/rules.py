@@ -0,0 +1,146 @@
+"""
+规则预分类
+在调用 LLM 之前按日历名称、标题关键词和时长匹配常规事件，命中时直接给出分析结果，
+未命中（或包含需要 LLM 判断的关键词）时交给 LLM 分析
+"""
+
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+# 内置规则，与提示词中的日历判断规则保持一致，只覆盖结论明确的情形
+DEFAULT_RULES = [
+    {
+        'name': '面试',
+        'keywords': ['面试', 'interview'],
+        # 中文按子串匹配，“面试官培训”等不是本人参加的面试
+        'exclude_keywords': ['面试官', '培训', 'interviewer', 'training'],
+        'result': {'important': True, 'need_remind': True, 'minutes_before_remind': 30}
+    },
+    {
+        'name': '工作会议',
+        'calendar': ['工作', '办公', '会议', 'work'],
+        'keywords': ['会议', '例会', '周会', '站会', '评审', 'meeting', 'standup', 'sync'],
+        'exclude_keywords': ['会议室预订', '预订会议室'],
+        'result': {'important': True, 'need_remind': True, 'minutes_before_remind': 15}
+    },
+    {
+        'name': '生日纪念日',
+        'calendar': ['生日', '纪念日', 'birthday', 'anniversary', 'anniversaries'],
+        'result': {'important': True, 'need_remind': True, 'minutes_before_remind': 30}
+    },
+    {
+        'name': '假期休息',
+        'calendar': ['假期', '休息', '娱乐', '节假日', 'holiday'],
+        'result': {'important': False, 'need_remind': False, 'minutes_before_remind': 0}
+    },
+]
+
+# 标题或描述中出现这些词时结论可能被推翻，始终交给 LLM 判断
+DEFAULT_ESCALATE_KEYWORDS = ['紧急', '重要', '取消', '改期', 'urgent', 'important', 'cancel']
+
+def _contains_any(text: str, words: List[str]) -> bool:
+    """文本是否包含任一关键词（不区分大小写）"""
+    text = text.lower()
+    return any(word.lower() in text for word in words)
+
+def _matches_any(text: str, words: List[str]) -> bool:
+    """文本是否包含任一关键词（不区分大小写）
+
+    英文等由字母数字组成的关键词需匹配完整单词，允许复数后缀 s/es
+    （'work' 不匹配 “network”“homework”，'holiday' 匹配 “Holidays in China”），
+    中文没有词边界，仍按子串匹配（'工作' 匹配 “工作日历”）
+    """
+    text = text.lower()
+    for word in words:
+        word = str(word).lower()
+        if not word:
+            continue
+        if word.isascii():
+            if re.search(rf'(?<![a-z0-9]){re.escape(word)}(?:e?s)?(?![a-z0-9])', text):
+                return True
+        elif word in text:
+            return True
+    return False
+
+class RuleEngine:
+    """基于配置的事件预分类规则引擎"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化规则引擎
+
+        Args:
+            config: 全局配置（读取 analysis.rules 段）
+        """
+        rules_config = config.get('analysis', {}).get('rules', {})
+        self.enabled = rules_config.get('enabled', False)
+        self.rules = list(rules_config.get('rules') or [])
+        if rules_config.get('use_default_rules', True):
+            self.rules.extend(DEFAULT_RULES)
+        self.escalate_keywords = rules_config.get('escalate_keywords', DEFAULT_ESCALATE_KEYWORDS)
+
+    def _match(self, rule: Dict[str, Any], summary: str, calendar_name: str,
+               duration_minutes: Optional[int]) -> bool:
+        """规则中配置的条件全部满足时匹配（未配置的条件不参与判断）"""
+        if rule.get('calendar') and not _matches_any(calendar_name, rule['calendar']):
+            return False
+        if rule.get('keywords') and not _matches_any(summary, rule['keywords']):
+            return False
+        if rule.get('exclude_keywords') and _matches_any(summary, rule['exclude_keywords']):
+            return False
+        if rule.get('min_duration') is not None:
+            if duration_minutes is None or duration_minutes < rule['min_duration']:
+                return False
+        if rule.get('max_duration') is not None:
+            if duration_minutes is None or duration_minutes > rule['max_duration']:
+                return False
+        # 至少需要一个条件，避免空规则（包括 calendar: [] 这样的空列表）匹配所有事件
+        return (bool(rule.get('calendar')) or bool(rule.get('keywords'))
+                or rule.get('min_duration') is not None or rule.get('max_duration') is not None)
+
+    def classify(self, summary: str, description: str = '', calendar_name: str = '',
+                 duration_minutes: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """按顺序匹配规则
+
+        Returns:
+            命中时返回分析结果（字段与 LLM 输出一致），未命中或需要 LLM 判断时返回 None
+        """
+        if not self.enabled:
+            return None
+
+        summary = summary or ''
+        calendar_name = calendar_name or ''
+        if _contains_any(f"{summary}\n{description or ''}", self.escalate_keywords):
+            return None
+
+        for rule in self.rules:
+            if not self._match(rule, summary, calendar_name, duration_minutes):
+                continue
+            rule_result = rule.get('result', {})
+            need_remind = bool(rule_result.get('need_remind', False))
+            return {
+                'task': summary[:50] if summary else '未知任务',
+                'important': bool(rule_result.get('important', False)),
+                'need_remind': need_remind,
+                'minutes_before_remind': int(rule_result.get('minutes_before_remind', 15 if need_remind else 0)),
+                'reason': f"规则匹配：{rule.get('name', '未命名规则')}",
+                '_parsing_method': 'rules'
+            }
+        return None
+
+
+# 进程内共享的规则引擎，analysis 配置变化（如热加载）时重建
+_shared_engine = None
+_shared_fingerprint = None
+_shared_lock = threading.Lock()
+
+def get_rule_engine(config: Dict[str, Any]) -> RuleEngine:
+    """获取共享的规则引擎"""
+    global _shared_engine, _shared_fingerprint
+    fingerprint = json.dumps(config.get('analysis', {}).get('rules', {}), sort_keys=True, ensure_ascii=False, default=str)
+    with _shared_lock:
+        if _shared_engine is None or fingerprint != _shared_fingerprint:
+            _shared_engine = RuleEngine(config)
+            _shared_fingerprint = fingerprint
+        return _shared_engine
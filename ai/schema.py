@@ -0,0 +1,90 @@
+"""
+事件分析结果的输出结构定义
+供约束解码（本地 GBNF 语法）和云端结构化输出使用，保证模型输出即为合法 JSON
+"""
+
+from typing import Any, Dict, List
+
+# 分析结果字段（按输出顺序）
+ANALYSIS_FIELDS = ['task', 'important', 'need_remind', 'minutes_before_remind', 'reason', 'confidence']
+
+# 提前提醒时间上限（分钟），超过一周视为无效输出
+MAX_REMIND_MINUTES = 7 * 24 * 60
+
+# 标准 JSON Schema 描述
+ANALYSIS_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "task": {"type": "string", "description": "简化后的任务描述"},
+        "important": {"type": "boolean", "description": "是否重要"},
+        "need_remind": {"type": "boolean", "description": "是否需要提醒"},
+        "minutes_before_remind": {"type": "integer", "description": "建议提前几分钟提醒"},
+        "reason": {"type": "string", "description": "判断理由"},
+        "confidence": {"type": "number", "description": "对判断的把握程度（0-1）"}
+    },
+    "required": ANALYSIS_FIELDS,
+    "additionalProperties": False
+}
+
+# Gemini responseSchema（OpenAPI 子集，类型名为大写）
+ANALYSIS_GEMINI_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "task": {"type": "STRING", "description": "简化后的任务描述"},
+        "important": {"type": "BOOLEAN", "description": "是否重要"},
+        "need_remind": {"type": "BOOLEAN", "description": "是否需要提醒"},
+        "minutes_before_remind": {"type": "INTEGER", "description": "建议提前几分钟提醒"},
+        "reason": {"type": "STRING", "description": "判断理由"},
+        "confidence": {"type": "NUMBER", "description": "对判断的把握程度（0-1）"}
+    },
+    "required": ANALYSIS_FIELDS,
+    "propertyOrdering": ANALYSIS_FIELDS
+}
+
+# OpenAI 兼容接口的 response_format（严格模式要求全部字段必填且不允许额外字段）
+ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "event_analysis",
+        "strict": True,
+        "schema": ANALYSIS_JSON_SCHEMA
+    }
+}
+
+# 结构化输出时的默认生成令牌上限：分析结果只有六个短字段，无需预留长文本空间
+ANALYSIS_MAX_TOKENS = 256
+
+# llama.cpp GBNF 语法：字段顺序固定，根对象闭合后只允许结束符，生成随即停止
+# 字符串中的换行等控制字符必须转义，因此不会被 "\n\n"、"---" 之类的停止标记截断
+ANALYSIS_GBNF = r'''
+root ::= "{" ws "\"task\"" ws ":" ws string ws "," ws "\"important\"" ws ":" ws boolean ws "," ws "\"need_remind\"" ws ":" ws boolean ws "," ws "\"minutes_before_remind\"" ws ":" ws minutes ws "," ws "\"reason\"" ws ":" ws string ws "," ws "\"confidence\"" ws ":" ws confidence ws "}"
+string ::= "\"" char* "\""
+char ::= [^"\\\x00-\x1F\x7F] | "\\" (["\\/bfnrt] | "u" hex hex hex hex)
+hex ::= [0-9a-fA-F]
+boolean ::= "true" | "false"
+minutes ::= [0-9] | [1-9] [0-9] | [1-9] [0-9] [0-9] | [1-9] [0-9] [0-9] [0-9]
+confidence ::= "0" ("." [0-9] [0-9]?)? | "1" (".0" "0"?)?
+ws ::= " "?
+'''
+
+def validate_analysis(result: Dict[str, Any]) -> List[str]:
+    """校验分析结果的字段类型和取值范围，返回错误信息列表（为空表示通过）"""
+    errors = []
+    if not isinstance(result, dict):
+        return ["分析结果不是对象"]
+
+    for field in ('task', 'reason'):
+        if not isinstance(result.get(field), str) or not result.get(field):
+            errors.append(f"{field} 应为非空字符串")
+    for field in ('important', 'need_remind'):
+        if not isinstance(result.get(field), bool):
+            errors.append(f"{field} 应为布尔值")
+
+    minutes = result.get('minutes_before_remind')
+    if isinstance(minutes, bool) or not isinstance(minutes, int) or not 0 <= minutes <= MAX_REMIND_MINUTES:
+        errors.append(f"minutes_before_remind 应为 0-{MAX_REMIND_MINUTES} 的整数")
+
+    confidence = result.get('confidence')
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+        errors.append("confidence 应为 0-1 的数值")
+    return errors
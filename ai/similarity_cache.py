@@ -0,0 +1,221 @@
+"""
+相似标题分析缓存
+精确缓存（重复事件的系列缓存）之后的第二级缓存：很多事件只是标题中的日期、编号或人名不同
+（如“1:1 with Alice”“1:1 with Bob”“Team sync (week 42)”），分析结论相同。
+标题按可配置的正则去掉这些部分后，与同一日历中已分析过的标题比较字符 n-gram 相似度，
+超过阈值、且描述和时长也相容时直接复用已保存的结果并记录来源，不需要外部的向量服务。
+事件自己以前保存的记录不参与匹配，按时间重新分析（临近开始、结果过期）时也不查这一级缓存
+"""
+
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from memory.database import get_similar_analyses, save_similar_analysis, touch_similar_analysis
+from metrics import ANALYSIS_SIMILAR
+from .prompts import ANALYSIS_TEMPLATE_ID
+from .rules import DEFAULT_ESCALATE_KEYWORDS
+
+# 默认的标题归一化规则（按顺序替换为空格），可通过 analysis.similarity_cache.patterns 覆盖
+DEFAULT_PATTERNS = [
+    r'\d{4}\s*[-/.年]\s*\d{1,2}\s*[-/.月]\s*\d{1,2}\s*日?',  # 日期：2025-06-23、2025年6月23日
+    r'\d{1,2}\s*[/.月]\s*\d{1,2}\s*[日号]?',  # 日期：6/23、6月23日
+    r'\d{1,2}\s*[:：]\s*\d{2}',  # 时间：14:30
+    r'\b(?:with|w/)\s+[^\s,，、()（）\[\]【】]+',  # 人名：with Alice
+    r'@\S+',  # @某人
+    r'第\s*\d+\s*[周期次轮]|\bweek\s*\d+|\bw\d+\b|\bq[1-4]\b',  # 周次、期数、季度
+    r'(?<![\d:：])\d+(?![\d:：])',  # 其余数字（保留 1:1 这类写法）
+]
+
+# 归一化后去掉的标点
+_PUNCTUATION = re.compile(r'[\s\-_/\\|·•:：,，.。;；!！?？()（）\[\]【】<>《》"“”\'‘’#]+')
+
+class SimilarityCache:
+    """按归一化标题的字符 n-gram 相似度复用分析结果"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化
+
+        Args:
+            config: 全局配置（读取 analysis.similarity_cache 段）
+        """
+        cache_config = config.get('analysis', {}).get('similarity_cache', {})
+        self.enabled = cache_config.get('enabled', False)
+        # 相似度阈值（0-1，Dice 系数），达到时复用
+        self.threshold = cache_config.get('threshold', 0.85)
+        # 归一化描述的相似度阈值（都为空时视为相同，只有一方为空时不复用）
+        self.description_threshold = cache_config.get('description_threshold', self.threshold)
+        # 时长允许的差异（分钟），只有一方有时长时不复用
+        self.duration_tolerance = cache_config.get('duration_tolerance_minutes', 0)
+        self.ngram = max(1, cache_config.get('ngram', 3))
+        # 归一化后短于该长度的标题信息太少，不参与相似匹配
+        self.min_length = cache_config.get('min_length', 2)
+        # 每个日历参与比较的最近使用的记录数
+        self.max_entries = cache_config.get('max_entries_per_calendar', 500)
+        self.patterns = [re.compile(pattern, re.IGNORECASE)
+                         for pattern in cache_config.get('patterns', DEFAULT_PATTERNS)]
+        # 标题或描述包含这些词时结论可能不同，不复用也不保存
+        self.escalate_keywords = cache_config.get(
+            'escalate_keywords',
+            config.get('analysis', {}).get('rules', {}).get('escalate_keywords', DEFAULT_ESCALATE_KEYWORDS)
+        )
+
+        self.lock = threading.Lock()
+        # 日历 -> [(归一化标题, 标题 n-gram 集合, 描述 n-gram 集合, 记录)]，首次查询该日历时从数据库加载
+        self.index: Dict[str, List[Tuple[str, frozenset, frozenset, Dict[str, Any]]]] = {}
+
+    def normalize(self, summary: str) -> str:
+        """归一化标题：去掉日期、时间、编号、人名等可变部分，统一大小写和标点"""
+        text = (summary or '').lower()
+        for pattern in self.patterns:
+            text = pattern.sub(' ', text)
+        return _PUNCTUATION.sub(' ', text).strip()
+
+    def ngrams(self, text: str) -> frozenset:
+        """字符 n-gram 集合（两端补空格，短词也有完整的 n-gram）"""
+        padded = f" {text} "
+        if len(padded) <= self.ngram:
+            return frozenset([padded])
+        return frozenset(padded[i:i + self.ngram] for i in range(len(padded) - self.ngram + 1))
+
+    @staticmethod
+    def similarity(a: frozenset, b: frozenset) -> float:
+        """Dice 系数"""
+        if not a or not b:
+            return 0.0
+        return 2 * len(a & b) / (len(a) + len(b))
+
+    def _description_grams(self, description: str) -> frozenset:
+        """归一化描述的 n-gram 集合，描述为空时返回空集合"""
+        return self.ngrams(description) if description else frozenset()
+
+    def _compatible(self, description_grams: frozenset, duration: Optional[int],
+                    entry_description_grams: frozenset, entry_duration: Optional[int]) -> bool:
+        """描述和时长是否足够接近，可以共用一份分析结果"""
+        if bool(description_grams) != bool(entry_description_grams):
+            return False
+        if description_grams and \
+                self.similarity(description_grams, entry_description_grams) < self.description_threshold:
+            return False
+        if duration is None or entry_duration is None:
+            return duration is None and entry_duration is None
+        return abs(duration - entry_duration) <= self.duration_tolerance
+
+    def _eligible(self, event: Dict[str, Any]) -> Optional[str]:
+        """可参与相似匹配时返回归一化标题"""
+        if not self.enabled:
+            return None
+        summary = event.get('summary', '') or ''
+        text = f"{summary}\n{event.get('description', '') or ''}".lower()
+        if any(word.lower() in text for word in self.escalate_keywords):
+            return None
+        normalized = self.normalize(summary)
+        return normalized if len(normalized) >= self.min_length else None
+
+    def _entries(self, calendar_name: str) -> List[Tuple[str, frozenset, frozenset, Dict[str, Any]]]:
+        """同一日历的记录（调用方需持有 self.lock）"""
+        entries = self.index.get(calendar_name)
+        if entries is None:
+            entries = [
+                (row['normalized_title'], self.ngrams(row['normalized_title']),
+                 self._description_grams(row['description'] or ''), row)
+                for row in get_similar_analyses(calendar_name, ANALYSIS_TEMPLATE_ID, limit=self.max_entries)
+            ]
+            self.index[calendar_name] = entries
+        return entries
+
+    def lookup(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """查找同一日历中标题相似、描述和时长相容的已分析事件（不包括事件自己）
+
+        Returns:
+            复用的分析结果（_similar 字段记录来源和相似度），未命中时返回 None
+        """
+        normalized = self._eligible(event)
+        if normalized is None:
+            return None
+
+        grams = self.ngrams(normalized)
+        description_grams = self._description_grams(self.normalize(event.get('description', '')))
+        duration = event.get('duration_minutes')
+        uid = event.get('uid', '') or ''
+        calendar_name = event.get('calendar_name', '') or ''
+        with self.lock:
+            best, best_score = None, 0.0
+            for title, entry_grams, entry_description_grams, entry in self._entries(calendar_name):
+                if uid and entry['source_uid'] == uid:
+                    continue
+                if not self._compatible(description_grams, duration,
+                                        entry_description_grams, entry['duration_minutes']):
+                    continue
+                score = 1.0 if title == normalized else self.similarity(grams, entry_grams)
+                if score > best_score:
+                    best, best_score = entry, score
+                    if score == 1.0:
+                        break
+
+        if best is None or best_score < self.threshold:
+            ANALYSIS_SIMILAR.inc(result='miss')
+            return None
+
+        ANALYSIS_SIMILAR.inc(result='hit')
+        touch_similar_analysis(calendar_name, best['normalized_title'], ANALYSIS_TEMPLATE_ID)
+        result = json.loads(best['result'])
+        summary = event.get('summary', '') or ''
+        result['task'] = summary[:50] if summary else result.get('task', '未知任务')
+        result['_similar'] = {
+            'source_summary': best['summary'],
+            'source_uid': best['source_uid'],
+            'normalized_title': best['normalized_title'],
+            'similarity': round(best_score, 3)
+        }
+        return result
+
+    def store(self, event: Dict[str, Any], result: Dict[str, Any]):
+        """保存 LLM 的分析结果，供之后标题相似的事件复用
+
+        规则结论、容错解析的结果和复用得到的结果不保存
+        """
+        if 'error' in result or '_similar' in result:
+            return
+        if result.get('_parsing_method') in ('rules', 'fallback'):
+            return
+        normalized = self._eligible(event)
+        if normalized is None:
+            return
+
+        calendar_name = event.get('calendar_name', '') or ''
+        row = {
+            'normalized_title': normalized,
+            'summary': event.get('summary', ''),
+            'source_uid': event.get('uid', ''),
+            'description': self.normalize(event.get('description', '')),
+            'duration_minutes': event.get('duration_minutes'),
+            'result': json.dumps(result, ensure_ascii=False)
+        }
+        if not save_similar_analysis(calendar_name, ANALYSIS_TEMPLATE_ID, **row):
+            return
+        with self.lock:
+            entries = [entry for entry in self._entries(calendar_name) if entry[0] != normalized]
+            entries.insert(0, (normalized, self.ngrams(normalized), self._description_grams(row['description']), row))
+            self.index[calendar_name] = entries[:self.max_entries]
+
+
+# 进程内共享的相似缓存，analysis.similarity_cache 配置变化（如热加载）时重建
+_shared_cache = None
+_shared_fingerprint = None
+_shared_lock = threading.Lock()
+
+def get_similarity_cache(config: Dict[str, Any]) -> SimilarityCache:
+    """获取共享的相似标题缓存"""
+    global _shared_cache, _shared_fingerprint
+    analysis_config = config.get('analysis', {})
+    fingerprint = json.dumps(
+        [analysis_config.get('similarity_cache', {}), analysis_config.get('rules', {}).get('escalate_keywords')],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    with _shared_lock:
+        if _shared_cache is None or fingerprint != _shared_fingerprint:
+            _shared_cache = SimilarityCache(config)
+            _shared_fingerprint = fingerprint
+        return _shared_cache
@@ -0,0 +1,97 @@
+"""
+LLM 用量核算与每日预算
+按 llm.usage.pricing 中的单价估算每次调用的费用；
+当天的令牌数、费用或请求数达到 llm.usage.daily_budget 后，分析阶段暂停调用 LLM
+"""
+
+from typing import Any, Dict, List, Optional
+
+from memory.database import get_llm_usage
+
+# 预算项，与 summarize_usage 合计结果中的字段同名
+BUDGET_ITEMS = ('tokens', 'cost', 'requests')
+
+def estimate_cost(config: Dict[str, Any], provider: str, usage: Dict[str, int]) -> float:
+    """按配置的单价（每百万令牌）估算一次调用的费用，未配置单价时为 0
+
+    缓存命中的令牌包含在 prompt_tokens 中，按 cached 单价（默认与 prompt 相同）计费
+    """
+    pricing = config.get('llm', {}).get('usage', {}).get('pricing', {}).get(provider)
+    if not pricing or not usage:
+        return 0.0
+    prompt_tokens = usage.get('prompt_tokens', 0) or 0
+    cached_tokens = min(usage.get('cached_tokens', 0) or 0, prompt_tokens)
+    completion_tokens = usage.get('completion_tokens', 0) or 0
+    prompt_price = pricing.get('prompt', 0)
+    cached_price = pricing.get('cached', prompt_price)
+    return ((prompt_tokens - cached_tokens) * prompt_price
+            + cached_tokens * cached_price
+            + completion_tokens * pricing.get('completion', 0)) / 1_000_000
+
+def summarize_usage(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合计多条日用量记录"""
+    totals = {
+        'requests': 0, 'errors': 0, 'retries': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+        'cached_tokens': 0, 'latency_seconds': 0.0, 'max_latency_seconds': 0.0, 'cost': 0.0
+    }
+    for entry in entries:
+        for field in totals:
+            if field == 'max_latency_seconds':
+                totals[field] = max(totals[field], entry[field])
+            else:
+                totals[field] += entry[field]
+    totals['tokens'] = totals['prompt_tokens'] + totals['completion_tokens']
+    totals['avg_latency_seconds'] = totals['latency_seconds'] / totals['requests'] if totals['requests'] else 0.0
+    return totals
+
+def summarize_by_provider(entries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """按提供商合计多日用量"""
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(entry['provider'], []).append(entry)
+    return {provider: summarize_usage(items) for provider, items in grouped.items()}
+
+class UsageBudget:
+    """每日 LLM 用量预算"""
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化预算
+
+        Args:
+            config: 全局配置（读取 llm.usage.daily_budget，各项为 0 或未配置表示不限制）
+        """
+        budget_config = config.get('llm', {}).get('usage', {}).get('daily_budget', {}) or {}
+        self.limits = {item: budget_config.get(item, 0) or 0 for item in BUDGET_ITEMS}
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.limits.values())
+
+    def exhausted(self) -> Optional[str]:
+        """今天已用完的预算项，未用完（或未启用预算）时返回 None"""
+        if not self.enabled:
+            return None
+        return self._exhausted_item(summarize_usage(get_llm_usage(days=1)))
+
+    def fraction_used(self) -> float:
+        """今天已用预算的比例（取各预算项中最高的一项），未启用预算时为 0"""
+        if not self.enabled:
+            return 0.0
+        used = summarize_usage(get_llm_usage(days=1))
+        return max(used[item] / limit for item, limit in self.limits.items() if limit)
+
+    def _exhausted_item(self, used: Dict[str, Any]) -> Optional[str]:
+        for item in BUDGET_ITEMS:
+            if self.limits[item] and used[item] >= self.limits[item]:
+                return item
+        return None
+
+    def status(self) -> Dict[str, Any]:
+        """今天的预算使用情况"""
+        used = summarize_usage(get_llm_usage(days=1))
+        return {
+            'enabled': self.enabled,
+            'limits': self.limits,
+            'used': {item: used[item] for item in BUDGET_ITEMS},
+            'exhausted': self._exhausted_item(used)
+        }
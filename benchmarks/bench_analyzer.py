@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+事件分析基准
+用桩 LLM 客户端回放 benchmarks/corpus/analyzer_events.json 中记录的事件和模型原始输出，
+经过 ai.analyzer.analyze_event 的完整流程（规则预分类、提示词构建、结构化/容错解析），
+统计吞吐量、延迟分位数、各解析方式占比和内存占用。完全离线运行，不访问任何 LLM 服务。
+
+用法: python benchmarks/bench_analyzer.py [--events 500] [--concurrency 4] [--latency-ms 50]
+                                         [--jitter-ms 20] [--error-rate 0.05] [--rules]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ai.analyzer as analyzer
+
+CORPUS_PATH = os.path.join(ROOT, 'benchmarks', 'corpus', 'analyzer_events.json')
+
+class StubLLMClient:
+    """按事件标题回放记录的模型输出，可配置延迟和错误注入，接口与 LLMClient 相同"""
+
+    def __init__(self, outputs, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0):
+        self.outputs = outputs  # 标题 -> (输出文本, 是否为结构化输出)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.llm_config = {'provider': 'stub', 'parameters': {}}
+        self.calls = 0
+
+    def generate(self, prompt, structured=False, system=None):
+        with self.lock:
+            self.calls += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            failed = self.random.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            return {"error": "注入的错误", "status": 503}
+
+        # 按用户消息中的标题找到对应的记录输出
+        summary = next((line[len("标题: "):] for line in prompt.splitlines() if line.startswith("标题: ")), '')
+        text, is_structured = self.outputs[summary]
+        return {"success": True, "text": text, "usage": {}, "structured": structured and is_structured}
+
+    def get_provider_info(self, provider=None):
+        return {"provider": "stub", "model": "N/A", "url": "N/A", "parameters": {}}
+
+def percentile(values, fraction):
+    """已排序列表的分位数"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description='事件分析基准（离线）')
+    parser.add_argument('--events', type=int, default=500, help='分析的事件总数（循环使用语料）')
+    parser.add_argument('--concurrency', type=int, default=1, help='并发分析的线程数')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='桩客户端每次调用的平均延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='延迟的随机波动范围（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='注入调用失败的比例（0-1）')
+    parser.add_argument('--rules', action='store_true', help='启用内置规则预分类')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    client = StubLLMClient(
+        {item['summary']: (item['output'], item.get('structured', False)) for item in corpus},
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed
+    )
+    # 分析器通过 get_shared_client 获取客户端，这里替换为桩客户端
+    analyzer.get_shared_client = lambda config: client
+    config = {'analysis': {'rules': {'enabled': args.rules}}}
+
+    events = [corpus[i % len(corpus)] for i in range(args.events)]
+    latencies = []
+    methods = Counter()
+    lock = threading.Lock()
+
+    def run(event):
+        started = time.perf_counter()
+        result = analyzer.analyze_event(
+            event['summary'], event.get('description', ''), config,
+            start_time=event.get('start'), duration_minutes=event.get('duration_minutes'),
+            current_time='2025-06-23 08:00:00', calendar_name=event.get('calendar_name')
+        )
+        elapsed = time.perf_counter() - started
+        method = 'error' if 'error' in result else result.get('_parsing_method', 'json')
+        with lock:
+            latencies.append(elapsed)
+            methods[method] += 1
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    # 分析器在容错解析时会打印原始响应，基准运行期间不输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            list(executor.map(run, events))
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    total = len(events)
+    # ru_maxrss 在 Linux 上为 KB，macOS 上为字节
+    max_rss_mb = None
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        max_rss_mb = max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+    print(f"📄 语料: {len(corpus)} 条，分析 {total} 个事件，并发 {args.concurrency}，"
+          f"桩延迟 {args.latency_ms}±{args.jitter_ms} ms，错误注入 {args.error_rate:.0%}")
+    print(f"⚡ 吞吐量: {total / wall:.1f} 事件/秒（总耗时 {wall:.2f} 秒，LLM 调用 {client.calls} 次）")
+    print(f"⏱️ 延迟: p50 {percentile(latencies, 0.5) * 1000:.2f} ms，p99 {percentile(latencies, 0.99) * 1000:.2f} ms，"
+          f"最大 {latencies[-1] * 1000:.2f} ms")
+    print(f"🧩 解析方式:")
+    for method in ('rules', 'structured', 'json', 'fallback', 'error'):
+        print(f"  {method:<12} {methods[method]:>6}  {methods[method] / total:>7.1%}")
+    print(f"❗ 解析失败率（容错解析）: {methods['fallback'] / total:.1%}，调用失败率: {methods['error'] / total:.1%}")
+    rss = f"，进程最大 RSS {max_rss_mb:.1f} MB" if max_rss_mb is not None else ""
+    print(f"💾 内存: Python 分配峰值 {peak / 1024 / 1024:.2f} MB{rss}")
+
+if __name__ == '__main__':
+    main()
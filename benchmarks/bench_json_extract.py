@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+JSON 提取微基准
+对比旧的正则级联提取与 ai/json_scan.py 的单次扫描提取，
+语料为 benchmarks/corpus/malformed_outputs.json 中的模型异常输出
+
+用法: python benchmarks/bench_json_extract.py [--repeat 200] [--scale 1 10 100]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ai.json_scan import extract_json_object
+
+CORPUS_PATH = os.path.join(ROOT, 'benchmarks', 'corpus', 'malformed_outputs.json')
+
+def legacy_extract(text):
+    """旧版 _extract_json_object：三个正则依次匹配，再尝试首个 { 到最后一个 }"""
+    patterns = [
+        r'\{[^}]*"task"[^}]*\}',
+        r'\{.*?\}',
+        r'\[.*?\]'
+    ]
+    for pattern in patterns:
+        for match in re.findall(pattern, text, re.DOTALL):
+            try:
+                json.loads(match)
+                return match
+            except ValueError:
+                continue
+
+    start = text.find('{')
+    end = text.rfind('}')
+    if start != -1 and end != -1 and end > start:
+        candidate = text[start:end + 1]
+        try:
+            json.loads(candidate)
+            return candidate
+        except ValueError:
+            pass
+    return None
+
+def legacy_parse(text):
+    """旧版流程：提取后再次解析"""
+    json_text = legacy_extract(text)
+    if not json_text:
+        return None
+    parsed = json.loads(json_text)
+    return parsed if isinstance(parsed, dict) else None
+
+def new_parse(text):
+    return extract_json_object(text, prefer_key='task')
+
+def bench(func, corpus, repeat):
+    """返回每条输出的平均耗时（微秒）"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            func(text)
+    elapsed = time.perf_counter() - started
+    return elapsed / (repeat * len(corpus)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 提取微基准')
+    parser.add_argument('--repeat', type=int, default=200, help='每个规模下语料重复次数')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100], help='将每条输出重复拼接的倍数（模拟长输出）')
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    # 结果对比：新的提取器应至少能解析旧版能解析的每条输出
+    print(f"📄 语料: {len(corpus)} 条")
+    legacy_ok = new_ok = 0
+    for index, text in enumerate(corpus):
+        old, new = legacy_parse(text), new_parse(text)
+        legacy_ok += old is not None
+        new_ok += new is not None
+        if old is not None and new is None:
+            print(f"⚠️ 第 {index} 条: 旧版可解析而新版不能")
+        elif old != new:
+            print(f"ℹ️ 第 {index} 条结果不同: 旧版={old!r:.60} 新版={new!r:.60}")
+    print(f"✅ 可解析: 旧版 {legacy_ok}/{len(corpus)}，新版 {new_ok}/{len(corpus)}")
+
+    print(f"\n{'规模':>6} {'平均长度':>10} {'旧版(µs)':>12} {'新版(µs)':>12} {'加速比':>8}")
+    for scale in args.scale:
+        # 拼接后只有前部是有效对象，后部为重复的异常内容，模拟长且混乱的本地模型输出
+        scaled = [text + '\n' + text[:len(text) // 2] * (scale - 1) for text in corpus]
+        repeat = max(1, args.repeat // scale)
+        avg_len = sum(len(text) for text in scaled) // len(scaled)
+        legacy_us = bench(legacy_parse, scaled, repeat)
+        new_us = bench(new_parse, scaled, repeat)
+        print(f"{scale:>6} {avg_len:>10} {legacy_us:>12.1f} {new_us:>12.1f} {legacy_us / new_us:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,9 @@ import threading
 import uuid
 from icalendar import Calendar, Event
 import pytz
+import time
+
+from metrics import CALDAV_FETCH_SECONDS, CALDAV_EVENTS_FETCHED, CALDAV_FETCH_ERRORS
 
 # 抑制CalDAV兼容性警告
 logging.getLogger('root').setLevel(logging.WARNING)
@@ -81,7 +84,10 @@ class CalDAVClient:
                     
                     self.logger.info(f"[{self.provider_name}] 正在处理日历: {calendar_name}")
                     
+                    fetch_started = time.perf_counter()
                     results = calendar.date_search(start_time, end_time)
+                    CALDAV_FETCH_SECONDS.observe(time.perf_counter() - fetch_started, provider=self.provider_name, calendar=calendar_name)
+                    calendar_event_count = 0
                     for event in results:
                         v = event.vobject_instance.vevent
                         
@@ -138,6 +144,9 @@ class CalDAVClient:
                         if event_end and isinstance(event_start, datetime) and isinstance(event_end, datetime):
                             duration_minutes = int((event_end - event_start).total_seconds() / 60)
                         
+                        # 重复事件展开后的每次发生都带有 RECURRENCE-ID，与 UID 一起唯一标识一次发生
+                        recurrence_id = str(v.recurrence_id.value) if hasattr(v, 'recurrence_id') else ''
+                        
                         events.append({
                             'summary': event_summary,
                             'description': str(v.description.value) if hasattr(v, 'description') else '',
@@ -145,15 +154,22 @@ class CalDAVClient:
                             'end': str(event_end) if event_end else '',
                             'duration_minutes': duration_minutes,
                             'uid': str(v.uid.value) if hasattr(v, 'uid') else '',
+                            'recurrence_id': recurrence_id,
+                            'is_recurring': bool(recurrence_id) or hasattr(v, 'rrule'),
                             'calendar_name': calendar_name,  # 添加日历名称信息
                             'provider': self.provider_name,  # 添加提供商信息
                         })
+                        calendar_event_count += 1
+                    
+                    CALDAV_EVENTS_FETCHED.inc(calendar_event_count, provider=self.provider_name, calendar=calendar_name)
                 except Exception as e:
+                    CALDAV_FETCH_ERRORS.inc(provider=self.provider_name)
                     self.logger.warning(f"[{self.provider_name}] 获取日历 {calendar} 事件时出错: {e}")
                     continue
                     
             return events
         except Exception as e:
+            CALDAV_FETCH_ERRORS.inc(provider=self.provider_name)
             self.logger.error(f"[{self.provider_name}] 获取事件失败: {e}")
             return []
     
@@ -322,16 +338,22 @@ class MultiCalDAVClient:
         self.clients = []
         self.logger = logging.getLogger(__name__)
         
-        # 检测配置格式并初始化客户端
+        for provider_name, config in self._parse_provider_configs(caldav_configs):
+            self.clients.append(CalDAVClient(config, provider_name))
+        
+        self.logger.info(f"初始化了 {len(self.clients)} 个 CalDAV 客户端")
+    
+    @staticmethod
+    def _parse_provider_configs(caldav_configs):
+        """检测配置格式，返回 [(提供商名称, 配置)] 列表"""
+        provider_configs = []
         if isinstance(caldav_configs, list):
             # 配置是列表格式
             if not caldav_configs:
                 raise ValueError("CalDAV 提供商列表不能为空")
             
             for i, config in enumerate(caldav_configs):
-                provider_name = config.get('name', f'提供商{i+1}')
-                client = CalDAVClient(config, provider_name)
-                self.clients.append(client)
+                provider_configs.append((config.get('name', f'提供商{i+1}'), config))
         elif isinstance(caldav_configs, dict):
             if 'providers' in caldav_configs:
                 # 新的多提供商格式
@@ -340,18 +362,45 @@ class MultiCalDAVClient:
                     raise ValueError("providers 配置不能为空且必须是字典")
                 
                 for name, config in providers.items():
-                    client = CalDAVClient(config, name)
-                    self.clients.append(client)
+                    provider_configs.append((name, config))
             elif 'url' in caldav_configs:
                 # 传统的单个提供商格式，向后兼容
-                client = CalDAVClient(caldav_configs, "默认CalDAV")
-                self.clients.append(client)
+                provider_configs.append(("默认CalDAV", caldav_configs))
             else:
                 raise ValueError("无效的 CalDAV 配置格式")
         else:
             raise ValueError("CalDAV 配置必须是字典或列表")
+        return provider_configs
+    
+    def reconfigure(self, caldav_configs):
+        """应用新的 CalDAV 配置，只重建新增或配置有变化的提供商客户端
         
-        self.logger.info(f"初始化了 {len(self.clients)} 个 CalDAV 客户端")
+        未变化的提供商保留已建立的连接。
+        
+        Returns:
+            dict: {'added': [...], 'removed': [...], 'changed': [...], 'unchanged': [...]}
+        """
+        provider_configs = self._parse_provider_configs(caldav_configs)
+        existing = {client.provider_name: client for client in self.clients}
+        summary = {'added': [], 'removed': [], 'changed': [], 'unchanged': []}
+        
+        clients = []
+        for provider_name, config in provider_configs:
+            client = existing.pop(provider_name, None)
+            if client is None:
+                client = CalDAVClient(config, provider_name)
+                summary['added'].append(provider_name)
+            elif client.config != config:
+                client = CalDAVClient(config, provider_name)
+                summary['changed'].append(provider_name)
+            else:
+                summary['unchanged'].append(provider_name)
+            clients.append(client)
+        
+        summary['removed'] = list(existing)
+        self.clients = clients
+        self.logger.info(f"CalDAV 配置已更新: {summary}")
+        return summary
     
     def get_upcoming_events(self, hours=24):
         """从所有配置的 CalDAV 提供商获取即将到来的事件"""
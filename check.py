@@ -19,6 +19,7 @@ def check_files():
     required_files = [
         'agent.py',
         'config.py', 
+        'metrics.py',
         'config.yaml',
         'config.yaml.example',
         'requirements.txt',
@@ -1,4 +1,88 @@
+import os
+import threading
 import yaml
 
-with open("config.yaml", "r", encoding='utf-8') as f:
-    CONFIG = yaml.safe_load(f)
+CONFIG_PATH = "config.yaml"
+
+_reload_lock = threading.Lock()
+
+def load_config(path=CONFIG_PATH):
+    """读取并解析配置文件"""
+    with open(path, "r", encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+def validate_config(config):
+    """校验配置，返回错误信息列表（为空表示通过）"""
+    errors = []
+
+    # 检查必要的配置
+    for field in ['caldav', 'database', 'webhook_url']:
+        if field not in config or not config[field]:
+            errors.append(f"配置文件中缺少必要字段: {field}")
+
+    # 检查 LLM 配置（支持新的 V3 格式）
+    llm_config = config.get('llm', {})
+    if llm_config:
+        if llm_config.get('local', {}).get('enabled', False):
+            # 本地模型配置
+            if not llm_config['local'].get('model_path'):
+                errors.append("本地 LLM 配置缺少 model_path")
+        elif llm_config.get('custom', {}).get('enabled', False):
+            # 自定义配置
+            custom_config = llm_config['custom']
+            if not custom_config.get('url') or not custom_config.get('model'):
+                errors.append("自定义 LLM 配置缺少 url 或 model")
+        else:
+            # 预设提供商配置
+            if not llm_config.get('api_key'):
+                errors.append("LLM 配置缺少 api_key")
+            elif llm_config.get('api_key') == 'your-api-key-here':
+                errors.append("请在config.yaml中设置正确的 LLM API密钥")
+    else:
+        # 兼容旧格式
+        if not config.get('api_key'):
+            errors.append("配置文件中缺少必要字段: api_key 或 llm 配置")
+        elif config['api_key'] == 'your-api-key-here':
+            errors.append("请在config.yaml中设置正确的API密钥")
+
+    return errors
+
+def diff_config(old, new):
+    """比较两份配置，返回发生变化的顶层字段列表"""
+    keys = set(old) | set(new)
+    return sorted(key for key in keys if old.get(key) != new.get(key))
+
+def reload_config(path=CONFIG_PATH):
+    """重新读取配置并原地更新全局 CONFIG
+
+    原地更新保证各模块通过 `from config import CONFIG` 持有的引用仍然有效。
+    新配置校验失败时保留旧配置。其他线程读取时不会看到缺失的字段或只更新了一部分的配置：
+    先用一次 dict.update 替换所有字段（持有 GIL 的单次操作），之后才删除新配置中不存在的字段。
+
+    Returns:
+        (changed_keys, errors): 变化的顶层字段和校验错误
+    """
+    with _reload_lock:
+        try:
+            new_config = load_config(path)
+        except Exception as e:
+            return [], [f"读取配置文件失败: {e}"]
+
+        errors = validate_config(new_config)
+        if errors:
+            return [], errors
+
+        changed = diff_config(CONFIG, new_config)
+        CONFIG.update(new_config)
+        for key in [key for key in CONFIG if key not in new_config]:
+            CONFIG.pop(key, None)
+        return changed, []
+
+def config_mtime(path=CONFIG_PATH):
+    """获取配置文件修改时间，文件不存在时返回 None"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+CONFIG = load_config(CONFIG_PATH)
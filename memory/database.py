@@ -1,10 +1,100 @@
 import sqlite3
 import json
 import os
-from datetime import datetime
+import base64
+import functools
+from datetime import datetime, timedelta, timezone
+
+from metrics import DB_QUERY_SECONDS
 
 conn = None
 
+# events 表结构：重复事件的每次发生以 (uid, recurrence_id) 唯一标识，非重复事件的 recurrence_id 为空字符串
+EVENTS_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT,
+    recurrence_id TEXT NOT NULL DEFAULT '',
+    summary TEXT,
+    description TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration_minutes INTEGER,
+    calendar_name TEXT,
+    provider TEXT,
+    result TEXT,
+    reminded INTEGER DEFAULT 0,
+    content_hash TEXT,
+    analyzed_at TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (uid, recurrence_id)
+)'''
+
+# 分析结果缓存（重复事件按系列复用）超过该天数未使用则清理
+ANALYSIS_CACHE_TTL_DAYS = 30
+
+# LLM 用量日汇总保留天数
+LLM_USAGE_RETENTION_DAYS = 90
+
+# 已结束的批量分析任务保留天数
+LLM_BATCH_RETENTION_DAYS = 30
+
+# get_llm_usage 返回的汇总字段（与查询的列顺序一致）
+LLM_USAGE_FIELDS = [
+    'day', 'provider', 'requests', 'errors', 'retries', 'prompt_tokens', 'completion_tokens',
+    'cached_tokens', 'latency_seconds', 'max_latency_seconds', 'cost'
+]
+
+# events 表索引，过滤列在前，(start_time, id) 作为分页键在后
+EVENT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_events_start ON events (start_time, id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_provider_calendar_start ON events (provider, calendar_name, start_time, id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_calendar_start ON events (calendar_name, start_time, id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_remind_start ON events (reminded, json_extract(result, '$.need_remind'), start_time, id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_important_start ON events (json_extract(result, '$.important'), start_time, id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_created ON events (created_at)",
+]
+
+# query_events 可投影的字段：字段名 -> SQL 表达式
+# 分析结果中的常用字段通过 json_extract 直接读取，避免解析整个 result
+EVENT_QUERY_FIELDS = {
+    'id': 'id',
+    'uid': 'uid',
+    'recurrence_id': 'recurrence_id',
+    'summary': 'summary',
+    'description': 'description',
+    'start_time': 'start_time',
+    'end_time': 'end_time',
+    'duration_minutes': 'duration_minutes',
+    'calendar_name': 'calendar_name',
+    'provider': 'provider',
+    'reminded': 'reminded',
+    'analyzed_at': 'analyzed_at',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'result': 'result',
+    'task': "json_extract(result, '$.task')",
+    'important': "json_extract(result, '$.important')",
+    'need_remind': "json_extract(result, '$.need_remind')",
+    'minutes_before_remind': "json_extract(result, '$.minutes_before_remind')",
+    'reason': "json_extract(result, '$.reason')",
+}
+
+DEFAULT_QUERY_FIELDS = [
+    'id', 'uid', 'summary', 'start_time', 'end_time', 'duration_minutes', 'calendar_name',
+    'provider', 'reminded', 'task', 'important', 'need_remind', 'minutes_before_remind'
+]
+
+def _timed(operation):
+    """记录数据库操作耗时的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with DB_QUERY_SECONDS.time(operation=operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
 def init_db(path):
     """初始化数据库"""
     global conn
@@ -18,19 +108,7 @@ def init_db(path):
     c = conn.cursor()
     
     # 创建事件分析表
-    c.execute('''CREATE TABLE IF NOT EXISTS events (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        uid TEXT UNIQUE,
-        summary TEXT,
-        description TEXT,
-        start_time TEXT,
-        end_time TEXT,
-        duration_minutes INTEGER,
-        result TEXT,
-        reminded INTEGER DEFAULT 0,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )''')
+    c.execute(EVENTS_TABLE_SQL.format(name='events'))
     
     # 添加新字段到现有表（如果表已存在）
     try:
@@ -53,6 +131,94 @@ def init_db(path):
     except sqlite3.OperationalError:
         pass  # 字段已存在
     
+    # 旧版本以 uid 唯一，重建为 (uid, recurrence_id) 唯一
+    _migrate_events_recurrence(c)
+    
+    # 重新分析策略所需的内容哈希和分析时间
+    for column in ('content_hash TEXT', 'analyzed_at TEXT'):
+        try:
+            c.execute(f'ALTER TABLE events ADD COLUMN {column}')
+        except sqlite3.OperationalError:
+            pass  # 字段已存在
+    
+    # 创建分析结果缓存表（重复事件按系列复用分析结果）
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_cache (
+        cache_key TEXT PRIMARY KEY,
+        result TEXT,
+        hits INTEGER DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+    
+    # 创建相似标题分析缓存表（按日历和归一化标题保存 LLM 的分析结果，供标题相似的事件复用）
+    c.execute('''CREATE TABLE IF NOT EXISTS similar_analyses (
+        calendar_name TEXT NOT NULL,
+        template_id TEXT NOT NULL,
+        normalized_title TEXT NOT NULL,
+        summary TEXT,
+        source_uid TEXT,
+        description TEXT,
+        duration_minutes INTEGER,
+        result TEXT,
+        hits INTEGER DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (calendar_name, template_id, normalized_title)
+    )''')
+    
+    # 相似匹配需要比较描述和时长，旧记录缺少这两项，无法判断是否兼容，直接清空
+    try:
+        c.execute('ALTER TABLE similar_analyses ADD COLUMN description TEXT')
+        c.execute('ALTER TABLE similar_analyses ADD COLUMN duration_minutes INTEGER')
+        c.execute('DELETE FROM similar_analyses')
+    except sqlite3.OperationalError:
+        pass  # 字段已存在
+    
+    # 创建 LLM 用量日汇总表（按日期、提供商和响应状态累加）
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_usage_daily (
+        day TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        status TEXT NOT NULL,
+        requests INTEGER DEFAULT 0,
+        errors INTEGER DEFAULT 0,
+        retries INTEGER DEFAULT 0,
+        prompt_tokens INTEGER DEFAULT 0,
+        completion_tokens INTEGER DEFAULT 0,
+        cached_tokens INTEGER DEFAULT 0,
+        latency_seconds REAL DEFAULT 0,
+        max_latency_seconds REAL DEFAULT 0,
+        cost REAL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (day, provider, status)
+    )''')
+    
+    # 创建批量分析任务表（提交到提供商批量接口的请求，轮询完成后合并到 events）
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_batches (
+        id TEXT PRIMARY KEY,
+        backend TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        remote_status TEXT,
+        request_count INTEGER DEFAULT 0,
+        merged INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        error TEXT,
+        submitted_at TEXT,
+        polled_at TEXT,
+        finished_at TEXT
+    )''')
+    
+    # 批量任务中的每个事件，custom_id 对应批量接口输出中的请求标识
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_batch_items (
+        batch_id TEXT NOT NULL,
+        custom_id TEXT NOT NULL,
+        uid TEXT,
+        recurrence_id TEXT NOT NULL DEFAULT '',
+        event TEXT,
+        content_hash TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        PRIMARY KEY (batch_id, custom_id)
+    )''')
+    
     # 创建提醒记录表
     c.execute('''CREATE TABLE IF NOT EXISTS reminders (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,11 +228,42 @@ def init_db(path):
         FOREIGN KEY (event_id) REFERENCES events (id)
     )''')
     
+    # 创建查询索引（与 query_events 的过滤条件和 (start_time, id) 排序键对应）
+    for statement in EVENT_INDEXES:
+        c.execute(statement)
+    
     conn.commit()
     print(f"✅ 数据库初始化完成: {path}")
 
-def save_event_analysis(event, result):
-    """保存事件分析结果"""
+def _migrate_events_recurrence(c):
+    """将旧版 events 表（uid 唯一）迁移为 (uid, recurrence_id) 唯一
+    
+    SQLite 不能删除唯一约束，只能新建表、复制数据后替换原表。
+    """
+    columns = [row[1] for row in c.execute("PRAGMA table_info(events)")]
+    if 'recurrence_id' in columns:
+        return
+    
+    copied = ['id', 'uid', 'summary', 'description', 'start_time', 'end_time', 'duration_minutes',
+              'calendar_name', 'provider', 'result', 'reminded', 'created_at', 'updated_at']
+    column_list = ', '.join(copied)
+    c.execute(EVENTS_TABLE_SQL.format(name='events_new'))
+    c.execute(f"INSERT INTO events_new ({column_list}) SELECT {column_list} FROM events")
+    c.execute("DROP TABLE events")
+    c.execute("ALTER TABLE events_new RENAME TO events")
+    print("✅ 数据库已迁移: 事件按 (uid, recurrence_id) 存储")
+
+@_timed('save_event_analysis')
+def save_event_analysis(event, result, content_hash=None):
+    """保存事件分析结果
+    
+    同一事件（同一次发生）再次保存时更新原记录；开始时间未变时保留已提醒状态，避免重复提醒。
+    
+    Args:
+        event: 事件
+        result: 分析结果
+        content_hash: 事件内容哈希（供重新分析策略判断内容是否变化）
+    """
     if not conn:
         print("数据库连接未初始化")
         return False
@@ -74,13 +271,27 @@ def save_event_analysis(event, result):
     try:
         c = conn.cursor()
         
-        # 使用REPLACE确保同一个事件不会重复插入
         c.execute("""
-            INSERT OR REPLACE INTO events 
-            (uid, summary, description, start_time, end_time, duration_minutes, calendar_name, provider, result, updated_at) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO events 
+            (uid, recurrence_id, summary, description, start_time, end_time, duration_minutes, calendar_name, provider, result,
+             content_hash, analyzed_at, updated_at) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (uid, recurrence_id) DO UPDATE SET
+                summary = excluded.summary,
+                description = excluded.description,
+                start_time = excluded.start_time,
+                end_time = excluded.end_time,
+                duration_minutes = excluded.duration_minutes,
+                calendar_name = excluded.calendar_name,
+                provider = excluded.provider,
+                result = excluded.result,
+                content_hash = excluded.content_hash,
+                analyzed_at = excluded.analyzed_at,
+                updated_at = excluded.updated_at,
+                reminded = CASE WHEN events.start_time = excluded.start_time THEN events.reminded ELSE 0 END
         """, (
             event.get('uid', ''),
+            event.get('recurrence_id', '') or '',
             event.get('summary', ''),
             event.get('description', ''),
             event.get('start', ''),
@@ -89,6 +300,8 @@ def save_event_analysis(event, result):
             event.get('calendar_name', ''),
             event.get('provider', ''),
             json.dumps(result, ensure_ascii=False),
+            content_hash,
+            datetime.now(timezone.utc).isoformat(),
             datetime.now().isoformat()
         ))
         
@@ -99,6 +312,440 @@ def save_event_analysis(event, result):
         print(f"保存事件分析失败: {e}")
         return False
 
+@_timed('get_analysis_states')
+def get_analysis_states(events):
+    """读取事件已保存的分析状态
+    
+    Returns:
+        {(uid, recurrence_id): {'content_hash', 'analyzed_at', 'reminded', 'parsing_method'}}，未保存过的事件不在其中
+    """
+    if not conn:
+        return {}
+    
+    uids = list({event.get('uid', '') for event in events})
+    states = {}
+    try:
+        c = conn.cursor()
+        # 分批查询，避免超出 SQLite 的参数数量上限
+        for offset in range(0, len(uids), 500):
+            batch = uids[offset:offset + 500]
+            c.execute(f"""
+                SELECT uid, recurrence_id, content_hash, analyzed_at, reminded, json_extract(result, '$._parsing_method')
+                FROM events
+                WHERE uid IN ({', '.join('?' * len(batch))})
+            """, batch)
+            for uid, recurrence_id, content_hash, analyzed_at, reminded, parsing_method in c.fetchall():
+                states[(uid, recurrence_id)] = {
+                    'content_hash': content_hash,
+                    'analyzed_at': analyzed_at,
+                    'reminded': bool(reminded),
+                    'parsing_method': parsing_method
+                }
+        return states
+        
+    except Exception as e:
+        print(f"读取分析状态失败: {e}")
+        return {}
+
+@_timed('get_cached_analysis')
+def get_cached_analysis(cache_key):
+    """读取缓存的分析结果，命中时更新使用次数和时间
+    
+    Returns:
+        分析结果字典，未命中时返回 None
+    """
+    if not conn:
+        return None
+    
+    try:
+        c = conn.cursor()
+        c.execute("SELECT result FROM analysis_cache WHERE cache_key = ?", (cache_key,))
+        row = c.fetchone()
+        if not row:
+            return None
+        
+        c.execute("""
+            UPDATE analysis_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP
+            WHERE cache_key = ?
+        """, (cache_key,))
+        conn.commit()
+        return json.loads(row[0])
+        
+    except Exception as e:
+        print(f"读取分析缓存失败: {e}")
+        return None
+
+@_timed('save_cached_analysis')
+def save_cached_analysis(cache_key, result):
+    """保存分析结果到缓存"""
+    if not conn:
+        return False
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            INSERT OR REPLACE INTO analysis_cache (cache_key, result, hits, created_at, last_used_at)
+            VALUES (?, ?, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        """, (cache_key, json.dumps(result, ensure_ascii=False)))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        print(f"保存分析缓存失败: {e}")
+        return False
+
+@_timed('get_similar_analyses')
+def get_similar_analyses(calendar_name, template_id, limit=500):
+    """读取同一日历中可供相似标题复用的分析结果（最近使用的在前）
+    
+    Returns:
+        [{'normalized_title', 'summary', 'source_uid', 'description', 'duration_minutes', 'result'}, ...]，
+        description 为归一化后的描述，result 为 JSON 文本
+    """
+    if not conn:
+        return []
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT normalized_title, summary, source_uid, description, duration_minutes, result
+            FROM similar_analyses
+            WHERE calendar_name = ? AND template_id = ?
+            ORDER BY last_used_at DESC
+            LIMIT ?
+        """, (calendar_name, template_id, limit))
+        return [
+            dict(zip(['normalized_title', 'summary', 'source_uid', 'description', 'duration_minutes', 'result'], row))
+            for row in c.fetchall()
+        ]
+        
+    except Exception as e:
+        print(f"读取相似标题缓存失败: {e}")
+        return []
+
+@_timed('save_similar_analysis')
+def save_similar_analysis(calendar_name, template_id, normalized_title, summary, source_uid,
+                          description, duration_minutes, result):
+    """保存可供相似标题复用的分析结果（同一归一化标题只保留最新的一条）"""
+    if not conn:
+        return False
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            INSERT OR REPLACE INTO similar_analyses 
+            (calendar_name, template_id, normalized_title, summary, source_uid, description, duration_minutes,
+             result, hits, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        """, (calendar_name, template_id, normalized_title, summary, source_uid, description, duration_minutes, result))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        print(f"保存相似标题缓存失败: {e}")
+        return False
+
+@_timed('touch_similar_analysis')
+def touch_similar_analysis(calendar_name, normalized_title, template_id):
+    """记录一次相似标题复用"""
+    if not conn:
+        return False
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE similar_analyses SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP
+            WHERE calendar_name = ? AND template_id = ? AND normalized_title = ?
+        """, (calendar_name, template_id, normalized_title))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        print(f"更新相似标题缓存失败: {e}")
+        return False
+
+@_timed('record_llm_usage')
+def record_llm_usage(provider, status, success, usage=None, latency=0.0, retries=0, cost=0.0, day=None):
+    """累加一次 LLM 调用到当天的用量汇总
+    
+    Args:
+        provider: 提供商名称
+        status: 响应状态（HTTP 状态码，或 ok/error）
+        success: 是否成功
+        usage: 令牌用量 {'prompt_tokens', 'completion_tokens', 'cached_tokens'}
+        latency: 请求耗时（秒，含重试）
+        retries: 重试次数
+        cost: 估算费用
+        day: 日期（YYYY-MM-DD），默认为本地时间的今天
+    """
+    if not conn:
+        return False
+    
+    usage = usage or {}
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    try:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO llm_usage_daily 
+            (day, provider, status, requests, errors, retries, prompt_tokens, completion_tokens, cached_tokens,
+             latency_seconds, max_latency_seconds, cost, updated_at)
+            VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (day, provider, status) DO UPDATE SET
+                requests = requests + 1,
+                errors = errors + excluded.errors,
+                retries = retries + excluded.retries,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                completion_tokens = completion_tokens + excluded.completion_tokens,
+                cached_tokens = cached_tokens + excluded.cached_tokens,
+                latency_seconds = latency_seconds + excluded.latency_seconds,
+                max_latency_seconds = MAX(max_latency_seconds, excluded.max_latency_seconds),
+                cost = cost + excluded.cost,
+                updated_at = CURRENT_TIMESTAMP
+        """, (
+            day,
+            provider,
+            str(status),
+            0 if success else 1,
+            retries,
+            usage.get('prompt_tokens', 0) or 0,
+            usage.get('completion_tokens', 0) or 0,
+            usage.get('cached_tokens', 0) or 0,
+            latency,
+            latency,
+            cost
+        ))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        print(f"记录LLM用量失败: {e}")
+        return False
+
+@_timed('get_llm_usage')
+def get_llm_usage(days=7, provider=None):
+    """按日期和提供商汇总 LLM 用量
+    
+    Args:
+        days: 包含今天在内的天数
+        provider: 只返回指定提供商
+        
+    Returns:
+        [{'day', 'provider', 'requests', 'errors', ..., 'statuses': {状态: 次数}}, ...]，按日期倒序
+    """
+    if not conn:
+        return []
+    
+    conditions = ["day >= date('now', 'localtime', ?)"]
+    params = [f"-{max(days, 1) - 1} days"]
+    if provider is not None:
+        conditions.append("provider = ?")
+        params.append(provider)
+    
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT day, provider, SUM(requests), SUM(errors), SUM(retries), SUM(prompt_tokens),
+                   SUM(completion_tokens), SUM(cached_tokens), SUM(latency_seconds), MAX(max_latency_seconds),
+                   SUM(cost), json_group_object(status, requests)
+            FROM llm_usage_daily
+            WHERE {' AND '.join(conditions)}
+            GROUP BY day, provider
+            ORDER BY day DESC, provider ASC
+        """, params)
+        
+        usage = []
+        for row in c.fetchall():
+            entry = dict(zip(LLM_USAGE_FIELDS, row[:11]))
+            entry['statuses'] = json.loads(row[11]) if row[11] else {}
+            entry['avg_latency_seconds'] = entry['latency_seconds'] / entry['requests'] if entry['requests'] else 0.0
+            usage.append(entry)
+        return usage
+        
+    except Exception as e:
+        print(f"查询LLM用量失败: {e}")
+        return []
+
+@_timed('create_llm_batch')
+def create_llm_batch(batch_id, backend, items):
+    """记录已提交的批量分析任务
+    
+    Args:
+        batch_id: 批量接口返回的任务ID
+        backend: 批量接口类型（openai/local）
+        items: [{'custom_id', 'event', 'content_hash'}, ...]
+    """
+    if not conn:
+        return False
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO llm_batches (id, backend, status, request_count, submitted_at)
+            VALUES (?, ?, 'pending', ?, ?)
+        """, (batch_id, backend, len(items), datetime.now(timezone.utc).isoformat()))
+        c.executemany("""
+            INSERT INTO llm_batch_items (batch_id, custom_id, uid, recurrence_id, event, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(
+            batch_id,
+            item['custom_id'],
+            item['event'].get('uid', ''),
+            item['event'].get('recurrence_id', '') or '',
+            json.dumps(item['event'], ensure_ascii=False, default=str),
+            item['content_hash']
+        ) for item in items])
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        print(f"记录批量分析任务失败: {e}")
+        return False
+
+@_timed('get_pending_llm_batches')
+def get_pending_llm_batches():
+    """获取尚未结束的批量分析任务（先提交的在前）"""
+    if not conn:
+        return []
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, backend, remote_status, request_count, submitted_at
+            FROM llm_batches
+            WHERE status = 'pending'
+            ORDER BY submitted_at ASC
+        """)
+        return [
+            dict(zip(['id', 'backend', 'remote_status', 'request_count', 'submitted_at'], row))
+            for row in c.fetchall()
+        ]
+        
+    except Exception as e:
+        print(f"查询批量分析任务失败: {e}")
+        return []
+
+@_timed('get_llm_batch_items')
+def get_llm_batch_items(batch_id):
+    """获取批量分析任务中的事件
+    
+    Returns:
+        [{'custom_id', 'event', 'content_hash', 'status'}, ...]
+    """
+    if not conn:
+        return []
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT custom_id, event, content_hash, status
+            FROM llm_batch_items
+            WHERE batch_id = ?
+        """, (batch_id,))
+        return [
+            {'custom_id': custom_id, 'event': json.loads(event), 'content_hash': content_hash, 'status': status}
+            for custom_id, event, content_hash, status in c.fetchall()
+        ]
+        
+    except Exception as e:
+        print(f"查询批量分析事件失败: {e}")
+        return []
+
+@_timed('update_llm_batch')
+def update_llm_batch(batch_id, remote_status, status='pending', item_statuses=None, error=None):
+    """更新批量分析任务的轮询结果
+    
+    Args:
+        batch_id: 任务ID
+        remote_status: 批量接口报告的状态
+        status: pending（仍在处理）、completed 或 failed
+        item_statuses: 各事件的合并结果 {custom_id: merged/stale/failed}
+        error: 任务失败的原因
+    """
+    if not conn:
+        return False
+    
+    item_statuses = item_statuses or {}
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        c = conn.cursor()
+        c.executemany("""
+            UPDATE llm_batch_items SET status = ? WHERE batch_id = ? AND custom_id = ?
+        """, [(item_status, batch_id, custom_id) for custom_id, item_status in item_statuses.items()])
+        c.execute("""
+            UPDATE llm_batches SET
+                status = ?,
+                remote_status = ?,
+                merged = merged + ?,
+                failed = failed + ?,
+                error = COALESCE(?, error),
+                polled_at = ?,
+                finished_at = CASE WHEN ? = 'pending' THEN NULL ELSE ? END
+            WHERE id = ?
+        """, (
+            status,
+            remote_status,
+            sum(1 for value in item_statuses.values() if value == 'merged'),
+            sum(1 for value in item_statuses.values() if value == 'failed'),
+            error,
+            now,
+            status,
+            now,
+            batch_id
+        ))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        print(f"更新批量分析任务失败: {e}")
+        return False
+
+@_timed('get_batched_event_keys')
+def get_batched_event_keys():
+    """已提交到尚未结束的批量任务中的事件
+    
+    Returns:
+        {(uid, recurrence_id), ...}
+    """
+    if not conn:
+        return set()
+    
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT items.uid, items.recurrence_id
+            FROM llm_batch_items AS items
+            JOIN llm_batches AS batches ON batches.id = items.batch_id
+            WHERE batches.status = 'pending'
+        """)
+        return set(c.fetchall())
+        
+    except Exception as e:
+        print(f"查询批量分析事件失败: {e}")
+        return set()
+
+@_timed('list_llm_batches')
+def list_llm_batches(limit=20):
+    """列出最近的批量分析任务（新的在前）"""
+    if not conn:
+        return []
+    
+    fields = ['id', 'backend', 'status', 'remote_status', 'request_count', 'merged', 'failed',
+              'error', 'submitted_at', 'polled_at', 'finished_at']
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT {', '.join(fields)}
+            FROM llm_batches
+            ORDER BY submitted_at DESC
+            LIMIT ?
+        """, (limit,))
+        return [dict(zip(fields, row)) for row in c.fetchall()]
+        
+    except Exception as e:
+        print(f"查询批量分析任务失败: {e}")
+        return []
+
+@_timed('get_events_to_remind')
 def get_events_to_remind():
     """获取需要提醒的事件"""
     if not conn:
@@ -139,6 +786,7 @@ def get_events_to_remind():
         print(f"获取待提醒事件失败: {e}")
         return []
 
+@_timed('mark_reminded')
 def mark_reminded(event_id, status="sent"):
     """标记事件已提醒"""
     if not conn:
@@ -163,6 +811,7 @@ def mark_reminded(event_id, status="sent"):
         print(f"标记提醒状态失败: {e}")
         return False
 
+@_timed('get_stats')
 def get_stats():
     """获取统计信息"""
     if not conn:
@@ -193,27 +842,37 @@ def get_stats():
         print(f"获取统计信息失败: {e}")
         return {}
 
+@_timed('cleanup_old_events')
 def cleanup_old_events(days=7):
-    """清理旧事件记录"""
+    """清理旧事件记录
+
+    按事件的结束时间清理，不按记录的创建时间：同一事件再次保存时保留 created_at，
+    多天的事件、预先分析的较远事件和重复系列的记录创建已久但仍然有效，删除后会被当作新事件重新分析和提醒。
+
+    Args:
+        days: 无法解析开始时间的记录超过该天数未更新时清理
+    """
     if not conn:
         return False
     
     try:
         c = conn.cursor()
+        batch_cutoff = (datetime.now(timezone.utc) - timedelta(days=LLM_BATCH_RETENTION_DAYS)).isoformat()
         
-        # 清理创建时间超过指定天数的事件
+        # 无法解析开始时间的记录无法按结束时间判断，超过指定天数未更新时清理
         c.execute("""
             DELETE FROM events 
-            WHERE created_at < datetime('now', '-{} days')
+            WHERE datetime(start_time) IS NULL
+            AND datetime(updated_at) < datetime('now', 'localtime', '-{} days')
         """.format(days))
         
         deleted_created = c.rowcount
         
-        # 清理已经结束超过1小时的事件（使用结束时间判断）
+        # 清理已经结束超过1小时的事件（使用结束时间判断，datetime() 将带时区的 ISO 时间统一为 UTC）
         c.execute("""
             DELETE FROM events 
-            WHERE end_time IS NOT NULL 
-            AND end_time < datetime('now', '-1 hour')
+            WHERE datetime(end_time) IS NOT NULL 
+            AND datetime(end_time) < datetime('now', '-1 hour')
         """)
         
         deleted_expired = c.rowcount
@@ -221,7 +880,7 @@ def cleanup_old_events(days=7):
         # 对于没有结束时间的事件，使用开始时间+持续时间来判断
         c.execute("""
             DELETE FROM events 
-            WHERE end_time IS NULL 
+            WHERE datetime(end_time) IS NULL 
             AND duration_minutes IS NOT NULL
             AND datetime(start_time, '+' || duration_minutes || ' minutes') < datetime('now', '-1 hour')
         """)
@@ -231,13 +890,42 @@ def cleanup_old_events(days=7):
         # 对于既没有结束时间也没有持续时间的事件，使用开始时间+2小时作为默认结束时间
         c.execute("""
             DELETE FROM events 
-            WHERE end_time IS NULL 
+            WHERE datetime(end_time) IS NULL 
             AND duration_minutes IS NULL
             AND datetime(start_time, '+2 hours') < datetime('now', '-1 hour')
         """)
         
         deleted_fallback = c.rowcount
         
+        # 清理长期未使用的分析缓存
+        c.execute("""
+            DELETE FROM analysis_cache 
+            WHERE last_used_at < datetime('now', '-{} days')
+        """.format(ANALYSIS_CACHE_TTL_DAYS))
+        c.execute("""
+            DELETE FROM similar_analyses 
+            WHERE last_used_at < datetime('now', '-{} days')
+        """.format(ANALYSIS_CACHE_TTL_DAYS))
+        
+        # 清理过旧的 LLM 用量汇总
+        c.execute("""
+            DELETE FROM llm_usage_daily 
+            WHERE day < date('now', 'localtime', '-{} days')
+        """.format(LLM_USAGE_RETENTION_DAYS))
+        
+        # 清理已结束的旧批量分析任务
+        c.execute("""
+            DELETE FROM llm_batch_items 
+            WHERE batch_id IN (
+                SELECT id FROM llm_batches 
+                WHERE status != 'pending' AND finished_at < ?
+            )
+        """, (batch_cutoff,))
+        c.execute("""
+            DELETE FROM llm_batches 
+            WHERE status != 'pending' AND finished_at < ?
+        """, (batch_cutoff,))
+        
         conn.commit()
         
         total_deleted = deleted_expired + deleted_no_endtime + deleted_fallback
@@ -250,6 +938,7 @@ def cleanup_old_events(days=7):
         print(f"清理旧事件失败: {e}")
         return False
 
+@_timed('get_recent_events')
 def get_recent_events(limit=10):
     """获取最近的事件记录"""
     if not conn:
@@ -289,3 +978,125 @@ def get_recent_events(limit=10):
     except Exception as e:
         print(f"获取最近事件失败: {e}")
         return []
+
+def _encode_cursor(start_time, event_id):
+    """将分页位置编码为不透明游标"""
+    raw = json.dumps([start_time, event_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    """解析分页游标，返回 (start_time, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_time, event_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return start_time, int(event_id)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+def _normalize_time_bound(value):
+    """统一时间过滤参数的格式，与存储的 'YYYY-MM-DD HH:MM:SS' 字符串比较"""
+    return value.replace('T', ' ') if value else value
+
+@_timed('query_events')
+def query_events(start_from=None, start_to=None, provider=None, calendar_name=None,
+                 important=None, need_remind=None, reminded=None, fields=None,
+                 cursor=None, limit=50, descending=False):
+    """按条件分页查询事件（基于 (start_time, id) 的游标分页）
+    
+    Args:
+        start_from: 开始时间下限（含）
+        start_to: 开始时间上限（不含）
+        provider: 提供商名称
+        calendar_name: 日历名称
+        important: 是否重要
+        need_remind: 是否需要提醒
+        reminded: 是否已提醒
+        fields: 返回字段列表，默认 DEFAULT_QUERY_FIELDS
+        cursor: 上一页返回的 next_cursor
+        limit: 每页数量
+        descending: 是否按开始时间倒序
+        
+    Returns:
+        dict: {'events': [...], 'next_cursor': str 或 None}
+        
+    Raises:
+        ValueError: 字段名或游标无效
+    """
+    fields = list(fields) if fields else list(DEFAULT_QUERY_FIELDS)
+    unknown = [field for field in fields if field not in EVENT_QUERY_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    
+    # 分页键始终查询，按需在结果中去掉
+    select_fields = list(dict.fromkeys(fields + ['id', 'start_time']))
+    columns = ', '.join(EVENT_QUERY_FIELDS[field] for field in select_fields)
+    
+    conditions = []
+    params = []
+    if start_from:
+        conditions.append("start_time >= ?")
+        params.append(_normalize_time_bound(start_from))
+    if start_to:
+        conditions.append("start_time < ?")
+        params.append(_normalize_time_bound(start_to))
+    if provider is not None:
+        conditions.append("provider = ?")
+        params.append(provider)
+    if calendar_name is not None:
+        conditions.append("calendar_name = ?")
+        params.append(calendar_name)
+    if important is not None:
+        conditions.append("json_extract(result, '$.important') = ?")
+        params.append(1 if important else 0)
+    if need_remind is not None:
+        conditions.append("json_extract(result, '$.need_remind') = ?")
+        params.append(1 if need_remind else 0)
+    if reminded is not None:
+        conditions.append("reminded = ?")
+        params.append(1 if reminded else 0)
+    if cursor:
+        cursor_start, cursor_id = _decode_cursor(cursor)
+        conditions.append("(start_time, id) < (?, ?)" if descending else "(start_time, id) > (?, ?)")
+        params.extend([cursor_start, cursor_id])
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "DESC" if descending else "ASC"
+    
+    if not conn:
+        return {'events': [], 'next_cursor': None}
+    
+    try:
+        c = conn.cursor()
+        # 多取一条用于判断是否还有下一页
+        c.execute(f"""
+            SELECT {columns}
+            FROM events
+            {where}
+            ORDER BY start_time {order}, id {order}
+            LIMIT ?
+        """, params + [limit + 1])
+        rows = c.fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        events = []
+        for row in rows:
+            record = dict(zip(select_fields, row))
+            if 'result' in record:
+                record['result'] = json.loads(record['result']) if record['result'] else {}
+            for flag in ('important', 'need_remind', 'reminded'):
+                if flag in record and record[flag] is not None:
+                    record[flag] = bool(record[flag])
+            events.append({field: record[field] for field in fields})
+        
+        next_cursor = None
+        if has_more and rows:
+            last = dict(zip(select_fields, rows[-1]))
+            next_cursor = _encode_cursor(last['start_time'], last['id'])
+        
+        return {'events': events, 'next_cursor': next_cursor}
+        
+    except Exception as e:
+        print(f"查询事件失败: {e}")
+        return {'events': [], 'next_cursor': None}
@@ -0,0 +1,269 @@
+"""
+轻量级运行指标模块
+在进程内维护计数器、仪表和直方图，并以 Prometheus 文本格式导出
+不依赖任何外部服务或第三方库
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    """格式化指标数值"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    """转义标签值中的特殊字符"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple, extra: Optional[Dict[str, str]] = None) -> str:
+    """生成 {a="1",b="2"} 形式的标签文本"""
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.extend(f'{name}="{_escape_label(value)}"' for name, value in extra.items())
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """指标基类"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        """将标签字典转换为有序元组"""
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """以文本格式导出指标"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        lines.extend(self._render_samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表值"""
+
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文管理器，退出时记录耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {'le': _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """导出所有指标（Prometheus 文本格式 0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# CalDAV 获取
+CALDAV_FETCH_SECONDS = REGISTRY.histogram(
+    'chrona_caldav_fetch_seconds', 'CalDAV 日历查询耗时（秒）', ('provider', 'calendar'))
+CALDAV_EVENTS_FETCHED = REGISTRY.counter(
+    'chrona_caldav_events_fetched_total', '从 CalDAV 获取到的事件数', ('provider', 'calendar'))
+CALDAV_FETCH_ERRORS = REGISTRY.counter(
+    'chrona_caldav_fetch_errors_total', 'CalDAV 查询失败次数', ('provider',))
+
+# LLM 调用与解析
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    'chrona_llm_request_seconds', 'LLM 请求耗时（秒）', ('provider',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+LLM_REQUESTS = REGISTRY.counter(
+    'chrona_llm_requests_total', 'LLM 请求次数', ('provider', 'status'))
+LLM_TOKENS = REGISTRY.counter(
+    'chrona_llm_tokens_total', 'LLM 令牌用量（prompt/completion/cached）', ('provider', 'type'))
+LLM_USAGE_ESTIMATED = REGISTRY.counter(
+    'chrona_llm_usage_estimated_total', '流式请求提前关闭、没有收到用量统计而按文本长度估算令牌数的请求数', ('provider',))
+LLM_COST = REGISTRY.counter(
+    'chrona_llm_cost_total', '按 llm.usage.pricing 估算的 LLM 费用', ('provider',))
+LLM_STREAMS = REGISTRY.counter(
+    'chrona_llm_streams_total', '流式请求结束方式（early_close 为分析对象闭合后提前关闭连接，completed 为读完整个响应）', ('provider', 'result'))
+LLM_FAILOVER = REGISTRY.counter(
+    'chrona_llm_failover_total', '故障转移到备用提供商并成功的次数', ('provider',))
+LLM_HEDGED_REQUESTS = REGISTRY.counter(
+    'chrona_llm_hedged_requests_total', '对冲请求（fired/primary/secondary）', ('result',))
+LLM_PROVIDER_HEALTHY = REGISTRY.gauge(
+    'chrona_llm_provider_healthy', '提供商是否可用（1 可用，0 冷却中）', ('provider',))
+ANALYSIS_PARSE = REGISTRY.counter(
+    'chrona_analysis_parse_total', '事件分析结果来源（rules/structured/json/fallback/failed）', ('provider', 'method'))
+LOCAL_PREFIX_CACHE = REGISTRY.counter(
+    'chrona_local_prefix_cache_total', '本地模型前缀 KV 状态来源（reused/memory/disk/computed）', ('result',))
+LOCAL_MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    'chrona_local_model_load_seconds', '本地模型最近一次加载的耗时（秒）', ())
+LOCAL_MODEL_RSS_BYTES = REGISTRY.gauge(
+    'chrona_local_model_resident_memory_bytes', '本地模型加载和预热后进程的常驻内存（字节）', ())
+LOCAL_WORKER_RESTARTS = REGISTRY.counter(
+    'chrona_local_worker_restarts_total', '本地推理工作进程重启次数', ('reason',))
+ANALYSIS_CASCADE = REGISTRY.counter(
+    'chrona_analysis_cascade_total', '级联模式低成本模型的结果（accepted 或升级原因 error/fallback/invalid/low_confidence）', ('outcome',))
+ANALYSIS_CACHE = REGISTRY.counter(
+    'chrona_analysis_cache_requests_total', '分析结果缓存查询（hit/miss）', ('result',))
+ANALYSIS_SIMILAR = REGISTRY.counter(
+    'chrona_analysis_similar_requests_total', '相似标题缓存查询（hit/miss）', ('result',))
+ANALYSIS_POLICY = REGISTRY.counter(
+    'chrona_analysis_policy_total', '重新分析策略的判断结果（new/content/fallback/threshold/max_age/disabled 需分析，fresh 跳过）', ('decision',))
+ANALYSIS_COALESCED = REGISTRY.counter(
+    'chrona_analysis_coalesced_total', '等待并共享进行中的同一事件分析结果的次数', ())
+ANALYSIS_LOOKAHEAD = REGISTRY.counter(
+    'chrona_analysis_lookahead_total', '预先分析 24 小时之后事件的结果（analyzed/failed）', ('result',))
+ANALYSIS_BATCH = REGISTRY.counter(
+    'chrona_analysis_batch_total', '批量分析的事件数（submitted 已提交，merged/stale/failed 为合并结果）', ('result',))
+ANALYSIS_DEFERRED = REGISTRY.counter(
+    'chrona_analysis_deferred_total', '因单轮时间预算或每日 LLM 预算用完而推迟到下一轮的事件数', ())
+
+# 提醒与通知
+REMINDER_LATENESS_SECONDS = REGISTRY.histogram(
+    'chrona_reminder_lateness_seconds', '实际发送时间与 remind_at 的差值（秒）', (),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+WEBHOOK_SECONDS = REGISTRY.histogram(
+    'chrona_webhook_seconds', 'Webhook 发送耗时（秒）', ('type',))
+WEBHOOK_REQUESTS = REGISTRY.counter(
+    'chrona_webhook_requests_total', 'Webhook 发送次数', ('type', 'status'))
+
+# 数据库与心跳
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'chrona_db_query_seconds', '数据库操作耗时（秒）', ('operation',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+HEARTBEAT_REQUESTS = REGISTRY.counter(
+    'chrona_heartbeat_requests_total', '心跳包发送次数', ('status',))
+
+# 后台任务
+JOBS = REGISTRY.counter(
+    'chrona_jobs_total', '后台任务状态变化（started/coalesced/succeeded/failed）', ('kind', 'status'))
+
+
+def render_metrics() -> str:
+    """导出全部指标文本"""
+    return REGISTRY.render()
@@ -1,7 +1,20 @@
 # 服务模块
+# 子模块按需导入：只用到通知或心跳时不会加载 FastAPI/uvicorn
 
-from .api_server import APIServer
-from .heartbeat import HeartbeatSender
-from .notifier import send_notification, send_test_notification
+import importlib
+
+_EXPORTS = {
+    'APIServer': '.api_server',
+    'HeartbeatSender': '.heartbeat',
+    'send_notification': '.notifier',
+    'send_test_notification': '.notifier',
+}
 
 __all__ = ['APIServer', 'HeartbeatSender', 'send_notification', 'send_test_notification']
+
+def __getattr__(name):
+    """首次访问导出名称时再导入对应子模块"""
+    if name in _EXPORTS:
+        module = importlib.import_module(_EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
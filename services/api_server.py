@@ -1,5 +1,5 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, List, Optional
@@ -7,9 +7,11 @@ import threading
 import uvicorn
 from datetime import datetime, timedelta
 
-from memory.database import get_stats, get_events_to_remind, get_recent_events
+from memory.database import get_stats, get_events_to_remind, get_recent_events, query_events, get_llm_usage, list_llm_batches
 from caldav_client.client import get_upcoming_events, create_event, get_available_calendars
-from ai.analyzer import analyze_event
+from ai.llm_client import get_llm_health, get_local_model_status, get_local_worker_status
+from ai.usage import UsageBudget, summarize_by_provider, summarize_usage
+from metrics import render_metrics
 
 class CreateEventRequest(BaseModel):
     """创建事件请求模型"""
@@ -131,6 +133,9 @@ class APIServer:
                 result = {
                     "database_stats": stats,
                     "heartbeat_status": heartbeat_status,
+                    "local_worker_status": get_local_worker_status(),
+                    "local_model_status": get_local_model_status(),
+                    "llm_health": get_llm_health(),
                     "timestamp": now.isoformat()
                 }
                 self._stats_cache = result
@@ -139,6 +144,79 @@ class APIServer:
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.app.get("/metrics", response_class=PlainTextResponse)
+        async def get_metrics():
+            """导出 Prometheus 文本格式的运行指标"""
+            return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+        @self.app.get("/llm/usage")
+        async def get_llm_usage_api(days: int = 7, provider: Optional[str] = None):
+            """LLM 用量：按日期和提供商的明细、按提供商的合计，以及今天的预算使用情况"""
+            if days <= 0 or days > 90:
+                raise HTTPException(status_code=400, detail="days 必须在 1-90 之间")
+            usage = get_llm_usage(days=days, provider=provider)
+            return {
+                "days": days,
+                "daily": usage,
+                "providers": summarize_by_provider(usage),
+                "total": summarize_usage(usage),
+                "budget": UsageBudget(self.app_config).status(),
+                "timestamp": datetime.now().isoformat()
+            }
+
+        @self.app.get("/llm/batches")
+        async def list_llm_batches_api(limit: int = 20):
+            """最近的批量分析任务及合并结果"""
+            if limit <= 0 or limit > 100:
+                raise HTTPException(status_code=400, detail="limit 必须在 1-100 之间")
+            return {
+                "batches": list_llm_batches(limit=limit),
+                "timestamp": datetime.now().isoformat()
+            }
+
+        @self.app.get("/events")
+        async def query_events_api(
+            start_from: Optional[str] = None,
+            start_to: Optional[str] = None,
+            provider: Optional[str] = None,
+            calendar_name: Optional[str] = None,
+            important: Optional[bool] = None,
+            need_remind: Optional[bool] = None,
+            reminded: Optional[bool] = None,
+            fields: Optional[str] = None,
+            cursor: Optional[str] = None,
+            limit: int = 50,
+            order: str = "asc"
+        ):
+            """分页查询已分析的事件，支持按时间范围、提供商、日历和分析结果过滤"""
+            if limit <= 0 or limit > 500:
+                raise HTTPException(status_code=400, detail="limit 必须在 1-500 之间")
+            if order not in ("asc", "desc"):
+                raise HTTPException(status_code=400, detail="order 只能是 asc 或 desc")
+            field_list = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+            try:
+                page = query_events(
+                    start_from=start_from,
+                    start_to=start_to,
+                    provider=provider,
+                    calendar_name=calendar_name,
+                    important=important,
+                    need_remind=need_remind,
+                    reminded=reminded,
+                    fields=field_list,
+                    cursor=cursor,
+                    limit=limit,
+                    descending=(order == "desc")
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return {
+                "events": page['events'],
+                "count": len(page['events']),
+                "next_cursor": page['next_cursor'],
+                "timestamp": datetime.now().isoformat()
+            }
+
         @self.app.get("/events/upcoming")
         async def get_upcoming_events_api():
             now = datetime.now()
@@ -224,37 +302,59 @@ class APIServer:
             return result
 
         @self.app.post("/agent/fetch")
-        async def trigger_fetch(background_tasks: BackgroundTasks):
-            """手动触发事件获取和分析"""
+        async def trigger_fetch():
+            """手动触发事件获取和分析（重复触发会合并到正在运行的任务）"""
             if not self.calendar_agent:
                 raise HTTPException(status_code=400, detail="日程代理未配置")
             
-            def fetch_events():
-                self.calendar_agent.fetch_and_analyze_events()
-            
-            background_tasks.add_task(fetch_events)
+            job, created = self.calendar_agent.run_job('fetch', source='api', wait=False)
             
             return {
-                "message": "事件获取和分析已触发",
+                "message": "事件获取和分析已触发" if created else "已有事件获取任务在运行，已合并到该任务",
+                "job_id": job.id,
+                "coalesced": not created,
+                "job": job.to_dict(),
                 "timestamp": datetime.now().isoformat()
             }
         
         @self.app.post("/agent/check-reminders")
-        async def trigger_reminder_check(background_tasks: BackgroundTasks):
-            """手动触发提醒检查"""
+        async def trigger_reminder_check():
+            """手动触发提醒检查（重复触发会合并到正在运行的任务）"""
             if not self.calendar_agent:
                 raise HTTPException(status_code=400, detail="日程代理未配置")
             
-            def check_reminders():
-                self.calendar_agent.check_and_send_reminders()
-            
-            background_tasks.add_task(check_reminders)
+            job, created = self.calendar_agent.run_job('reminders', source='api', wait=False)
             
             return {
-                "message": "提醒检查已触发",
+                "message": "提醒检查已触发" if created else "已有提醒检查任务在运行，已合并到该任务",
+                "job_id": job.id,
+                "coalesced": not created,
+                "job": job.to_dict(),
                 "timestamp": datetime.now().isoformat()
             }
         
+        @self.app.get("/jobs")
+        async def list_jobs(limit: int = 20):
+            """列出最近的后台任务"""
+            if not self.calendar_agent:
+                raise HTTPException(status_code=400, detail="日程代理未配置")
+            jobs = self.calendar_agent.job_manager.list_jobs(limit)
+            return {
+                "jobs": jobs,
+                "count": len(jobs),
+                "timestamp": datetime.now().isoformat()
+            }
+        
+        @self.app.get("/jobs/{job_id}")
+        async def get_job(job_id: str):
+            """查询后台任务进度和耗时"""
+            if not self.calendar_agent:
+                raise HTTPException(status_code=400, detail="日程代理未配置")
+            job = self.calendar_agent.job_manager.get(job_id)
+            if not job:
+                raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+            return job.to_dict()
+        
         @self.app.get("/config")
         async def get_config():
             now = datetime.now()
@@ -0,0 +1,116 @@
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from config import CONFIG_PATH, config_mtime, reload_config
+
+class ConfigWatcher:
+    """配置文件监视器，在文件修改或收到 SIGHUP 时重新加载配置"""
+
+    def __init__(self, config: Dict, on_reload: Callable[[List[str]], None], path: str = CONFIG_PATH):
+        """初始化配置监视器
+
+        Args:
+            config: 全局配置（读取 config_reload 段）
+            on_reload: 配置变化后的回调，参数为变化的顶层字段列表
+            path: 配置文件路径
+        """
+        self.config = config
+        self.enabled = True
+        self.interval = 5
+        self._apply_settings()
+        self.path = path
+        self.on_reload = on_reload
+
+        self.running = False
+        self.thread = None
+        self.reload_count = 0
+        self.last_reload_time = None
+        self.last_error = None
+        self._last_mtime = config_mtime(path)
+        self._reload_requested = threading.Event()
+
+    def _apply_settings(self):
+        """读取 config_reload 段（启动时和每次重新加载后）"""
+        reload_config_section = self.config.get('config_reload', {}) or {}
+        self.enabled = reload_config_section.get('enabled', True)
+        self.interval = reload_config_section.get('interval', 5)
+
+    def start(self):
+        """启动监视线程"""
+        if self.running:
+            return True
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name="config-watcher")
+        self.thread.start()
+
+        if self.enabled:
+            print(f"🔄 配置热加载已启用，检查间隔: {self.interval}秒（也可发送 SIGHUP 触发）")
+        return True
+
+    def stop(self):
+        """停止监视线程"""
+        if not self.running:
+            return
+
+        self.running = False
+        self._reload_requested.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def request_reload(self):
+        """请求重新加载（可在信号处理器中安全调用）"""
+        self._reload_requested.set()
+
+    def _run(self):
+        """监视主循环：轮询文件修改时间或等待显式的重新加载请求"""
+        while self.running:
+            # 未启用轮询时只等待 SIGHUP 请求
+            timeout = self.interval if self.enabled else None
+            requested = self._reload_requested.wait(timeout)
+            self._reload_requested.clear()
+            if not self.running:
+                break
+
+            mtime = config_mtime(self.path)
+            if requested or (mtime is not None and mtime != self._last_mtime):
+                self._last_mtime = mtime
+                self.reload()
+
+    def reload(self):
+        """重新加载配置并通知变化"""
+        changed, errors = reload_config(self.path)
+        if errors:
+            self.last_error = "; ".join(errors)
+            print(f"❌ 配置重新加载失败，继续使用旧配置: {self.last_error}")
+            return []
+
+        self.last_error = None
+        self.last_reload_time = datetime.now()
+        if not changed:
+            print("🔄 配置文件已重新读取，无变化")
+            return []
+
+        self.reload_count += 1
+        print(f"🔄 配置已重新加载，变化的配置项: {', '.join(changed)}")
+        if 'config_reload' in changed:
+            self._apply_settings()
+            print(f"🔄 配置热加载设置已更新: {'启用' if self.enabled else '停用'}，检查间隔: {self.interval}秒")
+        try:
+            self.on_reload(changed)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ 应用新配置时出错: {e}")
+        return changed
+
+    def get_status(self) -> Dict:
+        """获取监视器状态"""
+        return {
+            'enabled': self.enabled,
+            'running': self.running,
+            'interval': self.interval,
+            'reload_count': self.reload_count,
+            'last_reload_time': self.last_reload_time.isoformat() if self.last_reload_time else None,
+            'last_error': self.last_error
+        }
@@ -5,16 +5,13 @@ import logging
 from datetime import datetime
 from typing import Dict, Optional
 
+from metrics import HEARTBEAT_REQUESTS
+
 class HeartbeatSender:
     """心跳包发送器，用于向监控服务发送状态更新"""
     
     def __init__(self, config: Dict):
-        self.config = config.get('heartbeat', {})
-        self.enabled = self.config.get('enabled', False)
-        self.url = self.config.get('url', '')
-        self.interval = self.config.get('interval', 60)
-        self.timeout = self.config.get('timeout', 10)
-        self.params = self.config.get('params', {})
+        self._apply_config(config)
         
         self.running = False
         self.thread = None
@@ -25,6 +22,26 @@ class HeartbeatSender:
         # 配置日志
         self.logger = logging.getLogger(__name__)
     
+    def _apply_config(self, config: Dict):
+        """读取心跳包配置"""
+        self.config = config.get('heartbeat', {})
+        self.enabled = self.config.get('enabled', False)
+        self.url = self.config.get('url', '')
+        self.interval = self.config.get('interval', 60)
+        self.timeout = self.config.get('timeout', 10)
+        self.params = self.config.get('params', {})
+    
+    def reconfigure(self, config: Dict):
+        """应用新的心跳包配置（热加载），必要时重启发送线程"""
+        was_running = self.running
+        if was_running:
+            self.stop()
+        self._apply_config(config)
+        if self.enabled and self.url:
+            self.start()
+        elif was_running:
+            print("💗 心跳包已在新配置中停用")
+    
     def start(self):
         """启动心跳包发送"""
         if not self.enabled or not self.url:
@@ -85,18 +102,22 @@ class HeartbeatSender:
             if response.status_code == 200:
                 self.send_count += 1
                 self.last_send_time = datetime.now()
+                HEARTBEAT_REQUESTS.inc(status='success')
                 return True
             else:
                 self.error_count += 1
+                HEARTBEAT_REQUESTS.inc(status='failure')
                 print(f"💗 心跳包发送失败，状态码: {response.status_code}")
                 return False
                 
         except requests.exceptions.RequestException as e:
             self.error_count += 1
+            HEARTBEAT_REQUESTS.inc(status='failure')
             print(f"💗 心跳包发送异常: {e}")
             return False
         except Exception as e:
             self.error_count += 1
+            HEARTBEAT_REQUESTS.inc(status='failure')
             print(f"💗 心跳包发送错误: {e}")
             return False
     
@@ -0,0 +1,152 @@
+"""
+后台任务管理模块
+对同类任务去重合并，保证同一时刻每种任务只有一个在运行
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import JOBS
+
+
+class Job:
+    """单个后台任务及其进度"""
+
+    def __init__(self, kind: str, source: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.source = source
+        self.status = 'pending'
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.coalesced = 0  # 合并到本任务的重复触发次数
+        self.progress = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def update(self, **progress):
+        """设置进度字段"""
+        with self._lock:
+            self.progress.update(progress)
+
+    def advance(self, key: str, amount: int = 1):
+        """累加进度计数"""
+        with self._lock:
+            self.progress[key] = self.progress.get(key, 0) + amount
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待任务结束"""
+        return self._done.wait(timeout)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('pending', 'running')
+
+    def to_dict(self) -> Dict:
+        """转换为 API 响应"""
+        with self._lock:
+            progress = dict(self.progress)
+        duration = None
+        if self.started_at:
+            duration = ((self.finished_at or datetime.now()) - self.started_at).total_seconds()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'source': self.source,
+            'status': self.status,
+            'progress': progress,
+            'coalesced': self.coalesced,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_seconds': round(duration, 3) if duration is not None else None
+        }
+
+
+class JobManager:
+    """后台任务管理器
+
+    同一种任务（如 fetch、reminders）同时只允许一个在运行，
+    运行期间的重复触发会合并到正在运行的任务并返回其任务ID。
+    API 和主循环共用同一个管理器。
+    """
+
+    def __init__(self, history_size: int = 50):
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # 任务ID -> Job，保留最近的任务记录
+        self._active = {}  # 任务类型 -> 正在运行的 Job
+
+    def submit(self, kind: str, target: Callable[[Job], None], source: str = 'api', wait: bool = False) -> Tuple[Job, bool]:
+        """提交任务
+
+        Args:
+            kind: 任务类型，同类型任务互斥
+            target: 任务函数，接收 Job 用于上报进度
+            source: 触发来源（api/scheduler）
+            wait: 是否在当前线程同步执行
+
+        Returns:
+            (Job, created): created 为 False 表示合并到了已在运行的任务
+        """
+        with self._lock:
+            running = self._active.get(kind)
+            if running is not None and running.active:
+                running.coalesced += 1
+                JOBS.inc(kind=kind, status='coalesced')
+                return running, False
+
+            job = Job(kind, source)
+            self._active[kind] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history_size:
+                self._jobs.popitem(last=False)
+
+        JOBS.inc(kind=kind, status='started')
+        if wait:
+            self._run(job, target)
+        else:
+            thread = threading.Thread(target=self._run, args=(job, target), daemon=True, name=f"job-{kind}-{job.id}")
+            thread.start()
+        return job, True
+
+    def _run(self, job: Job, target: Callable[[Job], None]):
+        """执行任务并记录状态"""
+        job.status = 'running'
+        job.started_at = datetime.now()
+        try:
+            target(job)
+            job.status = 'succeeded'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            print(f"❌ 后台任务 {job.kind} ({job.id}) 执行失败: {e}")
+        finally:
+            job.finished_at = datetime.now()
+            with self._lock:
+                if self._active.get(job.kind) is job:
+                    del self._active[job.kind]
+            JOBS.inc(kind=job.kind, status=job.status)
+            job._done.set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """按ID获取任务"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_job(self, kind: str) -> Optional[Job]:
+        """获取某类型正在运行的任务"""
+        with self._lock:
+            return self._active.get(kind)
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        """列出最近的任务（新的在前）"""
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [job.to_dict() for job in reversed(jobs)]
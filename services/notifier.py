@@ -1,24 +1,50 @@
 import requests
 import json
 import re
+import time
 from datetime import datetime
 
+from metrics import WEBHOOK_SECONDS, WEBHOOK_REQUESTS
+
+# 复用连接的 HTTP 会话，webhook 配置变化时重建
+_session = None
+
+def get_session():
+    """获取通知使用的 HTTP 会话"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+def reset_session():
+    """关闭并丢弃当前会话（webhook 配置变化后调用）"""
+    global _session
+    session, _session = _session, None
+    if session is not None:
+        session.close()
+
 def send_notification(event, result, webhook_url, webhook_type="generic", config=None):
     """发送Webhook通知"""
+    started = time.perf_counter()
+    success = False
     try:
         # 根据webhook类型构造不同格式的数据
         if webhook_type == "gotify":
-            return send_gotify_notification(event, result, webhook_url)
+            success = send_gotify_notification(event, result, webhook_url)
         elif webhook_type == "slack":
-            return send_slack_notification(event, result, webhook_url)
+            success = send_slack_notification(event, result, webhook_url)
         elif webhook_type == "custom":
-            return send_custom_notification(event, result, webhook_url, config)
+            success = send_custom_notification(event, result, webhook_url, config)
         else:
-            return send_generic_notification(event, result, webhook_url)
+            success = send_generic_notification(event, result, webhook_url)
+        return success
             
     except Exception as e:
         print(f"❌ 发送通知时出现未知错误: {e}")
         return False
+    finally:
+        WEBHOOK_SECONDS.observe(time.perf_counter() - started, type=webhook_type)
+        WEBHOOK_REQUESTS.inc(type=webhook_type, status='success' if success else 'failure')
 
 def send_gotify_notification(event, result, webhook_url):
     """发送Gotify格式的通知"""
@@ -51,7 +77,7 @@ def send_gotify_notification(event, result, webhook_url):
         }
         
         # 发送POST请求到Gotify
-        response = requests.post(
+        response = get_session().post(
             webhook_url, 
             json=data,
             headers={"Content-Type": "application/json"},
@@ -92,7 +118,7 @@ def send_generic_notification(event, result, webhook_url):
         }
         
         # 发送POST请求
-        response = requests.post(
+        response = get_session().post(
             webhook_url, 
             json=data,
             headers={"Content-Type": "application/json"},
@@ -232,7 +258,7 @@ def send_slack_notification(event, result, slack_webhook_url):
                 }
             })
         
-        response = requests.post(
+        response = get_session().post(
             slack_webhook_url,
             json=slack_data,
             headers={"Content-Type": "application/json"},
@@ -308,11 +334,11 @@ def send_custom_notification(event, result, webhook_url, config):
         
         # 发送请求
         if method == 'GET':
-            response = requests.get(custom_url, params=payload, headers=headers, timeout=timeout)
+            response = get_session().get(custom_url, params=payload, headers=headers, timeout=timeout)
         elif method == 'POST':
-            response = requests.post(custom_url, json=payload, headers=headers, timeout=timeout)
+            response = get_session().post(custom_url, json=payload, headers=headers, timeout=timeout)
         elif method == 'PUT':
-            response = requests.put(custom_url, json=payload, headers=headers, timeout=timeout)
+            response = get_session().put(custom_url, json=payload, headers=headers, timeout=timeout)
         else:
             print(f"❌ 不支持的 HTTP 方法: {method}")
             return False